@@ -11,10 +11,12 @@ from typing import Optional
 from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat
 from millegrilles_messages.backup.Configuration import ConfigurationBackup
 from millegrilles_messages.chiffrage.Mgs4 import CipherMgs4
+from millegrilles_messages.chiffrage.Mgs4p import CipherMgs4p, FORMAT_MGS4P
+from millegrilles_messages.chiffrage.PipelineChiffrage import PipelineChiffrage
 from millegrilles_messages.messages.FormatteurMessages import SignateurTransactionSimple, FormatteurMessageMilleGrilles
 from millegrilles_messages.messages.CleCertificat import CleCertificat
 
-TAILLE_BUFFER = 32 * 1024
+CHUNKS_PAR_BLOC = 64  # Chunks par bloc (mgs4p : chiffres en parallele)
 REP_ARCHIVES = '_ARCHIVES'
 
 
@@ -85,13 +87,13 @@ class GenerateurBackup:
         makedirs(path_archives, mode=0o755, exist_ok=True)
 
         path_tar_file = path.join(path_archives, '%s.%s.tar' % (repertoire, date_courante))
-        nom_archive_chiffree = '%s.mgs4' % nom_archive
+        nom_archive_chiffree = '%s.%s' % (nom_archive, self.__config.format_archive)
         path_catalogue = path.join(self.__source, 'catalogue.json')
         fichier_dest = path.join(self.__source, nom_archive_chiffree)
 
         try:
             # Chiffrer le .tar.xz
-            fichier_dest, info_chiffrage = await asyncio.to_thread(self.chiffrer_archive, nom_archive, fichier_dest)
+            fichier_dest, info_chiffrage = await self.chiffrer_archive(nom_archive, fichier_dest)
 
             # Ajouter info module
             info_chiffrage['module'] = repertoire
@@ -114,20 +116,17 @@ class GenerateurBackup:
             tar_out.add(path_catalogue, arcname='catalogue.json')
             tar_out.add(fichier_dest, arcname=nom_archive_chiffree)
 
-    def chiffrer_archive(self, nom_archive: str, fichier_dest: str):
+    async def chiffrer_archive(self, nom_archive: str, fichier_dest: str):
         public_x25519 = self.__enveloppe_ca.get_public_x25519()
-        cipher = CipherMgs4(public_x25519)
+        if self.__config.format_archive == FORMAT_MGS4P:
+            cipher = CipherMgs4p(public_x25519)
+        else:
+            cipher = CipherMgs4(public_x25519)
         fichier_src = path.join(self.__source, nom_archive)
 
         with open(fichier_dest, 'wb') as fp_dest:
             with open(fichier_src, 'rb') as fp_src:
-                bytes_buffer = fp_src.read(TAILLE_BUFFER)
-                while len(bytes_buffer) > 0:
-                    output_buffer = cipher.update(bytes_buffer)
-                    fp_dest.write(output_buffer)
-                    bytes_buffer = fp_src.read(TAILLE_BUFFER)
-
-        cipher.finalize()
+                await PipelineChiffrage(cipher, chunks_par_bloc=CHUNKS_PAR_BLOC).run(fp_src, fp_dest)
 
         # Retirer fichier src (dechiffre)
         unlink(fichier_src)
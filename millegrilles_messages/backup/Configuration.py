@@ -4,12 +4,16 @@ from typing import Optional
 
 from millegrilles_messages.messages import Constantes as ConstantesMessages
 
+FORMATS_ARCHIVE = ['mgs4', 'mgs4p']  # mgs4p : lisible uniquement par les outils de restauration recents
+
 CONST_BACKUP_PARAMS = [
     ConstantesMessages.ENV_CA_PEM,
     ConstantesMessages.ENV_CERT_PEM,
     ConstantesMessages.ENV_KEY_PEM,
     ConstantesMessages.ENV_MQ_HOSTNAME,
     ConstantesMessages.ENV_MQ_PORT,
+    ConstantesMessages.ENV_CERTIFICATS_CACHE_PATH,
+    ConstantesMessages.ENV_BACKUP_FORMAT,
 ]
 
 
@@ -21,6 +25,8 @@ class ConfigurationBackup:
         self.key_pem_path: Optional[str] = None
         self.mq_host = 'localhost'
         self.mq_port = 5673
+        self.certificats_cache_path: Optional[str] = None
+        self.format_archive = 'mgs4'
 
     def get_env(self) -> dict:
         """
@@ -50,3 +56,8 @@ class ConfigurationBackup:
         self.key_pem_path = dict_params.get(ConstantesMessages.ENV_KEY_PEM) or self.key_pem_path
         self.mq_host = dict_params.get(ConstantesMessages.ENV_MQ_HOSTNAME) or self.mq_host
         self.mq_port = dict_params.get(ConstantesMessages.ENV_MQ_PORT) or self.mq_port
+        self.certificats_cache_path = dict_params.get(
+            ConstantesMessages.ENV_CERTIFICATS_CACHE_PATH) or self.certificats_cache_path
+        self.format_archive = dict_params.get(ConstantesMessages.ENV_BACKUP_FORMAT) or self.format_archive
+        if self.format_archive not in FORMATS_ARCHIVE:
+            raise ValueError('Format d\'archive non supporte : %s' % self.format_archive)
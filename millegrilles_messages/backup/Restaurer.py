@@ -19,14 +19,17 @@ from millegrilles_messages.messages.ValidateurMessage import ValidateurMessage,
 from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat
 from millegrilles_messages.messages.CleCertificat import CleCertificat
 from millegrilles_messages.messages.FormatteurMessages import SignateurTransactionSimple, FormatteurMessageMilleGrilles
+from millegrilles_messages.messages.StockageCertificats import StockageCertificats
 from millegrilles_messages.chiffrage.Mgs4 import DecipherMgs4
+from millegrilles_messages.chiffrage.Mgs4p import DecipherMgs4p, FORMAT_MGS4P
+from millegrilles_messages.chiffrage.PipelineChiffrage import PipelineChiffrage
 
 from millegrilles_messages.messages.MessagesThread import MessagesThread
 from millegrilles_messages.messages.MessagesModule import RessourcesConsommation
 
 
 PATH_RESTAURATION = '_RESTAURATION'
-TAILLE_BUFFER = 32 * 1204
+NB_FICHIERS_BACKUP_CONCURRENTS = 4  # Requetes getBackupTransaction en parallele
 
 
 class RestaurateurArchives:
@@ -63,7 +66,10 @@ class RestaurateurArchives:
 
         signateur = SignateurTransactionSimple(clecert)
         self.__formatteur = FormatteurMessageMilleGrilles(self.__enveloppe_ca.idmg, signateur)
-        self.__validateur_certificats = ValidateurCertificatCache(self.__enveloppe_ca)
+        stockage_certificats = None
+        if self.__config.certificats_cache_path is not None:
+            stockage_certificats = StockageCertificats(self.__config.certificats_cache_path)
+        self.__validateur_certificats = ValidateurCertificatCache(self.__enveloppe_ca, stockage=stockage_certificats)
         self.__validateur_messages = ValidateurMessage(self.__validateur_certificats)
 
     async def preparer_mq(self, rechiffrer: bool):
@@ -107,18 +113,15 @@ class RestaurateurArchives:
         enveloppe = await self.__validateur_messages.verifier(catalogue, utiliser_date_message=True)
 
         cle_dechiffree = self.__clecert_ca.dechiffrage_asymmetrique(catalogue['cle'])
-        decipher = DecipherMgs4(cle_dechiffree, catalogue['header'])
+        if catalogue.get('format') == FORMAT_MGS4P:
+            decipher = DecipherMgs4p(cle_dechiffree, catalogue['header'])
+        else:
+            decipher = DecipherMgs4(cle_dechiffree, catalogue['header'])
 
         path_archive_dechiffree = '.'.join(path_archive.split('.')[:-1])
         with open(path_archive_dechiffree, 'wb') as fichier_output:
             with open(path_archive, 'rb') as fichier:
-                buffer_bytes = fichier.read(TAILLE_BUFFER)
-                while len(buffer_bytes) > 0:
-                    data = decipher.update(buffer_bytes)
-                    fichier_output.write(data)
-                    buffer_bytes = fichier.read(TAILLE_BUFFER)
-
-        decipher.finalize()
+                await PipelineChiffrage(decipher).run(fichier, fichier_output)
         print("Dechiffrage OK")
 
         unlink(path_archive)
@@ -185,6 +188,8 @@ class RestaurateurTransactions:
             'KEY_PEM': self.__config.key_pem_path,
             'CA_PEM': self.__config.ca_pem_path,
         }
+        if self.__config.certificats_cache_path is not None:
+            config[Constantes.ENV_CERTIFICATS_CACHE_PATH] = self.__config.certificats_cache_path
         messages_thread.set_env_configuration(config)
 
         self.__messages_thread = messages_thread
@@ -266,10 +271,9 @@ class RestaurateurTransactions:
     async def traiter_transactions(self):
         producer = self.__messages_thread.get_producer()
 
-        domaines = dict()
+        noms_fichiers = list()
         with open(self.__path_fichier_archives, 'r') as fichier:
             for ligne_fichier in fichier:
-                self.__logger.debug("Traiter %s" % ligne_fichier)
                 nom_fichier = ligne_fichier.strip()
 
                 if self.__domaine is not None:
@@ -277,10 +281,24 @@ class RestaurateurTransactions:
                     if self.__domaine != domaine_fichier:
                         continue  # Skip, mauvais domaine
 
-                # Bounce la requete de fichier de backup
-                requete = {'fichierBackup': nom_fichier}
-                resultat = await producer.executer_requete(requete, domaine='fichiers',
-                                                           action='getBackupTransaction', exchange='2.prive')
+                noms_fichiers.append(nom_fichier)
+
+        domaines = dict()
+        for idx_lot in range(0, len(noms_fichiers), NB_FICHIERS_BACKUP_CONCURRENTS):
+            # Bounce les requetes de fichiers de backup, traitement dans l'ordre des fichiers
+            lot = noms_fichiers[idx_lot:idx_lot+NB_FICHIERS_BACKUP_CONCURRENTS]
+            requetes = [
+                {'requete': {'fichierBackup': nom_fichier}, 'domaine': 'fichiers',
+                 'action': 'getBackupTransaction', 'exchange': '2.prive'}
+                for nom_fichier in lot
+            ]
+            resultats = await producer.executer_requetes_concurrentes(requetes, max_inflight=len(requetes))
+
+            for nom_fichier, resultat in zip(lot, resultats):
+                self.__logger.debug("Traiter %s" % nom_fichier)
+                if isinstance(resultat, Exception):
+                    raise resultat
+
                 transaction_backup = resultat.parsed['backup']
                 try:
                     domaine = transaction_backup['domaine']
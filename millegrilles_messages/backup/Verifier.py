@@ -4,7 +4,7 @@ from os import listdir, path, rename
 
 from millegrilles_messages.messages.Hachage import VerificateurHachage, ErreurHachage
 
-TAILLE_BUFFER = 32 * 1024
+TAILLE_BUFFER = 1024 * 1024
 
 
 class VerifierRepertoire:
@@ -40,11 +40,13 @@ class VerifierRepertoire:
         hachage = nom_fichier.split('.')[0]
         verificateur = VerificateurHachage(hachage)
 
+        buffer = bytearray(TAILLE_BUFFER)
+        vue_buffer = memoryview(buffer)
         with open(path_fichier, 'rb') as fichier:
-            buffer = fichier.read(TAILLE_BUFFER)
-            while len(buffer) > 0:
-                verificateur.update(buffer)
-                buffer = fichier.read(TAILLE_BUFFER)
+            taille_lue = fichier.readinto(buffer)
+            while taille_lue > 0:
+                verificateur.update(vue_buffer[:taille_lue])
+                taille_lue = fichier.readinto(buffer)
 
         try:
             verificateur.verify()
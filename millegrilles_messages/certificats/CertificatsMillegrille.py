@@ -33,6 +33,5 @@ def generer_csr_leaf(idmg: str, cn: str):
 
 def signer_csr_leaf(csr_pem: str, intermediaire: CleCertificat, role: str):
     enveloppe_csr = EnveloppeCsr.from_str(csr_pem)
-    idmg = intermediaire.enveloppe.idmg
-    enveloppe_certificat = enveloppe_csr.signer(intermediaire, idmg, role)
+    enveloppe_certificat = enveloppe_csr.signer(intermediaire, role)
     return enveloppe_certificat
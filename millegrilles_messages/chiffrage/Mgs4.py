@@ -1,7 +1,8 @@
 import multibase
 
-from typing import Optional
+from typing import Optional, Union
 
+from nacl.exceptions import CryptoError
 from nacl.bindings.crypto_secretstream import (
     crypto_secretstream_xchacha20poly1305_ABYTES,
     crypto_secretstream_xchacha20poly1305_TAG_FINAL,
@@ -19,15 +20,48 @@ from cryptography.hazmat.primitives import serialization
 from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat
 from millegrilles_messages.messages.Hachage import hacher_to_digest
 from millegrilles_messages.chiffrage.ChiffrageUtils import generer_info_chiffrage
-from millegrilles_messages.messages.Hachage import Hacheur
+from millegrilles_messages.messages.Hachage import Hacheur, HacheurMultiple
 
 CONST_TAILLE_BUFFER = 64 * 1024
 CONST_TAILLE_DATA = CONST_TAILLE_BUFFER - crypto_secretstream_xchacha20poly1305_ABYTES
 
 
+def _push_into(state: crypto_secretstream_xchacha20poly1305_state, message: memoryview, sortie: memoryview,
+               tag: int = crypto_secretstream_xchacha20poly1305_TAG_MESSAGE):
+    """
+    Chiffre message dans sortie (len(message) + ABYTES), buffer de sortie preallouable par l'appelant.
+    """
+    sortie[:] = crypto_secretstream_xchacha20poly1305_push(state, bytes(message), tag=tag)
+
+
+def _pull_into(state: crypto_secretstream_xchacha20poly1305_state, chunk: memoryview, sortie: memoryview) -> int:
+    """
+    Dechiffre chunk dans sortie (len(chunk) - ABYTES), buffer de sortie preallouable par l'appelant.
+    :return: Tag du chunk
+    """
+    try:
+        data, tag = crypto_secretstream_xchacha20poly1305_pull(state, bytes(chunk))
+    except CryptoError:
+        raise Exception("Erreur dechiffrage fichier (chunk invalide)")
+    sortie[:] = data
+    return tag
+
+
+def _vue_bytes(data) -> memoryview:
+    vue = memoryview(data)
+    if vue.format != 'B' or vue.ndim != 1:
+        vue = vue.cast('B')
+    return vue
+
+
 class CipherMgs4:
 
-    def __init__(self, public_key: X25519PublicKey):
+    def __init__(self, public_key: X25519PublicKey, hacheur: Optional[Union[Hacheur, HacheurMultiple]] = None):
+        """
+        :param public_key: Cle publique X25519 du destinataire
+        :param hacheur: Hacheur du contenu chiffre (hachage_bytes), blake2b-512 par defaut. Un HacheurMultiple
+                        calcule d'autres hachages dans la meme passe.
+        """
         self.__cle_secrete: Optional[bytes] = None
         self.__tag: Optional[bytes] = None
         self.__public_peer_x25519: Optional[X25519PublicKey] = None
@@ -35,9 +69,13 @@ class CipherMgs4:
 
         self.__cle_secrete, self.__state, self.__header = self.__generer_cipher(public_key)
 
-        self.__hacheur = Hacheur('blake2b-512', 'base58btc')
+        if hacheur is None:
+            hacheur = Hacheur('blake2b-512', 'base58btc')
+        self.__hacheur = hacheur
 
-        self.__buffer = bytes()
+        # Chunk partiel en attente de chiffrage, self.__position octets utilises
+        self.__buffer = bytearray(CONST_TAILLE_DATA)
+        self.__position = 0
 
     def __generer_cipher(self, public_key: X25519PublicKey):
         """
@@ -64,31 +102,77 @@ class CipherMgs4:
     def header(self) -> bytes:
         return self.__header
 
-    def update(self, data: bytes) -> Optional[bytes]:
-        data_out = bytes()
-
-        while len(data) > 0:
-            taille_max = CONST_TAILLE_DATA - len(self.__buffer)
-            taille_chunk = min(taille_max, len(data))
-
-            self.__buffer = self.__buffer + data[:taille_chunk]
-            data = data[taille_chunk:]
+    @property
+    def taille_chunk(self) -> int:
+        """
+        :return: Taille des chunks en entree. Des blocs alignes sur cette taille ne laissent rien dans le buffer.
+        """
+        return CONST_TAILLE_DATA
 
-            if len(self.__buffer) == CONST_TAILLE_DATA:
-                data_chiffre = crypto_secretstream_xchacha20poly1305_push(self.__state, self.__buffer)
-                self.__hacheur.update(data_chiffre)
-                data_out = data_out + data_chiffre
+    def get_taille_sortie(self, taille_data: int) -> int:
+        """
+        :return: Nombre d'octets chiffres produits par update() pour taille_data octets.
+        """
+        return (self.__position + taille_data) // CONST_TAILLE_DATA * CONST_TAILLE_BUFFER
 
-                self.__buffer = bytes()  # Clear buffer
+    def update(self, data: Union[bytes, bytearray, memoryview]) -> Optional[bytes]:
+        data_out = bytearray(self.get_taille_sortie(len(data)))
+        self.update_into(data, data_out)
+        return bytes(data_out)
 
-        return data_out
+    def update_into(self, data: Union[bytes, bytearray, memoryview], out_buffer: Union[bytearray, memoryview]) -> int:
+        """
+        Chiffre data directement dans out_buffer.
+        :param data: Donnees a chiffrer
+        :param out_buffer: Buffer de sortie, au moins get_taille_sortie(len(data)) octets
+        :return: Nombre d'octets ecrits dans out_buffer
+        """
+        data = _vue_bytes(data)
+        sortie = _vue_bytes(out_buffer)
+        taille_sortie = self.get_taille_sortie(len(data))
+        if len(sortie) < taille_sortie:
+            raise ValueError('out_buffer trop petit (%d < %d)' % (len(sortie), taille_sortie))
+
+        position_data = 0
+        position_sortie = 0
+
+        # Completer le chunk partiel
+        if self.__position > 0:
+            taille_chunk = min(CONST_TAILLE_DATA - self.__position, len(data))
+            self.__buffer[self.__position:self.__position + taille_chunk] = data[:taille_chunk]
+            self.__position += taille_chunk
+            position_data = taille_chunk
+            if self.__position == CONST_TAILLE_DATA:
+                position_sortie = self.__push(memoryview(self.__buffer), sortie, position_sortie)
+                self.__position = 0
+
+        # Chunks complets chiffres directement a partir de data
+        while len(data) - position_data >= CONST_TAILLE_DATA:
+            position_sortie = self.__push(data[position_data:position_data + CONST_TAILLE_DATA], sortie, position_sortie)
+            position_data += CONST_TAILLE_DATA
+
+        # Conserver le reste pour le prochain update
+        reste = len(data) - position_data
+        if reste > 0:
+            self.__buffer[self.__position:self.__position + reste] = data[position_data:]
+            self.__position += reste
+
+        return position_sortie
+
+    def __push(self, chunk: memoryview, sortie: memoryview, position_sortie: int) -> int:
+        fin = position_sortie + CONST_TAILLE_BUFFER
+        sortie_chunk = sortie[position_sortie:fin]
+        _push_into(self.__state, chunk, sortie_chunk)
+        self.__hacheur.update(sortie_chunk)
+        return fin
 
     def finalize(self) -> bytes:
         if self.__hachage is not None:
             raise Exception('Already finalized')
 
         data_out = crypto_secretstream_xchacha20poly1305_push(
-            self.__state, self.__buffer, tag=crypto_secretstream_xchacha20poly1305_TAG_FINAL)
+            self.__state, bytes(self.__buffer[:self.__position]), tag=crypto_secretstream_xchacha20poly1305_TAG_FINAL)
+        self.__position = 0
 
         self.__hachage = self.__hacheur.finalize()
 
@@ -116,7 +200,9 @@ class DecipherMgs4:
         self.__state = crypto_secretstream_xchacha20poly1305_state()
         crypto_secretstream_xchacha20poly1305_init_pull(self.__state, header, cle_secrete)
 
-        self.__buffer = bytes()
+        # Chunk chiffre partiel, self.__position octets utilises
+        self.__buffer = bytearray(CONST_TAILLE_BUFFER)
+        self.__position = 0
 
     @staticmethod
     def from_info(clecert, info_dechiffrage: dict):
@@ -128,28 +214,74 @@ class DecipherMgs4:
 
         return DecipherMgs4(cle_secrete, header)
 
-    def update(self, data: bytes) -> bytes:
-        data_out = bytes()
-
-        while len(data) > 0:
-            taille_max = CONST_TAILLE_BUFFER - len(self.__buffer)
-            taille_chunk = min(taille_max, len(data))
+    @property
+    def taille_chunk(self) -> int:
+        """
+        :return: Taille des chunks en entree. Des blocs alignes sur cette taille ne laissent rien dans le buffer.
+        """
+        return CONST_TAILLE_BUFFER
 
-            self.__buffer = self.__buffer + data[:taille_chunk]
-            data = data[taille_chunk:]
+    def get_taille_sortie(self, taille_data: int) -> int:
+        """
+        :return: Nombre d'octets dechiffres produits par update() pour taille_data octets.
+        """
+        return (self.__position + taille_data) // CONST_TAILLE_BUFFER * CONST_TAILLE_DATA
 
-            if len(self.__buffer) == CONST_TAILLE_BUFFER:
-                data_dechiffre, tag = crypto_secretstream_xchacha20poly1305_pull(self.__state, self.__buffer)
-                if tag != crypto_secretstream_xchacha20poly1305_TAG_MESSAGE:
-                    raise Exception("Erreur dechiffrage fichier (tag != TAG_MESSAGE)")
-                data_out = data_out + data_dechiffre
-                self.__buffer = bytes()  # Clear buffer
+    def update(self, data: Union[bytes, bytearray, memoryview]) -> bytes:
+        data_out = bytearray(self.get_taille_sortie(len(data)))
+        self.update_into(data, data_out)
+        return bytes(data_out)
 
-        return data_out
+    def update_into(self, data: Union[bytes, bytearray, memoryview], out_buffer: Union[bytearray, memoryview]) -> int:
+        """
+        Dechiffre data directement dans out_buffer.
+        :param data: Donnees chiffrees
+        :param out_buffer: Buffer de sortie, au moins get_taille_sortie(len(data)) octets
+        :return: Nombre d'octets ecrits dans out_buffer
+        """
+        data = _vue_bytes(data)
+        sortie = _vue_bytes(out_buffer)
+        taille_sortie = self.get_taille_sortie(len(data))
+        if len(sortie) < taille_sortie:
+            raise ValueError('out_buffer trop petit (%d < %d)' % (len(sortie), taille_sortie))
+
+        position_data = 0
+        position_sortie = 0
+
+        # Completer le chunk partiel
+        if self.__position > 0:
+            taille_chunk = min(CONST_TAILLE_BUFFER - self.__position, len(data))
+            self.__buffer[self.__position:self.__position + taille_chunk] = data[:taille_chunk]
+            self.__position += taille_chunk
+            position_data = taille_chunk
+            if self.__position == CONST_TAILLE_BUFFER:
+                position_sortie = self.__pull(memoryview(self.__buffer), sortie, position_sortie)
+                self.__position = 0
+
+        # Chunks complets dechiffres directement a partir de data
+        while len(data) - position_data >= CONST_TAILLE_BUFFER:
+            position_sortie = self.__pull(data[position_data:position_data + CONST_TAILLE_BUFFER], sortie, position_sortie)
+            position_data += CONST_TAILLE_BUFFER
+
+        # Conserver le reste pour le prochain update
+        reste = len(data) - position_data
+        if reste > 0:
+            self.__buffer[self.__position:self.__position + reste] = data[position_data:]
+            self.__position += reste
+
+        return position_sortie
+
+    def __pull(self, chunk: memoryview, sortie: memoryview, position_sortie: int) -> int:
+        fin = position_sortie + CONST_TAILLE_DATA
+        tag = _pull_into(self.__state, chunk, sortie[position_sortie:fin])
+        if tag != crypto_secretstream_xchacha20poly1305_TAG_MESSAGE:
+            raise Exception("Erreur dechiffrage fichier (tag != TAG_MESSAGE)")
+        return fin
 
     def finalize(self) -> bytes:
-        data_out, tag = crypto_secretstream_xchacha20poly1305_pull(self.__state, self.__buffer)
+        data_out, tag = crypto_secretstream_xchacha20poly1305_pull(self.__state, bytes(self.__buffer[:self.__position]))
         if tag != crypto_secretstream_xchacha20poly1305_TAG_FINAL:
             raise Exception("Erreur dechiffrage final (mauvais tag)")
+        self.__position = 0
 
         return data_out
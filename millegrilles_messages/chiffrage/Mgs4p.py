@@ -0,0 +1,404 @@
+"""
+Format mgs4p : XChaCha20-Poly1305 par chunks independants, chiffrage et dechiffrage en parallele.
+
+Chaque chunk chiffre fait CONST_TAILLE_BUFFER octets, sauf le dernier qui est plus court (possiblement vide).
+Le nonce du chunk est header (16 octets aleatoires) + index du chunk (8 octets big endian). Les donnees
+authentifiees (AD) contiennent un indicateur final et l'index du chunk, le dernier chunk est marque final avec le
+nombre total de chunks. L'alteration, le reordonnancement et la troncature des chunks sont detectes.
+"""
+import io
+import multibase
+import os
+import secrets
+import struct
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional, Union
+
+from nacl.bindings import crypto_aead_xchacha20poly1305_ietf_ABYTES, crypto_aead_xchacha20poly1305_ietf_decrypt, \
+    crypto_aead_xchacha20poly1305_ietf_encrypt
+from nacl.exceptions import CryptoError
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives import serialization
+
+from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat
+from millegrilles_messages.messages.Hachage import hacher_to_digest
+from millegrilles_messages.chiffrage.ChiffrageUtils import generer_info_chiffrage
+from millegrilles_messages.messages.Hachage import Hacheur, HacheurMultiple
+
+FORMAT_MGS4P = 'mgs4p'
+
+CONST_TAILLE_HEADER = 16
+CONST_TAILLE_BUFFER = 64 * 1024
+CONST_TAILLE_DATA = CONST_TAILLE_BUFFER - crypto_aead_xchacha20poly1305_ietf_ABYTES
+
+CHUNKS_PAR_TACHE_MIN = 4    # Nombre minimal de chunks par tache soumise au pool de threads
+
+_executeur: Optional[ThreadPoolExecutor] = None
+
+
+def get_executeur() -> ThreadPoolExecutor:
+    """
+    :return: Pool de threads partage. libsodium relache le GIL, les chunks sont traites sur plusieurs coeurs.
+    """
+    global _executeur
+    if _executeur is None:
+        _executeur = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='mgs4p')
+    return _executeur
+
+
+def _nonce(header: bytes, index: int) -> bytes:
+    return header + index.to_bytes(8, 'big')
+
+
+def _ad(index: int, final: bool) -> bytes:
+    if final is True:
+        return struct.pack('>BQ', 1, index + 1)  # Nombre de chunks
+    return struct.pack('>BQ', 0, index)
+
+
+def chiffrer_chunk(cle_secrete: bytes, header: bytes, index: int, data: memoryview, sortie: memoryview,
+                   final=False):
+    """
+    Chiffre un chunk dans sortie (len(data) + ABYTES octets).
+    """
+    sortie[:] = crypto_aead_xchacha20poly1305_ietf_encrypt(
+        bytes(data), _ad(index, final), _nonce(header, index), cle_secrete)
+
+
+def dechiffrer_chunk(cle_secrete: bytes, header: bytes, index: int, chunk: memoryview, sortie: memoryview,
+                     final=False):
+    """
+    Dechiffre un chunk dans sortie (len(chunk) - ABYTES octets).
+    """
+    if len(chunk) < crypto_aead_xchacha20poly1305_ietf_ABYTES:
+        raise Exception("Erreur dechiffrage fichier (chunk %d tronque)" % index)
+    try:
+        sortie[:] = crypto_aead_xchacha20poly1305_ietf_decrypt(
+            bytes(chunk), _ad(index, final), _nonce(header, index), cle_secrete)
+    except CryptoError:
+        raise Exception("Erreur dechiffrage fichier (chunk %d invalide)" % index)
+
+
+def traiter_chunks(fonction, cle_secrete: bytes, header: bytes, index_debut: int, data: memoryview,
+                   sortie: memoryview, nombre_chunks: int, taille_entree: int, taille_sortie: int,
+                   nombre_threads: int):
+    """
+    Chiffre ou dechiffre nombre_chunks chunks complets consecutifs de data vers sortie. Les chunks sont repartis
+    en sequences contigues sur le pool de threads lorsqu'il y en a assez.
+    """
+    nombre_taches = min(nombre_threads, nombre_chunks // CHUNKS_PAR_TACHE_MIN)
+    if nombre_taches <= 1:
+        _traiter_sequence(fonction, cle_secrete, header, index_debut, data, sortie, 0, nombre_chunks,
+                          taille_entree, taille_sortie)
+        return
+
+    executeur = get_executeur()
+    taille_sequence = -(-nombre_chunks // nombre_taches)
+    futures = [
+        executeur.submit(_traiter_sequence, fonction, cle_secrete, header, index_debut, data, sortie, debut,
+                         min(debut + taille_sequence, nombre_chunks), taille_entree, taille_sortie)
+        for debut in range(0, nombre_chunks, taille_sequence)
+    ]
+    for future in futures:
+        future.result()
+
+
+def _traiter_sequence(fonction, cle_secrete: bytes, header: bytes, index_debut: int, data: memoryview,
+                      sortie: memoryview, debut: int, fin: int, taille_entree: int, taille_sortie: int):
+    for i in range(debut, fin):
+        fonction(cle_secrete, header, index_debut + i, data[i * taille_entree:(i + 1) * taille_entree],
+                 sortie[i * taille_sortie:(i + 1) * taille_sortie])
+
+
+def _decoder_header(header: Union[bytes, str]) -> bytes:
+    if isinstance(header, str):
+        header = multibase.decode(header)
+    elif not isinstance(header, bytes):
+        raise TypeError('type header non supporte (valides: str, bytes)')
+    if len(header) != CONST_TAILLE_HEADER:
+        raise ValueError('header mgs4p invalide')
+    return header
+
+
+def _vue_bytes(data) -> memoryview:
+    vue = memoryview(data)
+    if vue.format != 'B' or vue.ndim != 1:
+        vue = vue.cast('B')
+    return vue
+
+
+class TraitementChunksMgs4p:
+    """
+    Bufferisation commune au chiffrage et dechiffrage. Les chunks complets sont traites directement a partir des
+    donnees recues.
+    """
+
+    def __init__(self, cle_secrete: bytes, header: bytes, taille_entree: int, taille_sortie: int,
+                 fonction, nombre_threads: Optional[int]):
+        self._cle_secrete = cle_secrete
+        self._header = header
+        self.__taille_entree = taille_entree
+        self.__taille_sortie = taille_sortie
+        self.__fonction = fonction
+        self.__nombre_threads = nombre_threads or os.cpu_count() or 1
+
+        # Index du prochain chunk
+        self._index = 0
+
+        # Chunk partiel, self._position octets utilises
+        self._buffer = bytearray(taille_entree)
+        self._position = 0
+
+    @property
+    def taille_chunk(self) -> int:
+        """
+        :return: Taille des chunks en entree. Des blocs alignes sur cette taille ne laissent rien dans le buffer.
+        """
+        return self.__taille_entree
+
+    def get_taille_sortie(self, taille_data: int) -> int:
+        """
+        :return: Nombre d'octets produits par update() pour taille_data octets.
+        """
+        return (self._position + taille_data) // self.__taille_entree * self.__taille_sortie
+
+    def update(self, data: Union[bytes, bytearray, memoryview]) -> bytes:
+        data_out = bytearray(self.get_taille_sortie(len(data)))
+        self.update_into(data, data_out)
+        return bytes(data_out)
+
+    def update_into(self, data: Union[bytes, bytearray, memoryview], out_buffer: Union[bytearray, memoryview]) -> int:
+        """
+        Traite data directement dans out_buffer.
+        :param data: Donnees a traiter
+        :param out_buffer: Buffer de sortie, au moins get_taille_sortie(len(data)) octets
+        :return: Nombre d'octets ecrits dans out_buffer
+        """
+        data = _vue_bytes(data)
+        sortie = _vue_bytes(out_buffer)
+        taille_sortie = self.get_taille_sortie(len(data))
+        if len(sortie) < taille_sortie:
+            raise ValueError('out_buffer trop petit (%d < %d)' % (len(sortie), taille_sortie))
+
+        position_data = 0
+        position_sortie = 0
+
+        # Completer le chunk partiel
+        if self._position > 0:
+            taille_chunk = min(self.__taille_entree - self._position, len(data))
+            self._buffer[self._position:self._position + taille_chunk] = data[:taille_chunk]
+            self._position += taille_chunk
+            position_data = taille_chunk
+            if self._position == self.__taille_entree:
+                self.__fonction(self._cle_secrete, self._header, self._index, memoryview(self._buffer),
+                                sortie[:self.__taille_sortie])
+                self._index += 1
+                self._position = 0
+                position_sortie = self.__taille_sortie
+
+        # Chunks complets traites directement a partir de data
+        nombre_chunks = (len(data) - position_data) // self.__taille_entree
+        if nombre_chunks > 0:
+            fin_data = position_data + nombre_chunks * self.__taille_entree
+            fin_sortie = position_sortie + nombre_chunks * self.__taille_sortie
+            self.__traiter_chunks(data[position_data:fin_data], sortie[position_sortie:fin_sortie], nombre_chunks)
+            position_data, position_sortie = fin_data, fin_sortie
+
+        # Conserver le reste pour le prochain update
+        reste = len(data) - position_data
+        if reste > 0:
+            self._buffer[self._position:self._position + reste] = data[position_data:]
+            self._position += reste
+
+        self._traiter_sortie(sortie[:position_sortie])
+
+        return position_sortie
+
+    def _traiter_sortie(self, sortie: memoryview):
+        pass
+
+    def __traiter_chunks(self, data: memoryview, sortie: memoryview, nombre_chunks: int):
+        index_debut = self._index
+        self._index += nombre_chunks
+        traiter_chunks(self.__fonction, self._cle_secrete, self._header, index_debut, data, sortie, nombre_chunks,
+                       self.__taille_entree, self.__taille_sortie, self.__nombre_threads)
+
+
+class CipherMgs4p(TraitementChunksMgs4p):
+
+    def __init__(self, public_key: X25519PublicKey, nombre_threads: Optional[int] = None,
+                 hacheur: Optional[Union[Hacheur, HacheurMultiple]] = None):
+        """
+        :param public_key: Cle publique X25519 du destinataire (e.g. MilleGrille)
+        :param nombre_threads: Nombre maximal de threads utilises par update, None pour le nombre de CPUs.
+        :param hacheur: Hacheur du contenu chiffre (hachage_bytes), blake2b-512 par defaut. Un HacheurMultiple
+                        calcule d'autres hachages dans la meme passe.
+        """
+        self.__public_peer_x25519: Optional[X25519PublicKey] = None
+        self.__hachage: Optional[str] = None
+
+        cle_secrete = self.__generer_cle(public_key)
+        header = secrets.token_bytes(CONST_TAILLE_HEADER)
+        super().__init__(cle_secrete, header, CONST_TAILLE_DATA, CONST_TAILLE_BUFFER, chiffrer_chunk, nombre_threads)
+
+        if hacheur is None:
+            hacheur = Hacheur('blake2b-512', 'base58btc')
+        self.__hacheur = hacheur
+
+    def __generer_cle(self, public_key: X25519PublicKey) -> bytes:
+        """
+        Generer la cle secrete a partir d'une cle publique
+        """
+        key_x25519 = X25519PrivateKey.generate()
+        self.__public_peer_x25519 = key_x25519.public_key()
+        cle_handshake = key_x25519.exchange(public_key)
+        return hacher_to_digest(cle_handshake, 'blake2s-256')
+
+    @property
+    def header(self) -> bytes:
+        return self._header
+
+    def _traiter_sortie(self, sortie: memoryview):
+        self.__hacheur.update(sortie)
+
+    def finalize(self) -> bytes:
+        if self.__hachage is not None:
+            raise Exception('Already finalized')
+
+        data_out = bytearray(self._position + crypto_aead_xchacha20poly1305_ietf_ABYTES)
+        chiffrer_chunk(self._cle_secrete, self._header, self._index, memoryview(self._buffer)[:self._position],
+                       memoryview(data_out), final=True)
+        self._position = 0
+
+        self.__hacheur.update(data_out)
+        self.__hachage = self.__hacheur.finalize()
+
+        return bytes(data_out)
+
+    def get_info_dechiffrage(self, enveloppes: Optional[list[EnveloppeCertificat]] = None) -> dict:
+        key_x25519_public_bytes = self.__public_peer_x25519.public_bytes(
+            serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        info = generer_info_chiffrage(self._cle_secrete, None, None, self._header, self.__hachage,
+                                      enveloppes, public_peer=key_x25519_public_bytes)
+        info['format'] = FORMAT_MGS4P
+        return info
+
+
+class DecipherMgs4p(TraitementChunksMgs4p):
+
+    def __init__(self, cle_secrete: bytes, header: Union[bytes, str], nombre_threads: Optional[int] = None):
+        """
+        :param cle_secrete: Cle secrete dechiffree
+        :param header: Header du fichier (bytes ou multibase)
+        :param nombre_threads: Nombre maximal de threads utilises par update, None pour le nombre de CPUs.
+        """
+        super().__init__(cle_secrete, _decoder_header(header), CONST_TAILLE_BUFFER, CONST_TAILLE_DATA, dechiffrer_chunk, nombre_threads)
+
+    @staticmethod
+    def from_info(clecert, info_dechiffrage: dict):
+        header = info_dechiffrage['header']
+
+        # Dechiffrer cle
+        cle_chiffree = info_dechiffrage['cles'][clecert.enveloppe.fingerprint]
+        cle_secrete = clecert.dechiffrage_asymmetrique(cle_chiffree)
+
+        return DecipherMgs4p(cle_secrete, header)
+
+    def finalize(self) -> bytes:
+        """
+        Dechiffre le dernier chunk, qui doit etre marque final. Detecte la troncature du fichier.
+        """
+        data_out = bytearray(max(0, self._position - crypto_aead_xchacha20poly1305_ietf_ABYTES))
+        dechiffrer_chunk(self._cle_secrete, self._header, self._index, memoryview(self._buffer)[:self._position],
+                         memoryview(data_out), final=True)
+        self._position = 0
+
+        return bytes(data_out)
+
+
+class LecteurMgs4p:
+    """
+    Lecture a acces aleatoire d'un fichier mgs4p. Seuls les chunks qui couvrent la plage demandee sont lus et
+    dechiffres. Le chunk final est verifie a l'ouverture, ce qui detecte un fichier tronque.
+    """
+
+    def __init__(self, fichier: BinaryIO, cle_secrete: bytes, header: Union[bytes, str],
+                 nombre_threads: Optional[int] = None):
+        """
+        :param fichier: Fichier chiffre, ouvert en mode binaire et seekable. Le lecteur ne le ferme pas.
+        :param cle_secrete: Cle secrete dechiffree
+        :param header: Header du fichier (bytes ou multibase)
+        :param nombre_threads: Nombre maximal de threads pour dechiffrer une plage, None pour le nombre de CPUs.
+        """
+        self.__fichier = fichier
+        self.__cle_secrete = cle_secrete
+        self.__header = _decoder_header(header)
+        self.__nombre_threads = nombre_threads or os.cpu_count() or 1
+        self.__verrou = threading.Lock()
+
+        taille_chiffree = fichier.seek(0, io.SEEK_END)
+        self.__index_final = taille_chiffree // CONST_TAILLE_BUFFER
+        taille_chunk_final = taille_chiffree % CONST_TAILLE_BUFFER
+        if taille_chunk_final < crypto_aead_xchacha20poly1305_ietf_ABYTES:
+            raise Exception("Erreur dechiffrage fichier (fichier tronque)")
+
+        chunk_final = self.__lire(self.__index_final * CONST_TAILLE_BUFFER, taille_chunk_final)
+        self.__data_final = bytearray(taille_chunk_final - crypto_aead_xchacha20poly1305_ietf_ABYTES)
+        dechiffrer_chunk(cle_secrete, self.__header, self.__index_final, memoryview(chunk_final),
+                         memoryview(self.__data_final), final=True)
+
+        self.__taille = self.__index_final * CONST_TAILLE_DATA + len(self.__data_final)
+
+    @staticmethod
+    def from_info(clecert, info_dechiffrage: dict, fichier: BinaryIO):
+        cle_chiffree = info_dechiffrage['cles'][clecert.enveloppe.fingerprint]
+        cle_secrete = clecert.dechiffrage_asymmetrique(cle_chiffree)
+        return LecteurMgs4p(fichier, cle_secrete, info_dechiffrage['header'])
+
+    @property
+    def taille(self) -> int:
+        """
+        :return: Taille du contenu dechiffre.
+        """
+        return self.__taille
+
+    def read(self, offset: int, length: int) -> bytes:
+        """
+        :param offset: Position dans le contenu dechiffre
+        :param length: Nombre d'octets a lire
+        :return: Contenu dechiffre, plus court que length si la fin du fichier est atteinte.
+        """
+        if offset < 0 or length < 0:
+            raise ValueError('offset et length doivent etre >= 0')
+
+        fin = min(offset + length, self.__taille)
+        if offset >= fin:
+            return bytes()
+
+        premier = offset // CONST_TAILLE_DATA
+        dernier = (fin - 1) // CONST_TAILLE_DATA
+        nombre_complets = min(dernier + 1, self.__index_final) - premier
+
+        sortie = bytearray(max(0, nombre_complets) * CONST_TAILLE_DATA)
+        if nombre_complets > 0:
+            chiffre = self.__lire(premier * CONST_TAILLE_BUFFER, nombre_complets * CONST_TAILLE_BUFFER)
+            traiter_chunks(dechiffrer_chunk, self.__cle_secrete, self.__header, premier, memoryview(chiffre),
+                           memoryview(sortie), nombre_complets, CONST_TAILLE_BUFFER, CONST_TAILLE_DATA,
+                           self.__nombre_threads)
+        if dernier == self.__index_final:
+            sortie += self.__data_final
+
+        debut = offset - premier * CONST_TAILLE_DATA
+        return bytes(memoryview(sortie)[debut:debut + fin - offset])
+
+    def __lire(self, position: int, taille: int) -> bytearray:
+        data = bytearray(taille)
+        with self.__verrou:
+            self.__fichier.seek(position)
+            taille_lue = self.__fichier.readinto(data)
+        if taille_lue != taille:
+            raise Exception("Erreur dechiffrage fichier (fichier tronque)")
+        return data
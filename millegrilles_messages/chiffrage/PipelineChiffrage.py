@@ -0,0 +1,193 @@
+"""
+Pipeline asyncio de chiffrage/dechiffrage en streaming : lecture, traitement et ecriture sont des etapes separees
+reliees par des queues bornees, la lecture et l'ecriture se font pendant le traitement du bloc precedent.
+"""
+import asyncio
+import logging
+
+from typing import Any, Optional
+
+CHUNKS_PAR_BLOC = 16        # Taille d'un bloc en chunks du format (64 KiB)
+PROFONDEUR_QUEUE = 4        # Blocs en attente entre deux etapes
+
+
+class SourceFichier:
+    """ Source a partir d'un fichier binaire (lectures dans un thread). """
+
+    def __init__(self, fichier):
+        self.__fichier = fichier
+
+    async def readinto(self, buffer: memoryview) -> int:
+        return await asyncio.to_thread(self.__fichier.readinto, buffer)
+
+
+class SourceStreamReader:
+    """ Source a partir d'un asyncio.StreamReader (socket, pipe de subprocess). """
+
+    def __init__(self, reader: asyncio.StreamReader):
+        self.__reader = reader
+
+    async def readinto(self, buffer: memoryview) -> int:
+        data = await self.__reader.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class DestinationFichier:
+    """ Destination vers un fichier binaire (ecritures dans un thread). """
+
+    def __init__(self, fichier):
+        self.__fichier = fichier
+
+    async def write(self, data: memoryview):
+        await asyncio.to_thread(self.__fichier.write, data)
+
+
+class DestinationStreamWriter:
+    """ Destination vers un asyncio.StreamWriter, avec controle de flux (drain). """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.__writer = writer
+
+    async def write(self, data: memoryview):
+        # Le transport peut conserver une reference, copier avant de recycler le buffer
+        self.__writer.write(bytes(data))
+        await self.__writer.drain()
+
+
+def adapter_source(source: Any):
+    """
+    :param source: asyncio.StreamReader, fichier binaire ou objet avec une methode async readinto(buffer) -> int.
+    """
+    if isinstance(source, asyncio.StreamReader):
+        return SourceStreamReader(source)
+    if asyncio.iscoroutinefunction(getattr(source, 'readinto', None)):
+        return source
+    if hasattr(source, 'readinto'):
+        return SourceFichier(source)
+    raise TypeError('Source non supportee : %s' % type(source))
+
+
+def adapter_destination(destination: Any):
+    """
+    :param destination: asyncio.StreamWriter, fichier binaire ou objet avec une methode async write(data).
+    """
+    if isinstance(destination, asyncio.StreamWriter):
+        return DestinationStreamWriter(destination)
+    if asyncio.iscoroutinefunction(getattr(destination, 'write', None)):
+        return destination
+    if hasattr(destination, 'write'):
+        return DestinationFichier(destination)
+    raise TypeError('Destination non supportee : %s' % type(destination))
+
+
+class PipelineChiffrage:
+    """
+    Fait passer une source au complet dans un cipher ou decipher (CipherMgs4, DecipherMgs4, CipherMgs4p,
+    DecipherMgs4p) vers une destination.
+
+    Les blocs sont alignes sur la taille des chunks du format et les buffers sont recycles entre les etapes. Le
+    traitement (update_into, finalize) est fait dans un thread, libsodium relache le GIL.
+    """
+
+    def __init__(self, traitement, chunks_par_bloc: int = CHUNKS_PAR_BLOC, profondeur: int = PROFONDEUR_QUEUE):
+        """
+        :param traitement: Cipher ou decipher, n'ayant pas encore recu de donnees.
+        :param chunks_par_bloc: Nombre de chunks par bloc lu.
+        :param profondeur: Nombre de blocs en attente entre deux etapes.
+        """
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.__traitement = traitement
+        self.__taille_bloc = traitement.taille_chunk * chunks_par_bloc
+        self.__taille_sortie = traitement.get_taille_sortie(self.__taille_bloc)
+        self.__profondeur = profondeur
+
+    async def run(self, source: Any, destination: Any) -> int:
+        """
+        Traite la source jusqu'a la fin, incluant finalize. La destination n'est pas fermee.
+        :param source: Voir adapter_source
+        :param destination: Voir adapter_destination
+        :return: Nombre d'octets ecrits
+        """
+        source = adapter_source(source)
+        destination = adapter_destination(destination)
+
+        # Buffers recycles : un par position des queues, plus celui en cours dans chaque etape
+        nombre_buffers = self.__profondeur + 2
+        libres_entree = asyncio.Queue()
+        libres_sortie = asyncio.Queue()
+        for _ in range(0, nombre_buffers):
+            libres_entree.put_nowait(bytearray(self.__taille_bloc))
+            libres_sortie.put_nowait(bytearray(self.__taille_sortie))
+
+        queue_lus = asyncio.Queue(maxsize=self.__profondeur)
+        queue_traites = asyncio.Queue(maxsize=self.__profondeur)
+
+        taches = [
+            asyncio.create_task(self.__lire(source, libres_entree, queue_lus)),
+            asyncio.create_task(self.__traiter(queue_lus, libres_entree, libres_sortie, queue_traites)),
+            asyncio.create_task(self.__ecrire(destination, queue_traites, libres_sortie)),
+        ]
+        try:
+            resultats = await asyncio.gather(*taches)
+        except BaseException:
+            for tache in taches:
+                tache.cancel()
+            await asyncio.gather(*taches, return_exceptions=True)
+            raise
+
+        self.__logger.debug("Pipeline complete, %d octets ecrits" % resultats[2])
+
+        return resultats[2]
+
+    async def __lire(self, source, libres: asyncio.Queue, queue_lus: asyncio.Queue):
+        while True:
+            buffer = await libres.get()
+            taille = await self.__remplir(source, memoryview(buffer))
+            await queue_lus.put((buffer, taille))
+            if taille < len(buffer):
+                return  # Fin de la source
+
+    @staticmethod
+    async def __remplir(source, buffer: memoryview) -> int:
+        """ Remplit le bloc au complet (alignement sur les chunks), sauf a la fin de la source. """
+        taille = 0
+        while taille < len(buffer):
+            taille_lue = await source.readinto(buffer[taille:])
+            if not taille_lue:
+                break
+            taille += taille_lue
+        return taille
+
+    async def __traiter(self, queue_lus: asyncio.Queue, libres_entree: asyncio.Queue, libres_sortie: asyncio.Queue,
+                        queue_traites: asyncio.Queue):
+        while True:
+            buffer, taille = await queue_lus.get()
+            sortie = await libres_sortie.get()
+            taille_sortie = await asyncio.to_thread(
+                self.__traitement.update_into, memoryview(buffer)[:taille], sortie)
+            libres_entree.put_nowait(buffer)
+
+            final: Optional[bytes] = None
+            if taille < len(buffer):
+                final = await asyncio.to_thread(self.__traitement.finalize)
+
+            await queue_traites.put((sortie, taille_sortie, final))
+            if final is not None:
+                return
+
+    @staticmethod
+    async def __ecrire(destination, queue_traites: asyncio.Queue, libres: asyncio.Queue) -> int:
+        octets_ecrits = 0
+        while True:
+            sortie, taille_sortie, final = await queue_traites.get()
+            if taille_sortie > 0:
+                await destination.write(memoryview(sortie)[:taille_sortie])
+                octets_ecrits += taille_sortie
+            libres.put_nowait(sortie)
+
+            if final is not None:
+                if len(final) > 0:
+                    await destination.write(memoryview(final))
+                    octets_ecrits += len(final)
+                return octets_ecrits
@@ -11,6 +11,8 @@ from docker.errors import APIError, DockerException
 from threading import Thread, Event
 from typing import Optional
 
+from millegrilles_messages.messages.FileAttente import FileAttente, POLITIQUE_ERREUR
+
 
 class DockerState:
 
@@ -117,7 +119,11 @@ class CommandeDocker:
 
 class DockerHandler:
 
-    def __init__(self, docker_state: DockerState):
+    def __init__(self, docker_state: DockerState, taille_max_actions: Optional[int] = None):
+        """
+        :param taille_max_actions: Nombre maximal de commandes en attente, ajouter_commande lance
+                                   FileAttentePleine lorsque la limite est atteinte. None pour aucune limite.
+        """
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
         self.__docker = docker_state.docker
 
@@ -126,7 +132,7 @@ class DockerHandler:
         self.__thread: Optional[Thread] = None
         self.__throttle_actions: Optional[float] = None
 
-        self.__action_fifo = list()
+        self.__action_fifo = FileAttente(taille_max_actions, POLITIQUE_ERREUR)
 
         self.__docker_initialise = False
 
@@ -139,7 +145,7 @@ class DockerHandler:
 
             # Traiter actions
             while len(self.__action_fifo) > 0:
-                action: CommandeDocker = self.__action_fifo.pop(0)
+                action: CommandeDocker = self.__action_fifo.retirer()
                 self.__logger.debug("Traiter action docker %s" % action)
                 try:
                     action.executer(self.__docker)
@@ -179,9 +185,12 @@ class DockerHandler:
             self.__action_pending.clear()
 
     def ajouter_commande(self, action: CommandeDocker):
-        self.__action_fifo.append(action)
+        self.__action_fifo.ajouter(action)
         self.__action_pending.set()
 
+    def get_statistiques_file(self) -> dict:
+        return self.__action_fifo.get_statistiques()
+
 
 class DockerHandlerException(Exception):
     pass
@@ -0,0 +1,218 @@
+"""
+Cache memoire borne avec eviction LRU, TTL par entree et admission TinyLFU optionnelle.
+"""
+import time
+
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class CacheLru:
+    """
+    Cache borne, get et put en O(1).
+
+    Les entrees sont evincees dans l'ordre LRU lorsque le cache est plein. Chaque entree a un TTL (optionnel),
+    renouvele a chaque acces si ttl_glissant est True, et une expiration maximale (e.g. fin de validite d'un
+    certificat). Avec admission_lfu, une nouvelle entree ne remplace la victime LRU que si elle est plus frequente
+    (TinyLFU), ce qui protege le cache contre un balayage de cles utilisees une seule fois.
+    """
+
+    def __init__(self, taille_max: int, ttl_secs: Optional[float] = None, ttl_glissant=True, admission_lfu=False):
+        """
+        :param taille_max: Nombre maximal d'entrees.
+        :param ttl_secs: TTL par defaut des entrees, None pour aucune expiration.
+        :param ttl_glissant: Si True, chaque acces renouvelle le TTL de l'entree.
+        :param admission_lfu: Active la politique d'admission TinyLFU.
+        """
+        if taille_max < 1:
+            raise ValueError('taille_max doit etre >= 1')
+
+        self.__taille_max = taille_max
+        self.__ttl_secs = ttl_secs
+        self.__ttl_glissant = ttl_glissant
+
+        # [cle] = EntreeCache, en ordre LRU (la plus ancienne en premier)
+        self.__entrees = OrderedDict()
+
+        self.__frequences: Optional[EsquisseFrequences] = None
+        if admission_lfu is True:
+            self.__frequences = EsquisseFrequences(taille_max)
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__expirations = 0
+        self.__rejets = 0
+
+    def __len__(self):
+        return len(self.__entrees)
+
+    def __contains__(self, cle):
+        return cle in self.__entrees
+
+    def get(self, cle, defaut=None) -> Any:
+        if self.__frequences is not None:
+            self.__frequences.incrementer(cle)
+
+        try:
+            entree = self.__entrees[cle]
+        except KeyError:
+            self.__misses += 1
+            return defaut
+
+        maintenant = time.monotonic()
+        if entree.expiration is not None and entree.expiration <= maintenant:
+            del self.__entrees[cle]
+            self.__expirations += 1
+            self.__misses += 1
+            return defaut
+
+        self.__entrees.move_to_end(cle)
+        if self.__ttl_glissant and entree.ttl_secs is not None:
+            entree.renouveler(maintenant)
+
+        self.__hits += 1
+        return entree.valeur
+
+    def peek(self, cle, defaut=None) -> Any:
+        """
+        Retourne la valeur sans modifier l'ordre LRU, le TTL ni les statistiques.
+        """
+        entree = self.__entrees.get(cle)
+        if entree is None or (entree.expiration is not None and entree.expiration <= time.monotonic()):
+            return defaut
+        return entree.valeur
+
+    def put(self, cle, valeur, ttl_secs: Optional[float] = None, expiration_max: Optional[float] = None) -> bool:
+        """
+        Ajoute ou remplace une entree.
+        :param ttl_secs: TTL de l'entree, defaut du cache si None.
+        :param expiration_max: Temps (time.monotonic()) apres lequel l'entree expire, meme si elle est utilisee.
+        :return: False si l'entree n'a pas ete admise (admission_lfu).
+        """
+        if ttl_secs is None:
+            ttl_secs = self.__ttl_secs
+
+        try:
+            entree = self.__entrees[cle]
+        except KeyError:
+            pass
+        else:
+            entree.valeur = valeur
+            entree.ttl_secs = ttl_secs
+            entree.expiration_max = expiration_max
+            entree.renouveler(time.monotonic())
+            self.__entrees.move_to_end(cle)
+            return True
+
+        if len(self.__entrees) >= self.__taille_max:
+            victime = next(iter(self.__entrees))
+            if self.__frequences is not None:
+                # La frequence du candidat est comptee par get() (miss avant l'ajout)
+                if self.__frequences.estimer(cle) <= self.__frequences.estimer(victime):
+                    self.__rejets += 1
+                    return False
+            del self.__entrees[victime]
+            self.__evictions += 1
+
+        entree = EntreeCache(valeur, ttl_secs, expiration_max)
+        entree.renouveler(time.monotonic())
+        self.__entrees[cle] = entree
+        return True
+
+    def retirer(self, cle) -> Any:
+        try:
+            return self.__entrees.pop(cle).valeur
+        except KeyError:
+            return None
+
+    def vider(self):
+        self.__entrees.clear()
+
+    def entretien(self):
+        """
+        Retire les entrees expirees. O(n), a appeler periodiquement pour liberer la memoire.
+        """
+        maintenant = time.monotonic()
+        expirees = [cle for cle, entree in self.__entrees.items()
+                    if entree.expiration is not None and entree.expiration <= maintenant]
+        for cle in expirees:
+            del self.__entrees[cle]
+        self.__expirations += len(expirees)
+
+    @property
+    def taille_max(self) -> int:
+        return self.__taille_max
+
+    def get_statistiques(self) -> dict:
+        return {
+            'taille': len(self.__entrees),
+            'taille_max': self.__taille_max,
+            'hits': self.__hits,
+            'misses': self.__misses,
+            'evictions': self.__evictions,
+            'expirations': self.__expirations,
+            'rejets': self.__rejets,
+        }
+
+
+class EntreeCache:
+
+    __slots__ = ('valeur', 'ttl_secs', 'expiration_max', 'expiration')
+
+    def __init__(self, valeur, ttl_secs: Optional[float], expiration_max: Optional[float]):
+        self.valeur = valeur
+        self.ttl_secs = ttl_secs
+        self.expiration_max = expiration_max
+        self.expiration: Optional[float] = None
+
+    def renouveler(self, maintenant: float):
+        expiration = None
+        if self.ttl_secs is not None:
+            expiration = maintenant + self.ttl_secs
+        if self.expiration_max is not None and (expiration is None or self.expiration_max < expiration):
+            expiration = self.expiration_max
+        self.expiration = expiration
+
+
+class EsquisseFrequences:
+    """
+    Count-min sketch (4 rangees, compteurs plafonnes a 15) avec vieillissement : tous les compteurs sont
+    divises par 2 apres 10 * taille increments.
+    """
+
+    PROFONDEUR = 4
+    GRAINES = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+
+    def __init__(self, taille: int):
+        largeur = 16
+        while largeur < taille * 4:
+            largeur *= 2
+        self.__masque = largeur - 1
+        self.__compteurs = [bytearray(largeur) for _ in range(0, EsquisseFrequences.PROFONDEUR)]
+        self.__increments = 0
+        self.__periode = max(taille * 10, 100)
+
+    def __indices(self, cle):
+        h = hash(cle)
+        return [((h ^ (h >> 29)) * graine >> 16) & self.__masque for graine in EsquisseFrequences.GRAINES]
+
+    def incrementer(self, cle):
+        for rangee, idx in zip(self.__compteurs, self.__indices(cle)):
+            if rangee[idx] < 15:
+                rangee[idx] += 1
+
+        self.__increments += 1
+        if self.__increments >= self.__periode:
+            self.__vieillir()
+
+    def estimer(self, cle) -> int:
+        return min([rangee[idx] for rangee, idx in zip(self.__compteurs, self.__indices(cle))])
+
+    def __vieillir(self):
+        self.__increments = 0
+        for rangee in self.__compteurs:
+            rangee[:] = rangee.translate(_TABLE_DIVISION_2)
+
+
+_TABLE_DIVISION_2 = bytes([i >> 1 for i in range(0, 256)])
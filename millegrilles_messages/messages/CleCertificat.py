@@ -17,6 +17,7 @@ class CleCertificat:
     def __init__(self, private_key, enveloppe: EnveloppeCertificat):
         self.__private_key = private_key
         self.__enveloppe = enveloppe
+        self.__private_x25519: Optional[X25519PrivateKey] = None
 
     @staticmethod
     def from_pems(pem_key: Union[str, bytes], pem_certificat: Union[str, bytes], password: Union[str, bytes] = None):
@@ -131,6 +132,12 @@ class CleCertificat:
         return cle_privee_bytes
 
     def get_private_x25519(self) -> X25519PrivateKey:
+        """
+        :return: Cle privee Ed25519 convertie en X25519 (calculee au premier appel).
+        """
+        if self.__private_x25519 is not None:
+            return self.__private_x25519
+
         if self.__private_key is not None:
             private_key = self.__private_key
         else:
@@ -141,9 +148,9 @@ class CleCertificat:
 
         cle_nacl_signingkey = SigningKey(cle_private_bytes)
         cle_x25519_prive = cle_nacl_signingkey.to_curve25519_private_key()
-        x25519_private_key = X25519PrivateKey.from_private_bytes(cle_x25519_prive.encode())
+        self.__private_x25519 = X25519PrivateKey.from_private_bytes(cle_x25519_prive.encode())
 
-        return x25519_private_key
+        return self.__private_x25519
 
     def __str__(self):
         return 'CleCertificat %s (CN=%s)' % (self.fingerprint, self.enveloppe.subject_common_name)
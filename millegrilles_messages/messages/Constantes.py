@@ -9,6 +9,14 @@ ENV_MQ_CONNECTION_ATTEMPTS = 'MQ_CONNECTION_ATTEMPTS'
 ENV_MQ_RETRY_DELAY = 'MQ_RETRY_DELAY'
 ENV_MQ_HEARTBEAT = 'MQ_HEARTBEAT'
 ENV_MQ_BLOCKED_CONNECTION_TIMEOUT = 'MQ_BLOCKED_CONNECTION_TIMEOUT'
+ENV_MQ_VERIFICATION_WORKERS = 'MQ_VERIFICATION_WORKERS'
+ENV_MQ_TAILLE_FILE_EMISSION = 'MQ_TAILLE_FILE_EMISSION'
+ENV_MQ_POLITIQUE_FILE_EMISSION = 'MQ_POLITIQUE_FILE_EMISSION'
+ENV_MQ_CONFIRMATIONS = 'MQ_CONFIRMATIONS'
+ENV_MQ_FENETRE_CONFIRMATIONS = 'MQ_FENETRE_CONFIRMATIONS'
+ENV_CERTIFICATS_CACHE_PATH = 'CERTIFICATS_CACHE_PATH'
+ENV_CERTIFICATS_CACHE_MAX = 'CERTIFICATS_CACHE_MAX'
+ENV_BACKUP_FORMAT = 'BACKUP_FORMAT'
 
 ENV_REDIS_HOSTNAME = 'REDIS_HOSTNAME'
 ENV_REDIS_PORT = 'REDIS_PORT'
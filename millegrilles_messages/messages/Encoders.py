@@ -1,6 +1,18 @@
 import datetime
 import json
 
+from json.encoder import encode_basestring
+from typing import Any
+
+
+# Encodeur json canonique : cles triees, separateurs compacts, UTF-8 (pas d'echappement ascii)
+_ENCODEUR_CANONIQUE = json.JSONEncoder(
+    ensure_ascii=False,  # S'assurer de supporter tous le range UTF-8
+    sort_keys=True,
+    separators=(',', ':'),
+    check_circular=False
+)
+
 
 class DateFormatEncoder(json.JSONEncoder):
     """
@@ -16,3 +28,133 @@ class DateFormatEncoder(json.JSONEncoder):
             return json.JSONEncoder.default(self, obj)
         except TypeError:
             return str(obj)
+
+
+def normaliser_valeur(valeur: Any) -> Any:
+    """
+    Prepare une valeur pour la serialisation canonique en une seule passe.
+
+    Applique les memes conversions que DateFormatEncoder (dates en epoch, objets inconnus en str), convertit
+    les cles en str comme json et retire le .0 des nombres float entiers (e.g. 100.0 devient 100).
+    Le resultat contient uniquement des types json natifs.
+
+    :param valeur: Valeur a normaliser (dict, list, str, int, float, ...)
+    :return: Copie normalisee de la valeur
+    """
+    type_valeur = type(valeur)
+    if type_valeur is str or type_valeur is int or type_valeur is bool or valeur is None:
+        return valeur
+    if type_valeur is dict:
+        return _normaliser_dict(valeur)
+    if type_valeur is list:
+        return [normaliser_valeur(v) for v in valeur]
+    if type_valeur is float:
+        return _normaliser_float(valeur)
+
+    # Sous-classes et types non supportes par json, memes regles que l'encodeur json
+    if isinstance(valeur, (str, int)):
+        return valeur
+    if isinstance(valeur, float):
+        return _normaliser_float(valeur)
+    if isinstance(valeur, (list, tuple)):
+        return [normaliser_valeur(v) for v in valeur]
+    if isinstance(valeur, dict):
+        return _normaliser_dict(valeur)
+    if isinstance(valeur, datetime.datetime):
+        return int(valeur.timestamp())
+
+    return str(valeur)
+
+
+def _normaliser_dict(valeur: dict) -> dict:
+    resultat = dict()
+    for cle, v in valeur.items():
+        if type(cle) is not str:
+            cle = _convertir_cle(cle)
+        type_v = type(v)
+        if type_v is str or type_v is int or type_v is bool or v is None:
+            resultat[cle] = v  # Raccourci pour les types les plus frequents
+        else:
+            resultat[cle] = normaliser_valeur(v)
+    return resultat
+
+
+def _normaliser_float(valeur: float):
+    # HACK - Les nombre floats ne doivent pas finir par .0 (e.g. 100.0 doit etre 100). Requis pour
+    # interoperabilite avec la verification (hachage, signature) en JavaScript.
+    if valeur.is_integer():
+        return int(valeur)
+    return valeur
+
+
+def _convertir_cle(cle) -> str:
+    """ Conversion des cles non-str, memes regles que json.dumps. """
+    if isinstance(cle, str):
+        return cle
+    if isinstance(cle, float):
+        return json.dumps(cle)
+    if cle is True:
+        return 'true'
+    if cle is False:
+        return 'false'
+    if cle is None:
+        return 'null'
+    if isinstance(cle, int):
+        return int.__repr__(cle)
+    raise TypeError('keys must be str, int, float, bool or None, not %s' % cle.__class__.__name__)
+
+
+def encoder_json_canonique(valeur: Any, normaliser=True) -> bytes:
+    """
+    Serialise une valeur en json canonique : cles triees, separateurs compacts, UTF-8.
+
+    :param valeur: Valeur a serialiser
+    :param normaliser: Si False, la valeur doit deja avoir ete preparee avec normaliser_valeur()
+    :return: Bytes json canoniques
+    """
+    if normaliser is True:
+        valeur = normaliser_valeur(valeur)
+
+    return _ENCODEUR_CANONIQUE.encode(valeur).encode('utf-8')
+
+
+def encoder_element_canonique(cle: str, valeur: Any) -> bytes:
+    """
+    Serialise un element de premier niveau d'un dict canonique ("cle":valeur). La valeur doit etre normalisee.
+    """
+    return (encode_basestring(cle) + ':' + _ENCODEUR_CANONIQUE.encode(valeur)).encode('utf-8')
+
+
+def assembler_elements_canoniques(elements: dict) -> bytes:
+    """
+    Assemble des elements produits par encoder_element_canonique en un dict json canonique (cles triees).
+    :param elements: Dict cle: bytes de l'element
+    """
+    return b'{' + b','.join([elements[cle] for cle in sorted(elements)]) + b'}'
+
+
+def encoder_json_canonique_sans_cle(valeur: dict, cle_exclue: str, normaliser=True) -> (bytes, bytes):
+    """
+    Serialise un dict en json canonique avec et sans une de ses cles de premier niveau (e.g. l'en-tete).
+    Chaque element est serialise une seule fois, les deux resultats sont assembles a partir des memes bytes.
+
+    :param valeur: Dict a serialiser
+    :param cle_exclue: Cle de premier niveau a retirer de la premiere version
+    :param normaliser: Si False, la valeur doit deja avoir ete preparee avec normaliser_valeur()
+    :return: (bytes sans la cle exclue, bytes complets)
+    """
+    if normaliser is True:
+        valeur = normaliser_valeur(valeur)
+
+    elements_sans_cle = list()
+    elements = list()
+    for cle in sorted(valeur):
+        element = encoder_element_canonique(cle, valeur[cle])
+        elements.append(element)
+        if cle != cle_exclue:
+            elements_sans_cle.append(element)
+
+    bytes_sans_cle = b'{' + b','.join(elements_sans_cle) + b'}'
+    bytes_complets = b'{' + b','.join(elements) + b'}'
+
+    return bytes_sans_cle, bytes_complets
@@ -6,6 +6,8 @@ import datetime
 import logging
 import math
 import struct
+import threading
+import time
 import pytz
 
 from typing import Optional, Union
@@ -25,12 +27,24 @@ from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PublicKey
 from cryptography.hazmat.primitives.asymmetric import rsa, ed25519
 from nacl.signing import VerifyKey
 
+from millegrilles_messages.messages.CacheLru import CacheLru
 from millegrilles_messages.messages.Hachage import hacher, map_code_to_hashes
 from millegrilles_messages.messages.Ed25519Utils import chiffrer_cle_ed25519
 
 BEGIN_CERTIFICATE = '-----BEGIN CERTIFICATE-----'
 END_CERTIFICATE = '-----END CERTIFICATE-----'
 
+# Extensions MilleGrilles (valeurs str, separees par des virgules pour les listes)
+MQ_EXCHANGES_OID = ObjectIdentifier('1.2.3.4.0')
+MQ_ROLES_OID = ObjectIdentifier('1.2.3.4.1')
+MQ_DOMAINES_OID = ObjectIdentifier('1.2.3.4.2')
+MQ_USERID_OID = ObjectIdentifier('1.2.3.4.3')
+MQ_DELEGATION_GLOBALE_OID = ObjectIdentifier('1.2.3.4.4')
+MQ_DELEGATIONS_DOMAINES_OID = ObjectIdentifier('1.2.3.4.5')
+
+# Enveloppes deja construites par from_pem, [pem] = EnveloppeCertificat
+INTERNEMENT_MAX = 1000
+
 
 class EnveloppeCertificat:
     """ Encapsule un certificat. """
@@ -38,6 +52,11 @@ class EnveloppeCertificat:
     ENCODING_FINGERPRINT = 'base58btc'
     HASH_FINGERPRINT = 'blake2s-256'
 
+    # Les enveloppes sont conservees en grand nombre dans les caches de certificats
+    __slots__ = ('__logger', '__certificat', '__est_verifie', '__chaine_pem', '__millegrille_pem', '__fingerprint',
+                 '__idmg', '__extensions_mq', '__sujet', '__not_valid_before', '__not_valid_after', '__is_ca',
+                 '__fingerprint_cle_publique', '__public_x25519')
+
     def __init__(self, certificat: Certificate, pems: Union[str, bytes, list]):
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
         self.__certificat = certificat
@@ -46,15 +65,39 @@ class EnveloppeCertificat:
         self.__chaine_pem = preparer_chaine_certificats(pems)  # Chaine certificats, moins root
         self.__millegrille_pem: Optional[str] = None  # PEM du certificat de la millegrille
 
+        # Valeurs derivees du certificat, calculees au premier acces
+        self.__extensions_mq: Optional[dict] = None
+        self.__sujet: Optional[dict] = None
+        self.__not_valid_before: Optional[datetime.datetime] = None
+        self.__not_valid_after: Optional[datetime.datetime] = None
+        self.__is_ca: Optional[bool] = None
+        self.__fingerprint_cle_publique: Optional[str] = None
+        self.__public_x25519: Optional[X25519PublicKey] = None
+
         self.__fingerprint = calculer_fingerprint(certificat)
         self.__idmg = trouver_idmg(self)
 
     @staticmethod
-    def from_pem(pem: Union[str, bytes]):
+    def from_pem(pem: Union[str, bytes, bytearray, memoryview]):
+        """
+        Charge un certificat (ou une chaine). Une chaine identique deja chargee retourne la meme enveloppe,
+        jusqu'a l'expiration du certificat (eviction LRU seulement pour un certificat deja expire).
+        """
+        # Cle d'internement en bytes (str et bytes d'une meme chaine partagent l'enveloppe)
         if isinstance(pem, str):
-            pem = pem.encode('utf-8')
-        certificat = load_pem_x509_certificate(pem, backend=default_backend())
-        enveloppe = EnveloppeCertificat(certificat, pem)
+            pem_bytes = pem.encode('utf-8')
+        else:
+            pem_bytes = bytes(pem)
+
+        enveloppe = _internement.get(pem_bytes)
+        if enveloppe is not None:
+            return enveloppe
+
+        certificat = load_pem_x509_certificate(pem_bytes, backend=default_backend())
+        enveloppe = EnveloppeCertificat(certificat, pem_bytes)
+
+        _internement.put(pem_bytes, enveloppe)
+
         return enveloppe
 
     @staticmethod
@@ -112,82 +155,74 @@ class EnveloppeCertificat:
         public_key_str = str(public_key, 'utf-8')
         return public_key_str
 
+    def __get_extension_mq(self, oid: ObjectIdentifier) -> str:
+        """
+        :return: Valeur (str) d'une extension MilleGrilles. Toutes les extensions sont decodees au premier acces.
+        :raise ExtensionNotFound: Si le certificat n'a pas cette extension.
+        """
+        if self.__extensions_mq is None:
+            extensions_mq = dict()
+            for extension in self.__certificat.extensions:
+                if extension.oid.dotted_string.startswith('1.2.3.4.'):
+                    try:
+                        extensions_mq[extension.oid] = extension.value.value.decode('utf-8')
+                    except AttributeError:
+                        pass  # Extension connue de cryptography, pas une valeur MilleGrilles
+            self.__extensions_mq = extensions_mq
+
+        try:
+            return self.__extensions_mq[oid]
+        except KeyError:
+            raise ExtensionNotFound('Extension %s absente' % oid.dotted_string, oid)
+
+    def __get_liste_extension_mq(self, oid: ObjectIdentifier) -> list:
+        return self.__get_extension_mq(oid).split(',')
+
     @property
     def get_roles(self):
-        MQ_ROLES_OID = ObjectIdentifier('1.2.3.4.1')
-        extensions = self.__certificat.extensions
-        oid_attribute = extensions.get_extension_for_oid(MQ_ROLES_OID)
-        oid_value = oid_attribute.value
-        oid_value = oid_value.value.decode('utf-8')
-        attribute_values = oid_value.split(',')
-        return attribute_values
+        return self.__get_liste_extension_mq(MQ_ROLES_OID)
 
     @property
     def get_exchanges(self):
-        MQ_EXCHANGES_OID = ObjectIdentifier('1.2.3.4.0')
-        extensions = self.__certificat.extensions
-        oid_attribute = extensions.get_extension_for_oid(MQ_EXCHANGES_OID)
-        oid_value = oid_attribute.value
-        oid_value = oid_value.value.decode('utf-8')
-        attribute_values = oid_value.split(',')
-        return attribute_values
+        return self.__get_liste_extension_mq(MQ_EXCHANGES_OID)
 
     @property
     def get_domaines(self):
-        MQ_DOMAINES_OID = ObjectIdentifier('1.2.3.4.2')
-        extensions = self.__certificat.extensions
-        oid_attribute = extensions.get_extension_for_oid(MQ_DOMAINES_OID)
-        oid_value = oid_attribute.value
-        oid_value = oid_value.value.decode('utf-8')
-        attribute_values = oid_value.split(',')
-        return attribute_values
+        return self.__get_liste_extension_mq(MQ_DOMAINES_OID)
 
     @property
     def get_user_id(self) -> str:
-        MQ_USERID_OID = ObjectIdentifier('1.2.3.4.3')
-        extensions = self.__certificat.extensions
-        oid_attribute = extensions.get_extension_for_oid(MQ_USERID_OID)
-        oid_value = oid_attribute.value
-        oid_value = oid_value.value.decode('utf-8')
-        return oid_value
+        return self.__get_extension_mq(MQ_USERID_OID)
 
     @property
     def get_delegation_globale(self) -> str:
-        MQ_DELEGATION_GLOBALE_OID = ObjectIdentifier('1.2.3.4.4')
-        extensions = self.__certificat.extensions
-        oid_attribute = extensions.get_extension_for_oid(MQ_DELEGATION_GLOBALE_OID)
-        oid_value = oid_attribute.value
-        oid_value = oid_value.value.decode('utf-8')
-        return oid_value
+        return self.__get_extension_mq(MQ_DELEGATION_GLOBALE_OID)
 
     @property
     def get_delegations_domaines(self) -> list:
-        MQ_DOMAINES_OID = ObjectIdentifier('1.2.3.4.5')
-        extensions = self.__certificat.extensions
-        oid_attribute = extensions.get_extension_for_oid(MQ_DOMAINES_OID)
-        oid_value = oid_attribute.value
-        oid_value = oid_value.value.decode('utf-8')
-        attribute_values = oid_value.split(',')
-        return attribute_values
+        return self.__get_liste_extension_mq(MQ_DELEGATIONS_DOMAINES_OID)
+
+    def __get_attribut_sujet(self, oid: ObjectIdentifier) -> Optional[str]:
+        if self.__sujet is None:
+            sujet = dict()
+            for attribut in self.__certificat.subject:
+                sujet.setdefault(attribut.oid, attribut.value)  # Premiere valeur seulement
+            self.__sujet = sujet
+        return self.__sujet.get(oid)
 
     @property
     def subject_organization_name(self):
-        organization = self.__certificat.subject.get_attributes_for_oid(NameOID.ORGANIZATION_NAME)
-        if len(organization) > 0:
-            return organization[0].value
-        return None
+        return self.__get_attribut_sujet(NameOID.ORGANIZATION_NAME)
 
     @property
     def subject_organizational_unit_name(self):
-        org = self.__certificat.subject.get_attributes_for_oid(NameOID.ORGANIZATIONAL_UNIT_NAME)
-        if org is not None and len(org) > 0:
-            return org[0].value
-        return None
+        return self.__get_attribut_sujet(NameOID.ORGANIZATIONAL_UNIT_NAME)
 
     @property
     def subject_common_name(self):
-        sujet = self.certificat.subject
-        cn = sujet.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value
+        cn = self.__get_attribut_sujet(NameOID.COMMON_NAME)
+        if cn is None:
+            raise IndexError('Certificat sans common name')
         return cn
 
     @property
@@ -195,14 +230,18 @@ class EnveloppeCertificat:
         # Note : utilisation de pytz pour transformer la date vers le format datetime python3
         #        cryptography utilise un format susceptible a epochalypse sur .timestamp()
         #        https://en.wikipedia.org/wiki/Year_2038_problem
-        return pytz.utc.localize(self.__certificat.not_valid_before)
+        if self.__not_valid_before is None:
+            self.__not_valid_before = pytz.utc.localize(self.__certificat.not_valid_before)
+        return self.__not_valid_before
 
     @property
     def not_valid_after(self) -> datetime.datetime:
         # Note : utilisation de pytz pour transformer la date vers le format datetime python3
         #        cryptography utilise un format susceptible a epochalypse sur .timestamp()
         #        https://en.wikipedia.org/wiki/Year_2038_problem
-        return pytz.utc.localize(self.__certificat.not_valid_after)
+        if self.__not_valid_after is None:
+            self.__not_valid_after = pytz.utc.localize(self.__certificat.not_valid_after)
+        return self.__not_valid_after
 
     @property
     def subject_key_identifier(self):
@@ -235,13 +274,13 @@ class EnveloppeCertificat:
 
     @property
     def is_ca(self):
-        try:
-            basic_constraints = self.certificat.extensions.get_extension_for_class(BasicConstraints)
-            if basic_constraints is not None:
-                return basic_constraints.value.ca
-            return False
-        except ExtensionNotFound:
-            return False
+        if self.__is_ca is None:
+            try:
+                basic_constraints = self.certificat.extensions.get_extension_for_class(BasicConstraints)
+                self.__is_ca = basic_constraints is not None and basic_constraints.value.ca
+            except ExtensionNotFound:
+                self.__is_ca = False
+        return self.__is_ca
 
     @property
     def _is_valid_at_current_time(self):
@@ -297,11 +336,15 @@ class EnveloppeCertificat:
 
     @property
     def fingerprint_cle_publique(self) -> str:
-        pk = self.certificat.public_key()
-        pem = pk.public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
-        pem_bytes = ''.join(pem.strip().decode('utf-8').split('\n')[1:-1]).encode('utf-8')
-        pk_bytes = base64.b64decode(pem_bytes)
-        return hacher(pk_bytes, hashing_code=EnveloppeCertificat.HASH_FINGERPRINT, encoding=EnveloppeCertificat.ENCODING_FINGERPRINT)
+        if self.__fingerprint_cle_publique is None:
+            pk = self.certificat.public_key()
+            pem = pk.public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+            pem_bytes = ''.join(pem.strip().decode('utf-8').split('\n')[1:-1]).encode('utf-8')
+            pk_bytes = base64.b64decode(pem_bytes)
+            self.__fingerprint_cle_publique = hacher(
+                pk_bytes, hashing_code=EnveloppeCertificat.HASH_FINGERPRINT,
+                encoding=EnveloppeCertificat.ENCODING_FINGERPRINT)
+        return self.__fingerprint_cle_publique
 
     def calculer_expiration(self):
         date_expiration = self.not_valid_after
@@ -327,13 +370,17 @@ class EnveloppeCertificat:
         return {'expire': est_expire, 'renouveler': peut_renouveler}
 
     def get_public_x25519(self) -> X25519PublicKey:
-        public_key = self.certificat.public_key().public_bytes(encoding=serialization.Encoding.Raw,
-                                                               format=serialization.PublicFormat.Raw)
+        """
+        :return: Cle publique Ed25519 convertie en X25519 (calculee au premier appel).
+        """
+        if self.__public_x25519 is None:
+            public_key = self.certificat.public_key().public_bytes(encoding=serialization.Encoding.Raw,
+                                                                   format=serialization.PublicFormat.Raw)
 
-        cle_nacl_verifykey = VerifyKey(public_key).to_curve25519_public_key()
-        x25519_public_key = X25519PublicKey.from_public_bytes(cle_nacl_verifykey.encode())
+            cle_nacl_verifykey = VerifyKey(public_key).to_curve25519_public_key()
+            self.__public_x25519 = X25519PublicKey.from_public_bytes(cle_nacl_verifykey.encode())
 
-        return x25519_public_key
+        return self.__public_x25519
 
     def chiffrage_asymmetrique(self, cle_secrete):
         cle_asym = chiffrer_cle_ed25519(self, cle_secrete)
@@ -363,6 +410,36 @@ class EnveloppeCertificat:
             return False
 
 
+class InternementEnveloppes:
+    """
+    Table (LRU bornee) des enveloppes par texte PEM. Partagee entre threads.
+    """
+
+    def __init__(self, taille_max: int):
+        self.__lock = threading.Lock()
+        self.__cache = CacheLru(taille_max)
+
+    def get(self, pem: bytes) -> Optional[EnveloppeCertificat]:
+        with self.__lock:
+            return self.__cache.get(pem)
+
+    def put(self, pem: bytes, enveloppe: EnveloppeCertificat):
+        # Expiration a la fin de la validite, sauf pour un certificat deja expire (LRU seulement)
+        duree_validite = enveloppe.not_valid_after - datetime.datetime.now(tz=pytz.utc)
+        expiration_max = None
+        if duree_validite.total_seconds() > 0:
+            expiration_max = time.monotonic() + duree_validite.total_seconds()
+        with self.__lock:
+            self.__cache.put(pem, enveloppe, expiration_max=expiration_max)
+
+    def vider(self):
+        with self.__lock:
+            self.__cache.vider()
+
+
+_internement = InternementEnveloppes(INTERNEMENT_MAX)
+
+
 def trouver_idmg(enveloppe: EnveloppeCertificat) -> str:
 
     # Verifier si cert est root CA (doit calculer idmg)
@@ -0,0 +1,126 @@
+"""
+File d'attente FIFO bornee pour les Q en memoire (emission, reception, commandes docker).
+"""
+import asyncio
+
+from collections import deque
+from typing import Optional
+
+
+POLITIQUE_BLOQUER = 'bloquer'  # ajouter_attendre() attend qu'une place se libere
+POLITIQUE_ERREUR = 'erreur'    # ajouter_attendre() lance FileAttentePleine
+
+
+class FileAttentePleine(Exception):
+    pass
+
+
+class FileAttente:
+    """
+    File FIFO (deque) avec taille maximale optionnelle et statistiques de profondeur.
+
+    ajouter() et retirer() sont O(1) et peuvent etre appeles d'une thread externe (deque est thread-safe pour
+    append/popleft). L'attente de ajouter_attendre() requiert que retirer() soit appele dans la meme event loop.
+    """
+
+    def __init__(self, taille_max: Optional[int] = None, politique: str = POLITIQUE_BLOQUER):
+        """
+        :param taille_max: Nombre maximal d'elements, None pour aucune limite.
+        :param politique: POLITIQUE_BLOQUER ou POLITIQUE_ERREUR lorsque la file est pleine.
+        """
+        if politique not in (POLITIQUE_BLOQUER, POLITIQUE_ERREUR):
+            raise ValueError('Politique inconnue : %s' % politique)
+
+        self.__file = deque()
+        self.__taille_max = taille_max
+        self.__politique = politique
+
+        self.__event_place: Optional[asyncio.Event] = None
+
+        # Statistiques
+        self.__high_water = 0
+        self.__nb_ajouts = 0
+        self.__nb_refus = 0
+        self.__nb_attentes = 0
+
+    def __len__(self):
+        return len(self.__file)
+
+    def est_pleine(self) -> bool:
+        return self.__taille_max is not None and len(self.__file) >= self.__taille_max
+
+    def ajouter(self, element):
+        """
+        Ajoute un element sans attendre.
+        :raises FileAttentePleine: Si la file est pleine.
+        """
+        if self.est_pleine():
+            self.__nb_refus += 1
+            raise FileAttentePleine('File pleine (%d elements)' % len(self.__file))
+
+        self.__file.append(element)
+        self.__nb_ajouts += 1
+
+        profondeur = len(self.__file)
+        if profondeur > self.__high_water:
+            self.__high_water = profondeur
+
+    async def ajouter_attendre(self, element, timeout: Optional[float] = None):
+        """
+        Ajoute un element. Si la file est pleine, attend une place (POLITIQUE_BLOQUER) ou lance une erreur.
+        :param timeout: Duree d'attente maximale en secondes (POLITIQUE_BLOQUER).
+        :raises FileAttentePleine: Si la file est pleine (POLITIQUE_ERREUR).
+        :raises asyncio.TimeoutError: Si aucune place n'est liberee avant le timeout.
+        """
+        if self.est_pleine():
+            if self.__politique == POLITIQUE_ERREUR:
+                self.__nb_refus += 1
+                raise FileAttentePleine('File pleine (%d elements)' % len(self.__file))
+
+            self.__nb_attentes += 1
+            if self.__event_place is None:
+                self.__event_place = asyncio.Event()
+
+            while self.est_pleine():
+                self.__event_place.clear()
+                await asyncio.wait_for(self.__event_place.wait(), timeout)
+
+        self.ajouter(element)
+
+    def retirer(self):
+        """
+        Retire le premier element.
+        :raises IndexError: Si la file est vide.
+        """
+        element = self.__file.popleft()
+        if self.__event_place is not None:
+            self.__event_place.set()
+        return element
+
+    def vider(self) -> list:
+        elements = list(self.__file)
+        self.__file.clear()
+        if self.__event_place is not None:
+            self.__event_place.set()
+        return elements
+
+    @property
+    def taille_max(self) -> Optional[int]:
+        return self.__taille_max
+
+    @property
+    def high_water(self) -> int:
+        return self.__high_water
+
+    def reset_high_water(self):
+        self.__high_water = len(self.__file)
+
+    def get_statistiques(self) -> dict:
+        return {
+            'profondeur': len(self.__file),
+            'taille_max': self.__taille_max,
+            'high_water': self.__high_water,
+            'ajouts': self.__nb_ajouts,
+            'refus': self.__nb_refus,
+            'attentes': self.__nb_attentes,
+        }
@@ -1,19 +1,26 @@
 import datetime
-import json
 import logging
 import multibase
+import time
 import uuid
 import pytz
 
+from typing import Optional, Union
+
 from cryptography.hazmat.primitives import hashes
 
 from millegrilles_messages.messages import Constantes
 from millegrilles_messages.messages.Hachage import hacher
 from millegrilles_messages.messages.CleCertificat import CleCertificat
-from millegrilles_messages.messages.Encoders import DateFormatEncoder
+from millegrilles_messages.messages.Encoders import DateFormatEncoder, encoder_json_canonique, normaliser_valeur, \
+    encoder_element_canonique, assembler_elements_canoniques
 from millegrilles_messages.messages.EnveloppeCertificat import CertificatExpire
 
 VERSION_SIGNATURE = 2
+GABARITS_MAX = 1000  # Nombre maximal de gabarits conserves par formatteur
+
+# Prefixe de l'element en-tete dans un message json canonique ("en-tete":)
+PREFIXE_ELEMENT_ENTETE = encoder_element_canonique(Constantes.MESSAGE_ENTETE, None)[:-len(b'null')]
 
 
 class SignateurTransactionSimple:
@@ -32,10 +39,7 @@ class SignateurTransactionSimple:
         """
 
         # S'assurer que le certificat n'est pas expire
-        maintenant = datetime.datetime.now(tz=pytz.UTC)
-        expiration_certificat = self.__clecert.enveloppe.not_valid_after
-        if maintenant > expiration_certificat:
-            raise CertificatExpire()
+        self.verifier_expiration()
 
         # Copier la base du message et l'en_tete puisqu'ils seront modifies
         dict_message_effectif = dict_message.copy()
@@ -51,9 +55,25 @@ class SignateurTransactionSimple:
 
         return dict_message_effectif
 
+    def verifier_expiration(self):
+        """
+        :raises CertificatExpire: Si le certificat de signature est expire.
+        """
+        maintenant = datetime.datetime.now(tz=pytz.UTC)
+        expiration_certificat = self.__clecert.enveloppe.not_valid_after
+        if maintenant > expiration_certificat:
+            raise CertificatExpire()
+
     def _produire_signature(self, dict_message):
         # message_bytes = self.preparer_transaction_bytes(dict_message)
         message_bytes = preparer_message_bytes(dict_message)
+        return self.signer_bytes(message_bytes)
+
+    def signer_bytes(self, message_bytes: bytes) -> str:
+        """
+        Signe des bytes deja prepares (json canonique du message avec en-tete, sans les cles _).
+        :return: Signature multibase
+        """
         self.__logger.debug("Message en format json: %s" % message_bytes)
 
         # Hacher le message avec BLAKE2b pour supporter message de grande taille avec Ed25519
@@ -74,6 +94,48 @@ class SignateurTransactionSimple:
     def chaine_certs(self) -> list:
         return self.__clecert.enveloppe.chaine_pem()
 
+    @property
+    def fingerprint(self) -> str:
+        return self.__clecert.fingerprint
+
+
+class GabaritMessage:
+    """
+    Partie statique des messages d'un meme type, domaine, action, partition, version et exchanges.
+    Les elements fixes de l'en-tete et la routing key sont prepares une seule fois.
+    """
+
+    def __init__(self, idmg: str, fingerprint: str, type_message: str, domaine: Optional[str], action: Optional[str],
+                 partition: Optional[str] = None, version: int = Constantes.MESSAGE_VERSION_1,
+                 exchanges: Optional[list] = None):
+        self.type_message = type_message
+        self.domaine = domaine
+        self.action = action
+        self.partition = partition
+        self.version = version
+        self.exchanges = exchanges
+
+        rk = [type_message, domaine, partition, action]
+        self.routing_key = '.'.join([r for r in rk if r is not None])
+
+        entete = {
+            Constantes.MESSAGE_IDMG: idmg,
+            Constantes.MESSAGE_VERSION: version,
+            Constantes.MESSAGE_FINGERPRINT_CERTIFICAT: fingerprint,
+        }
+        if domaine is not None:
+            entete[Constantes.MESSAGE_DOMAINE] = domaine
+        if action is not None:
+            entete[Constantes.MESSAGE_ACTION] = action
+        if partition is not None:
+            entete[Constantes.MESSAGE_PARTITION] = partition
+
+        self.entete_statique = entete
+        self.elements_entete = {cle: encoder_element_canonique(cle, valeur) for cle, valeur in entete.items()}
+
+    def __str__(self):
+        return 'GabaritMessage %s' % self.routing_key
+
 
 class FormatteurMessageMilleGrilles:
     """
@@ -90,6 +152,9 @@ class FormatteurMessageMilleGrilles:
         self.__signateur_transactions = signateur_transactions
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
 
+        self.__gabarits = dict()  # [(type, domaine, action, partition, version, exchanges)] = GabaritMessage
+        self.__element_certificats: Optional[bytes] = None
+
     def signer_message(self,
                        message: dict,
                        domaine: str = None,
@@ -125,21 +190,20 @@ class FormatteurMessageMilleGrilles:
         if partition is not None:
             meta[Constantes.MESSAGE_PARTITION] = partition
 
-        message_copy = message.copy()
-        try:
-            del message_copy[Constantes.MESSAGE_ENTETE]
-        except KeyError:
-            pass  # L'entete n'existait pas
+        message_copy = dict()
+        for key, value in message.items():
+            if not key.startswith('_') and key != Constantes.MESSAGE_ENTETE:
+                message_copy[key] = value
 
-        # Nettoyer le message, serialiser pour eliminer tous les objets
-        message_bytes = preparer_message_bytes(message_copy)
+        # Nettoyer le message, normaliser pour eliminer tous les objets
+        message_copy = normaliser_valeur(message_copy)
+        message_bytes = encoder_json_canonique(message_copy, normaliser=False)
 
         # Hacher le contenu avec SHA2-256 et signer le message avec le certificat du noeud
         self.__logger.debug("Message a hacher : %s" % message_bytes.decode('utf-8'))
         meta[Constantes.MESSAGE_HACHAGE] = hacher(message_bytes, hashing_code='blake2s-256', encoding='base64')
 
-        # Recuperer le dict de message (deserialiser), ajouter l'entete pour signer le message
-        message_copy = json.loads(message_bytes)
+        # Ajouter l'entete au message normalise pour signer le message
         message_copy[Constantes.MESSAGE_ENTETE] = meta
 
         message_signe = self.__signateur_transactions.signer(message_copy)
@@ -150,6 +214,83 @@ class FormatteurMessageMilleGrilles:
 
         return message_signe, uuid_transaction
 
+    def get_gabarit(self, type_message: str, domaine: Optional[str], action: Optional[str],
+                    partition: Optional[str] = None, version: int = Constantes.MESSAGE_VERSION_1,
+                    exchanges: Optional[Union[str, list]] = None) -> GabaritMessage:
+        """
+        Retourne le gabarit (conserve en cache) pour ce type de message.
+        :param type_message: Prefixe de la routing key, e.g. evenement, commande, requete, transaction
+        """
+        if isinstance(exchanges, str):
+            exchanges = [exchanges]
+
+        cle = (type_message, domaine, action, partition, version, tuple(exchanges) if exchanges else None)
+        try:
+            return self.__gabarits[cle]
+        except KeyError:
+            pass
+
+        gabarit = GabaritMessage(self.__idmg, self.__signateur_transactions.fingerprint, type_message,
+                                 domaine, action, partition, version, exchanges)
+
+        if len(self.__gabarits) >= GABARITS_MAX:
+            del self.__gabarits[next(iter(self.__gabarits))]  # Retirer le plus ancien
+        self.__gabarits[cle] = gabarit
+
+        return gabarit
+
+    def signer_message_gabarit(self, message: dict, gabarit: GabaritMessage,
+                               ajouter_chaine_certs=True) -> (dict, uuid.UUID, bytes):
+        """
+        Formatte et signe un message a partir d'un gabarit. Equivalent a signer_message, chaque element du contenu
+        est serialise une seule fois pour le hachage, la signature et les bytes a emettre.
+
+        :param message: Message a signer
+        :param gabarit: Gabarit obtenu avec get_gabarit()
+        :param ajouter_chaine_certs:
+        :return: Message signe, uuid_transaction, bytes json du message signe
+        """
+        self.__signateur_transactions.verifier_expiration()
+
+        message_copy = dict()
+        for key, value in message.items():
+            if not key.startswith('_') and key != Constantes.MESSAGE_ENTETE:
+                message_copy[key] = value
+        message_copy = normaliser_valeur(message_copy)
+
+        elements = {cle: encoder_element_canonique(cle, valeur) for cle, valeur in message_copy.items()}
+        contenu_bytes = assembler_elements_canoniques(elements)
+
+        # Elements variables de l'en-tete
+        uuid_transaction = uuid.uuid1()
+        entete = gabarit.entete_statique.copy()
+        elements_entete = gabarit.elements_entete.copy()
+        valeurs = {
+            Constantes.MESSAGE_UUID_TRANSACTION: str(uuid_transaction),
+            Constantes.MESSAGE_ESTAMPILLE: int(time.time()),
+            Constantes.MESSAGE_HACHAGE: hacher(contenu_bytes, hashing_code='blake2s-256', encoding='base64'),
+        }
+        for cle, valeur in valeurs.items():
+            entete[cle] = valeur
+            elements_entete[cle] = encoder_element_canonique(cle, valeur)
+
+        message_copy[Constantes.MESSAGE_ENTETE] = entete
+        elements[Constantes.MESSAGE_ENTETE] = PREFIXE_ELEMENT_ENTETE + assembler_elements_canoniques(elements_entete)
+
+        signature = self.__signateur_transactions.signer_bytes(assembler_elements_canoniques(elements))
+        message_copy[Constantes.MESSAGE_SIGNATURE] = signature
+        elements[Constantes.MESSAGE_SIGNATURE] = encoder_element_canonique(Constantes.MESSAGE_SIGNATURE, signature)
+
+        if ajouter_chaine_certs:
+            chaine_certs = self.__signateur_transactions.chaine_certs
+            if self.__element_certificats is None:
+                self.__element_certificats = encoder_element_canonique(
+                    Constantes.MESSAGE_CERTIFICAT_INCLUS, chaine_certs)
+            message_copy[Constantes.MESSAGE_CERTIFICAT_INCLUS] = chaine_certs
+            elements[Constantes.MESSAGE_CERTIFICAT_INCLUS] = self.__element_certificats
+
+        return message_copy, uuid_transaction, assembler_elements_canoniques(elements)
+
     @property
     def chaine_certificat(self):
         return self.__signateur_transactions.chaine_certs
@@ -168,23 +309,8 @@ def preparer_message_bytes(message: dict):
 
     # self._logger.debug("Message nettoye: %s" % str(transaction_temp))
 
-    # Premiere passe, converti les dates. Les nombre floats sont incorrects.
-    message_json = json.dumps(
-        transaction_temp,
-        ensure_ascii=False,  # S'assurer de supporter tous le range UTF-8
-        cls=DateFormatEncoder
-    )
-
-    # HACK - Fix pour le decodage des float qui ne doivent pas finir par .0 (e.g. 100.0 doit etre 100)
-    message_json = json.loads(message_json, parse_float=parse_float)
-    message_json = json.dumps(
-        message_json,
-        ensure_ascii=False,  # S'assurer de supporter tous le range UTF-8
-        sort_keys=True,
-        separators=(',', ':')
-    )
-
-    message_bytes = bytes(message_json, 'utf-8')
+    # Une seule passe : converti les dates, corrige les floats (e.g. 100.0 doit etre 100) et trie les cles
+    message_bytes = encoder_json_canonique(transaction_temp)
 
     return message_bytes
 
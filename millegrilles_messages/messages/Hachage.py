@@ -4,6 +4,8 @@ Module avec les fonctions de hachage utilisees dans MilleGrilles.
 Inclus les conversions avec multihash et multibase
 """
 import base64
+import binascii
+import hashlib
 
 import multibase
 import multihash
@@ -13,6 +15,51 @@ from cryptography.hazmat.backends import default_backend
 from multihash.constants import HASH_CODES
 from typing import Union, Optional
 
+# Implementations natives (hashlib) par code multihash. Plus rapides que cryptography, surtout pour les petites
+# valeurs, et le GIL est relache pendant le hachage des gros buffers.
+HASHLIB_PAR_CODE = {
+    0x12: lambda: hashlib.sha256(),
+    0x13: lambda: hashlib.sha512(),
+    0xb240: lambda: hashlib.blake2b(digest_size=64),
+    0xb260: lambda: hashlib.blake2s(digest_size=32),
+}
+
+
+def get_hashing_code(hashing_code: Union[int, str]) -> int:
+    if isinstance(hashing_code, str):
+        return HASH_CODES[hashing_code]
+    return hashing_code
+
+
+def creer_contexte_hachage(hashing_code: Union[int, str], natif=True):
+    """
+    :param hashing_code: int ou str de l'algorithme de hachage, e.g. sha2-256, blake2b-512
+    :param natif: Si True, utilise hashlib lorsque l'algorithme est supporte. Sinon utilise cryptography.
+    :return: Contexte de hachage avec update(data) et digest()
+    """
+    hashing_code = get_hashing_code(hashing_code)
+    if natif is True:
+        try:
+            return HASHLIB_PAR_CODE[hashing_code]()
+        except KeyError:
+            pass
+    return ContexteHachageCryptography(map_code_to_hashes(hashing_code))
+
+
+class ContexteHachageCryptography:
+    """
+    Contexte de hachage cryptography avec l'interface hashlib (update, digest).
+    """
+
+    def __init__(self, hashing_function: hashes.HashAlgorithm):
+        self.__context = hashes.Hash(hashing_function, backend=default_backend())
+
+    def update(self, data: Union[bytes, bytearray, memoryview]):
+        self.__context.update(data)
+
+    def digest(self) -> bytes:
+        return self.__context.finalize()
+
 
 class Hacheur:
     """
@@ -28,17 +75,12 @@ class Hacheur:
         """
 
         self.__encoding = encoding
-
-        if isinstance(hashing_code, str):
-            hashing_code = HASH_CODES[hashing_code]
-        self.__hashing_code = hashing_code
-
-        hashing_function = map_code_to_hashes(hashing_code)
-        self.__hashing_context = hashes.Hash(hashing_function, backend=default_backend())
+        self.__hashing_code = get_hashing_code(hashing_code)
+        self.__hashing_context = creer_contexte_hachage(self.__hashing_code)
 
         self.__digest: Optional[bytes] = None
 
-    def update(self, data: Union[str, bytes]):
+    def update(self, data: Union[str, bytes, bytearray, memoryview]):
         if isinstance(data, str):
             data = data.encode('utf-8')
         self.__hashing_context.update(data)
@@ -49,7 +91,7 @@ class Hacheur:
         :return: Digest en bytes
         """
         if self.__digest is None:
-            self.__digest = self.__hashing_context.finalize()
+            self.__digest = self.__hashing_context.digest()
             self.__hashing_context = None
         return self.__digest
 
@@ -64,50 +106,98 @@ class Hacheur:
         return mb.decode('utf-8')
 
 
-class VerificateurHachage:
+class HacheurMultiple:
+    """
+    Calcule plusieurs hachages en une seule passe sur les donnees, e.g. blake2b-512 pour l'identificateur du
+    fichier et sha2-256 pour des outils externes. Remplace un Hacheur, finalize() retourne le premier hachage.
+    """
 
-    def __init__(self, hachage_multibase: str):
+    def __init__(self, hashing_codes: list, encoding: str = 'base64'):
         """
-        :param hachage_multibase: Hachage a verifier
+        :param hashing_codes: Liste de codes (int ou str) des algorithmes de hachage, le premier est le principal.
+        :param encoding: Encoding du multibase, e.g. base58btc
         """
-        self.__hachage_multibase = hachage_multibase
+        if len(hashing_codes) == 0:
+            raise ValueError('Au moins un hashing_code requis')
+        self.__hacheurs = [(code, Hacheur(code, encoding)) for code in hashing_codes]
 
-        mb = multibase.decode(hachage_multibase)
-        mh = multihash.decode(mb)
-        self.__hachage_recu = mh.digest
-        self.__hashing_code = mh.code
+    def update(self, data: Union[str, bytes, bytearray, memoryview]):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        for _code, hacheur in self.__hacheurs:
+            hacheur.update(data)
 
-        hashing_function = map_code_to_hashes(self.__hashing_code)
-        self.__hashing_context = hashes.Hash(hashing_function, backend=default_backend())
+    def digest(self) -> bytes:
+        return self.__hacheurs[0][1].digest()
 
-        self.__hachage_calcule: Optional[bytes] = None
+    def finalize(self) -> str:
+        """
+        :return: Multibase du hachage principal
+        """
+        return self.__hacheurs[0][1].finalize()
 
-    def update(self, data: Union[str, bytes]):
+    def get_digests(self) -> dict:
+        """
+        :return: Digests en bytes par hashing_code
+        """
+        return dict([(code, hacheur.digest()) for code, hacheur in self.__hacheurs])
+
+    def get_hachages(self) -> dict:
+        """
+        :return: Multibase par hashing_code
+        """
+        return dict([(code, hacheur.finalize()) for code, hacheur in self.__hacheurs])
+
+
+class VerificateurHachage:
+
+    def __init__(self, hachage_multibase: Union[str, list[str]]):
+        """
+        :param hachage_multibase: Hachage a verifier, ou liste de hachages verifies en une seule passe
+        """
+        if isinstance(hachage_multibase, str):
+            hachage_multibase = [hachage_multibase]
+
+        self.__hachages_recus = list()
+        self.__hashing_contexts = list()
+        for hachage in hachage_multibase:
+            mb = decoder_multibase(hachage)
+            mh = multihash.decode(mb)
+            self.__hachages_recus.append(mh.digest)
+            self.__hashing_contexts.append(creer_contexte_hachage(mh.code))
+
+        self.__hachages_calcules: Optional[list] = None
+
+    def update(self, data: Union[str, bytes, bytearray, memoryview]):
         if isinstance(data, str):
             data = data.encode('utf-8')
-        self.__hashing_context.update(data)
+        for context in self.__hashing_contexts:
+            context.update(data)
 
     def digest(self) -> bytes:
         """
         Calcule le digest
-        :return: Digest en bytes
+        :return: Digest en bytes (premier hachage)
         """
-        if self.__hachage_calcule is None:
-            self.__hachage_calcule = self.__hashing_context.finalize()
-            self.__hashing_context = None
-        return self.__hachage_calcule
+        return self.__digests()[0]
+
+    def __digests(self) -> list:
+        if self.__hachages_calcules is None:
+            self.__hachages_calcules = [context.digest() for context in self.__hashing_contexts]
+            self.__hashing_contexts = None
+        return self.__hachages_calcules
 
     def verify(self) -> bool:
         """
-        Calcule le digest
-        :return: True si le hachage calcule correspond a celui fourni.
-        :raises ErreurHachage: Si le digest calcule ne correspond pas au hachage fourni
+        Calcule les digests
+        :return: True si tous les hachages calcules correspondent a ceux fournis.
+        :raises ErreurHachage: Si un digest calcule ne correspond pas au hachage fourni
         """
-        hachage_calcule = self.digest()
-        if hachage_calcule != self.__hachage_recu:
-            recu = base64.b64encode(self.__hachage_recu).decode('utf-8')
-            calcule = base64.b64encode(hachage_calcule).decode('utf-8')
-            raise ErreurHachage("Hachage different : recu %s != calcule %s" % (recu, calcule))
+        for hachage_recu, hachage_calcule in zip(self.__hachages_recus, self.__digests()):
+            if hachage_calcule != hachage_recu:
+                recu = base64.b64encode(hachage_recu).decode('utf-8')
+                calcule = base64.b64encode(hachage_calcule).decode('utf-8')
+                raise ErreurHachage("Hachage different : recu %s != calcule %s" % (recu, calcule))
 
         return True
 
@@ -121,11 +211,7 @@ def hacher_to_digest(valeur: Union[bytes, str], hashing_code: Union[int, str] =
     :return: bytes Digest calcule
     """
 
-    if isinstance(hashing_code, str):
-        hashing_code = HASH_CODES[hashing_code]
-
-    hashing_function = map_code_to_hashes(hashing_code)
-    context = hashes.Hash(hashing_function, backend=default_backend())
+    context = creer_contexte_hachage(hashing_code)
 
     if isinstance(valeur, str):
         valeur = valeur.encode('utf-8')
@@ -134,7 +220,7 @@ def hacher_to_digest(valeur: Union[bytes, str], hashing_code: Union[int, str] =
         pass
 
     context.update(valeur)
-    digest = context.finalize()
+    digest = context.digest()
 
     return digest
 
@@ -165,7 +251,7 @@ def verifier_hachage(hachage_multibase: str, valeur: Union[bytes, str]) -> bool:
     :return: True si le hachage calcule correspond a celui fourni.
     :raises ErreurHachage: Si le digest calcule ne correspond pas au hachage fourni
     """
-    mb = multibase.decode(hachage_multibase)
+    mb = decoder_multibase(hachage_multibase)
     mh = multihash.decode(mb)
     hachage_recu = mh.digest
     code = mh.code
@@ -178,6 +264,26 @@ def verifier_hachage(hachage_multibase: str, valeur: Union[bytes, str]) -> bool:
     return True
 
 
+def decoder_multibase(valeur: Union[str, bytes]) -> bytes:
+    """
+    Decode une valeur multibase. Le format base64 (prefixe m) est decode directement avec base64 (beaucoup plus
+    rapide), les autres formats sont delegues a multibase.
+    :param valeur: Valeur multibase
+    :return: Bytes decodes
+    """
+    if isinstance(valeur, bytes):
+        valeur = valeur.decode('utf-8')
+
+    if valeur[0:1] == 'm':
+        contenu = valeur[1:]
+        try:
+            return base64.b64decode(contenu + '=' * (-len(contenu) % 4), validate=True)
+        except binascii.Error:
+            raise ValueError('Valeur multibase base64 invalide')
+
+    return multibase.decode(valeur)
+
+
 def map_code_to_hashes(code: int) -> hashes.HashAlgorithm:
     """
     Fait correspondre un code multihash a un algorithme de hachage Cryptography
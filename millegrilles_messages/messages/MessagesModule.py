@@ -2,12 +2,15 @@
 DAO pour messages.
 """
 import asyncio
-import datetime
+import heapq
 import json
 import logging
+import time
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from threading import Event as EventThreading
-from typing import Optional, Union
+from typing import Callable, Optional, Union
 from uuid import uuid4
 
 from asyncio import Event
@@ -15,23 +18,44 @@ from asyncio.exceptions import TimeoutError
 
 from millegrilles_messages.messages.CleCertificat import CleCertificat
 from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat
+from millegrilles_messages.messages.FileAttente import FileAttente, POLITIQUE_BLOQUER
 from millegrilles_messages.messages.FormatteurMessages import FormatteurMessageMilleGrilles, SignateurTransactionSimple
-from millegrilles_messages.messages.ValidateurMessage import ValidateurMessage
+from millegrilles_messages.messages.ValidateurMessage import ValidateurMessage, verifier_message_processus
 from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificatRedis
 
 
 ATTENTE_MESSAGE_DUREE = 15  # Attente par defaut de 15 secondes
+NB_CORRELATIONS_MAX = 1000  # Nombre maximal de reponses en attente par defaut (reply-Q)
+TAILLE_FILE_EMISSION = 1000  # Nombre maximal de messages en attente d'emission par defaut
+
+
+def ordonnancement_routing_key(message) -> Optional[str]:
+    """
+    Cle d'ordonnancement par routing key pour RessourcesConsommation.cle_ordonnancement.
+    """
+    return message.routing_key
 
 
 class RessourcesConsommation:
 
     def __init__(self, callback, nom_queue: Optional[str] = None,
-                 channel_separe=False, est_asyncio=False, prefetch_count=1, auto_delete=False, exclusive=False, durable=False):
+                 channel_separe=False, est_asyncio=False, prefetch_count=1, auto_delete=False, exclusive=False, durable=False,
+                 verification_processus=False, concurrence=1,
+                 cle_ordonnancement: Optional[Callable[['MessageWrapper'], Optional[str]]] = None,
+                 nb_correlations_max=NB_CORRELATIONS_MAX):
         """
         Pour creer une reply-Q, laisser nom_queue vide.
         Pour configurer une nouvelle Q, inlcure une liste de routing_keys avec le nom de la Q.
         :param nom_queue:
         :param routing_keys:
+        :param verification_processus: Si True, la verification des messages (parse, hachage, signature) est
+                                        faite dans le pool de processus du module de messages.
+        :param concurrence: Nombre maximal de messages traites en parallele. Les messages sont ACK individuellement
+                            a la fin de leur traitement, prefetch_count borne donc les messages en memoire.
+        :param cle_ordonnancement: Fonction optionnelle qui retourne une cle pour un message (e.g. ordonnancement_routing_key).
+                                   Les messages avec la meme cle sont traites dans l'ordre de reception.
+        :param nb_correlations_max: Nombre maximal de reponses en attente (reply-Q). Au-dela, emettre_attendre
+                                    attend qu'une correlation se libere.
         """
         self.callback = callback
         self.q = nom_queue  # Param est vide, le nom de la Q va etre conserve lors de la creation de la reply-Q
@@ -44,6 +68,10 @@ class RessourcesConsommation:
         self.durable = durable
         self.auto_delete = auto_delete
         self.arguments: Optional[dict] = None
+        self.verification_processus = verification_processus
+        self.concurrence = max(concurrence or 1, 1)
+        self.cle_ordonnancement = cle_ordonnancement
+        self.nb_correlations_max = nb_correlations_max
 
     def ajouter_rk(self, exchange: str, rk: str):
         if self.rk is None:
@@ -104,6 +132,9 @@ class MessagesModule:
         self._validateur_certificats: Optional[ValidateurCertificatRedis] = None
         self._validateur_messages: Optional[ValidateurMessage] = None
 
+        # Pool de processus pour la verification des messages (optionnel, voir RessourcesConsommation)
+        self._executeur_verification: Optional[ProcessPoolExecutor] = None
+
         self.__event_loop = None
 
     async def __entretien_task(self):
@@ -159,6 +190,10 @@ class MessagesModule:
 
         await self._close()
 
+        if self._executeur_verification is not None:
+            self._executeur_verification.shutdown(wait=False, cancel_futures=True)
+            self._executeur_verification = None
+
     def ajouter_consumer(self, consumer, reply=False):  # Type MessageConsumer
         self._consumers.append(consumer)
         if reply is True:
@@ -185,6 +220,9 @@ class MessagesModule:
     def get_validateur_certificats(self):
         return self._validateur_certificats
 
+    def get_executeur_verification(self) -> Optional[ProcessPoolExecutor]:
+        return self._executeur_verification
+
     async def attendre_pret(self, max_delai=20):
         event_producer = self._producer.producer_pret()
         # event_producer.wait(max_delai)
@@ -235,26 +273,52 @@ class MessagePending:
         self.exchanges = exchanges
         self.headers = headers
 
+        # Future resolue lorsque le message est confirme par MQ (optionnel, voir MessageProducer.emettre)
+        self.confirmation: Optional[asyncio.Future] = None
+
+    def confirmer(self):
+        if self.confirmation is not None and not self.confirmation.done():
+            self.confirmation.set_result(True)
+
+    def rejeter(self, erreur: Exception):
+        if self.confirmation is not None and not self.confirmation.done():
+            self.confirmation.set_exception(erreur)
+
+
+class MessageNonConfirme(Exception):
+    """
+    Le message n'a pas ete confirme par MQ (nack ou channel ferme avant la confirmation).
+    """
+    pass
+
 
 class CorrelationReponse:
 
-    def __init__(self, correlation_id: str):
+    def __init__(self, correlation_id: str, timeout=ATTENTE_MESSAGE_DUREE):
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
         self.correlation_id = correlation_id
 
-        self.__creation = datetime.datetime.utcnow()
-        self.__duree_attente = ATTENTE_MESSAGE_DUREE
+        self.__creation = time.monotonic()
+        self.__duree_attente = timeout
+        self.expiration = self.__creation + timeout  # Temps monotonic, utilise par le consumer pour l'expiration
 
         self.consumer = None  # MessageConsumer
         self.__event_attente = Event()
         self.__reponse: Optional[MessageWrapper] = None
         self.__reponse_consommee = False
         self.__reponse_annulee = False
+        self.__reponse_expiree = False
 
     async def attendre_reponse(self, timeout=ATTENTE_MESSAGE_DUREE) -> MessageWrapper:
-        self.__duree_attente = timeout
+        if timeout != self.__duree_attente:
+            self.__duree_attente = timeout
+            self.expiration = self.__creation + timeout
+            if self.consumer is not None:
+                self.consumer.planifier_expiration(self)
         try:
             await asyncio.wait_for(self.__event_attente.wait(), timeout)
+            if self.__reponse_expiree:
+                raise TimeoutError()
             if self.__reponse_annulee:
                 raise Exception('Annulee')
         #except TimeoutError:
@@ -270,30 +334,35 @@ class CorrelationReponse:
         self.__event_attente.set()
 
     def est_expire(self):
-        duree_message = datetime.timedelta(seconds=self.__duree_attente)
-        if self.__reponse_consommee:
-            duree_message = duree_message * 3  # On donne un delai supplementaire si la reponse n'est pas consommee
-
-        date_expiration = datetime.datetime.utcnow() - duree_message
-
-        return self.__creation < date_expiration
+        return self.expiration <= time.monotonic()
 
     async def annulee(self):
+        self.annuler()
+
+    def annuler(self, expiree=False):
         if self.__reponse_consommee is False:
             self.__logger.debug("Correlation reponse %s annulee par le consumer" % self.correlation_id)
             self.__reponse_annulee = True
+            self.__reponse_expiree = expiree
             self.__event_attente.set()
 
 
 class MessageProducer:
 
-    def __init__(self, module_messages: MessagesModule):
+    def __init__(self, module_messages: MessagesModule,
+                 taille_file: Optional[int] = TAILLE_FILE_EMISSION, politique_file: str = POLITIQUE_BLOQUER):
+        """
+        :param taille_file: Nombre maximal de messages en attente d'emission, None pour aucune limite.
+        :param politique_file: POLITIQUE_BLOQUER (emettre attend) ou POLITIQUE_ERREUR (emettre lance
+                               FileAttentePleine) lorsque la file d'emission est pleine.
+        """
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
         self._module_messages = module_messages
 
         self._reply_consumer = None
         self._message_number = 0
-        self.__deliveries = list()  # Q d'emission de message, permet d'emettre via thread IO-LOOP
+        # Q d'emission de message, permet d'emettre via thread IO-LOOP
+        self.__deliveries = FileAttente(taille_file, politique_file)
 
         self.__loop = None
         self.__event_message: Optional[Event] = None
@@ -305,7 +374,13 @@ class MessageProducer:
         self._producer_pret = Event()
 
     async def emettre(self, message: Union[str, bytes], routing_key: str,
-                      exchanges: Optional[Union[str, list]] = None, correlation_id: str = None, reply_to: str = None):
+                      exchanges: Optional[Union[str, list]] = None, correlation_id: str = None, reply_to: str = None,
+                      attendre_confirmation=False):
+        """
+        :param attendre_confirmation: Si True, attend la confirmation de MQ (publisher confirms) pour ce message.
+                                      Sans le mode confirmation du producer, retourne des que le message est publie.
+        :raises MessageNonConfirme: Le message a ete rejete par MQ.
+        """
 
         if not self._producer_pret.is_set():
             raise Exception("Producer n'est pas pret (utiliser message thread ou producer .producer_pret().wait()")
@@ -324,12 +399,18 @@ class MessageProducer:
                 reply_to = self._reply_consumer.get_ressources().q
 
         pending = MessagePending(message, routing_key, exchanges, reply_to, correlation_id)
-        self.__deliveries.append(pending)
+        if attendre_confirmation is True:
+            pending.confirmation = asyncio.get_running_loop().create_future()
+
+        await self.__deliveries.ajouter_attendre(pending, ATTENTE_MESSAGE_DUREE)
 
         # Notifier thread en await
         # self.__loop.call_soon_threadsafe(self.__event_message.set)
         self.__event_message.set()
 
+        if pending.confirmation is not None:
+            await asyncio.wait_for(pending.confirmation, ATTENTE_MESSAGE_DUREE)
+
     async def emettre_attendre(self, message: Union[str, bytes], routing_key: str,
                                exchange: Optional[str] = None, correlation_id: str = None,
                                reply_to: str = None, timeout=ATTENTE_MESSAGE_DUREE):
@@ -340,11 +421,16 @@ class MessageProducer:
             correlation_id = str(uuid4())
 
         # Conserver reference a la correlation
-        correlation_reponse = CorrelationReponse(correlation_id)
+        correlation_reponse = CorrelationReponse(correlation_id, timeout)
         await self._module_messages.get_reply_consumer().ajouter_attendre_reponse(correlation_reponse)
 
         # Emettre le message
-        await self.emettre(message, routing_key, exchange, correlation_id, reply_to)
+        try:
+            await self.emettre(message, routing_key, exchange, correlation_id, reply_to)
+        except Exception as e:
+            # Liberer la correlation immediatement (sinon conservee jusqu'a l'expiration)
+            await self._module_messages.get_reply_consumer().retirer_correlation(correlation_id)
+            raise e
 
         # Attendre la reponse. raises TimeoutError
         reponse = await correlation_reponse.attendre_reponse(timeout)
@@ -360,9 +446,13 @@ class MessageProducer:
         try:
             while self.__actif:
                 while len(self.__deliveries) > 0:
-                    message = self.__deliveries.pop(0)
+                    message = self.__deliveries.retirer()
                     self.__logger.debug("producer : send message %s" % message)
-                    await self.send(message)
+                    try:
+                        await self.send(message)
+                    except Exception as e:
+                        message.rejeter(e)
+                        raise e
 
                 self._event_q_prete.set()  # Debloque reception de messages
 
@@ -393,14 +483,18 @@ class MessageProducer:
     def producer_pret(self) -> Event:
         return self._producer_pret
 
+    def get_statistiques_file(self) -> dict:
+        return self.__deliveries.get_statistiques()
+
 
 class MessageProducerFormatteur(MessageProducer):
     """
     Produceur qui formatte le message a emettre.
     """
 
-    def __init__(self, module_messages: MessagesModule, clecert: CleCertificat):
-        super().__init__(module_messages)
+    def __init__(self, module_messages: MessagesModule, clecert: CleCertificat,
+                 taille_file: Optional[int] = TAILLE_FILE_EMISSION, politique_file: str = POLITIQUE_BLOQUER):
+        super().__init__(module_messages, taille_file, politique_file)
         self.__formatteur_messages: FormatteurMessageMilleGrilles = \
             MessageProducerFormatteur.__preparer_formatteur(clecert)
 
@@ -415,44 +509,34 @@ class MessageProducerFormatteur(MessageProducer):
                                 partition: Optional[str] = None, exchanges: Union[str, list] = None, version=1,
                                 reply_to=None):
 
-        message, uuid_message = self.__formatteur_messages.signer_message(
-            evenement, domaine, version, action=action, partition=partition)
+        gabarit = self.__formatteur_messages.get_gabarit('evenement', domaine, action, partition, version, exchanges)
+        message, uuid_message, message_bytes = self.__formatteur_messages.signer_message_gabarit(evenement, gabarit)
 
         correlation_id = str(uuid_message)
 
-        rk = ['evenement', domaine]
-        if partition is not None:
-            rk.append(partition)
-        rk.append(action)
-
-        message_bytes = json.dumps(message)
-
-        await self.emettre(message_bytes, '.'.join(rk), exchanges, correlation_id, reply_to)
+        await self.emettre(message_bytes, gabarit.routing_key, gabarit.exchanges, correlation_id, reply_to)
 
     async def executer_commande(self, commande: dict, domaine: str, action: str, exchange: str,
                                 partition: Optional[str] = None, version=1,
-                                reply_to=None, nowait=False, noformat=False, timeout=15) -> Optional[MessageWrapper]:
+                                reply_to=None, nowait=False, noformat=False, timeout=15,
+                                attendre_confirmation=False) -> Optional[MessageWrapper]:
+
+        gabarit = self.__formatteur_messages.get_gabarit('commande', domaine, action, partition, version, exchange)
 
         if noformat is True:
-            message = commande
             uuid_message = commande['en-tete']['uuid_transaction']
+            message_bytes = json.dumps(commande)
         else:
-            message, uuid_message = self.__formatteur_messages.signer_message(
-                commande, domaine, version, action=action, partition=partition)
+            _message, uuid_message, message_bytes = self.__formatteur_messages.signer_message_gabarit(
+                commande, gabarit)
 
         correlation_id = str(uuid_message)
 
-        rk = ['commande', domaine]
-        if partition is not None:
-            rk.append(partition)
-        rk.append(action)
-
-        message_bytes = json.dumps(message)
-
         if nowait is True:
-            await self.emettre(message_bytes, '.'.join(rk), exchanges=exchange, correlation_id=correlation_id)
+            await self.emettre(message_bytes, gabarit.routing_key, exchanges=exchange, correlation_id=correlation_id,
+                               attendre_confirmation=attendre_confirmation)
         else:
-            reponse = await self.emettre_attendre(message_bytes, '.'.join(rk),
+            reponse = await self.emettre_attendre(message_bytes, gabarit.routing_key,
                                                   exchange=exchange, correlation_id=correlation_id, reply_to=reply_to,
                                                   timeout=timeout)
             return reponse
@@ -461,43 +545,57 @@ class MessageProducerFormatteur(MessageProducer):
                                partition: Optional[str] = None, version=1,
                                reply_to=None, timeout=ATTENTE_MESSAGE_DUREE) -> MessageWrapper:
 
-        message, uuid_message = self.__formatteur_messages.signer_message(
-            requete, domaine, version, action=action, partition=partition)
+        gabarit = self.__formatteur_messages.get_gabarit('requete', domaine, action, partition, version, exchange)
+        _message, uuid_message, message_bytes = self.__formatteur_messages.signer_message_gabarit(requete, gabarit)
 
         correlation_id = str(uuid_message)
 
-        rk = ['requete', domaine]
-        if partition is not None:
-            rk.append(partition)
-        rk.append(action)
-
-        message_bytes = json.dumps(message)
-
-        reponse = await self.emettre_attendre(message_bytes, '.'.join(rk),
+        reponse = await self.emettre_attendre(message_bytes, gabarit.routing_key,
                                               exchange=exchange, correlation_id=correlation_id,
                                               reply_to=reply_to, timeout=timeout)
         return reponse
 
+    async def executer_requetes_concurrentes(self, requetes: list, max_inflight=20,
+                                             timeout=ATTENTE_MESSAGE_DUREE) -> list:
+        """
+        Execute plusieurs requetes en parallele, au plus max_inflight a la fois.
+        :param requetes: Liste de dict avec les parametres de executer_requete (requete, domaine, action, exchange,
+                         partition, version).
+        :param max_inflight: Nombre maximal de requetes en attente de reponse.
+        :return: Reponses (MessageWrapper) dans l'ordre des requetes. Une requete en erreur retourne l'exception.
+        """
+        semaphore = asyncio.Semaphore(max_inflight)
+
+        async def executer(params: dict):
+            async with semaphore:
+                try:
+                    return await self.executer_requete(timeout=timeout, **params)
+                except Exception as e:
+                    return e
+
+        return await asyncio.gather(*[executer(r) for r in requetes])
+
     async def soumettre_transaction(self, transaction: dict, domaine: str, action: str, exchange: str,
                                     partition: Optional[str] = None, version=1,
-                                    reply_to=None, nowait=False):
+                                    reply_to=None, nowait=False, attendre_confirmation=False):
+        """
+        :param nowait: Si True, n'attend pas la reponse du domaine.
+        :param attendre_confirmation: Avec nowait, attend la confirmation de reception par MQ.
+        """
 
-        message, uuid_message = self.__formatteur_messages.signer_message(
-            transaction, domaine, version, action=action, partition=partition)
+        gabarit = self.__formatteur_messages.get_gabarit('transaction', domaine, action, partition, version, exchange)
+        _message, uuid_message, message_bytes = self.__formatteur_messages.signer_message_gabarit(
+            transaction, gabarit)
 
         correlation_id = str(uuid_message)
 
-        rk = ['transaction', domaine]
-        if partition is not None:
-            rk.append(partition)
-        rk.append(action)
-
-        message_bytes = json.dumps(message)
-
         if nowait is not True:
-            reponse = await self.emettre_attendre(message_bytes, '.'.join(rk),
+            reponse = await self.emettre_attendre(message_bytes, gabarit.routing_key,
                                                   exchange=exchange, correlation_id=correlation_id, reply_to=reply_to)
             return reponse
+        else:
+            await self.emettre(message_bytes, gabarit.routing_key, exchange, correlation_id, reply_to,
+                               attendre_confirmation=attendre_confirmation)
 
     async def repondre(self, reponse: dict, reply_to, correlation_id, version=1):
         message, uuid_message = self.__formatteur_messages.signer_message(reponse, version=version)
@@ -516,18 +614,25 @@ class MessageConsumer:
         self._module_messages = module_messages
         self._ressources = ressources
 
-        self.__NB_ATTENTE_MAX = 10  # Nombre maximal de reponses en attente
+        # Admission des correlations (reponses en attente), FIFO
+        self.__semaphore_correlations: Optional[asyncio.Semaphore] = None
+
+        # Expiration des correlations : heap de (expiration monotonic, sequence, correlation_id) et un timer
+        # sur la prochaine expiration. Les entrees retirees ou replanifiees sont ignorees au moment du pop.
+        self.__expirations = list()
+        self.__sequence_expiration = 0
+        self.__timer_expiration: Optional[asyncio.TimerHandle] = None
+        self.__prochaine_expiration: Optional[float] = None
 
         # self._consuming = False
         self.__loop = None
         self._event_channel: Optional[Event] = None
         self._event_consumer: Optional[Event] = None
         self._event_message: Optional[Event] = None
-        self._event_correlation_pret: Optional[Event] = None
         self._stop_event: Optional[Event] = None
 
-        # Q de messages en memoire
-        self._messages = list()
+        # Q de messages en memoire. Pas de limite, le nombre de messages recus est borne par prefetch_count.
+        self._messages = FileAttente()
 
         self._consumer_pret = Event()
 
@@ -549,7 +654,6 @@ class MessageConsumer:
         self._event_consumer = Event()
         self._event_message = Event()
         self._stop_event = Event()
-        self._event_correlation_pret = Event()
 
         # Attente ressources
         await self._event_channel.wait()
@@ -567,33 +671,136 @@ class MessageConsumer:
         self.__logger.info("Arret consumer %s" % self._module_messages)
 
     async def __traiter_messages(self):
+        if self._ressources.concurrence > 1:
+            return await self.__traiter_messages_concurrents()
+
         while self._event_consumer.is_set():
             self._event_message.clear()
             # Traiter messages
             while len(self._messages) > 0:
-                message = self._messages.pop(0)
+                message = self._messages.retirer()
                 await self.__traiter_message(message)
             await self._event_message.wait()
 
-    async def __entretien(self):
+    async def __traiter_messages_concurrents(self):
+        """
+        Traite jusqu'a concurrence messages en parallele. Chaque message est ACK a la fin de son traitement.
+        Les messages qui partagent une cle d'ordonnancement sont mis dans une file traitee par une seule tache.
+        """
+        concurrence = self._ressources.concurrence
+        if concurrence > self._ressources.prefetch_count:
+            self.__logger.warning("concurrence (%d) > prefetch_count (%d), la concurrence effective est limitee" % (
+                concurrence, self._ressources.prefetch_count))
+
+        semaphore = asyncio.Semaphore(concurrence)
+        cle_ordonnancement = self._ressources.cle_ordonnancement
+        files_ordonnancement = dict()  # [cle] = deque(), messages en attente derriere la tache active de la cle
+        taches = set()
+
         while self._event_consumer.is_set():
+            self._event_message.clear()
+            while len(self._messages) > 0:
+                message = self._messages.retirer()
+
+                cle = None
+                if cle_ordonnancement is not None:
+                    cle = cle_ordonnancement(message)
+                    if cle is not None:
+                        file_cle = files_ordonnancement.get(cle)
+                        if file_cle is not None:
+                            # Une tache traite deja cette cle, elle va prendre le message a la suite
+                            file_cle.append(message)
+                            continue
+                        files_ordonnancement[cle] = deque()
+
+                await semaphore.acquire()
+                tache = asyncio.create_task(
+                    self.__traiter_sequence(message, cle, files_ordonnancement, semaphore))
+                taches.add(tache)
+                tache.add_done_callback(taches.discard)
 
-            if self._correlation_reponse is not None:
-                correlations = list(self._correlation_reponse.values())
-                for corr in correlations:
-                    if corr.est_expire():
-                        correlation_id = corr.correlation_id
-                        del self._correlation_reponse[correlation_id]
-                        await corr.annulee()
+            await self._event_message.wait()
 
-            try:
-                await asyncio.wait_for(self._stop_event.wait(), 30)
-            except TimeoutError:
-                pass
+        if len(taches) > 0:
+            await asyncio.wait(taches)
+
+    async def __traiter_sequence(self, message: MessageWrapper, cle: Optional[str],
+                                 files_ordonnancement: dict, semaphore: asyncio.Semaphore):
+        try:
+            while message is not None:
+                try:
+                    await self.__traiter_message(message)
+                except Exception:
+                    self.__logger.exception("Erreur traitement message %s" % message.routing_key)
+
+                message = None
+                if cle is not None:
+                    file_cle = files_ordonnancement[cle]
+                    if len(file_cle) > 0:
+                        message = file_cle.popleft()
+                    else:
+                        del files_ordonnancement[cle]
+        finally:
+            semaphore.release()
+
+    async def __entretien(self):
+        # L'expiration des correlations est planifiee (voir planifier_expiration), attendre l'arret
+        await self._stop_event.wait()
+
+        if self.__timer_expiration is not None:
+            self.__timer_expiration.cancel()
+            self.__timer_expiration = None
+
+    def planifier_expiration(self, correlation: CorrelationReponse):
+        """
+        Ajoute (ou replanifie) l'expiration d'une correlation. O(log n).
+        """
+        if len(self.__expirations) > 2 * len(self._correlation_reponse) + 64:
+            # Compacter les entrees retirees
+            self.__expirations = [e for e in self.__expirations
+                                  if self._correlation_reponse.get(e[2]) is not None
+                                  and self._correlation_reponse[e[2]].expiration == e[0]]
+            heapq.heapify(self.__expirations)
+
+        self.__sequence_expiration += 1
+        heapq.heappush(self.__expirations,
+                       (correlation.expiration, self.__sequence_expiration, correlation.correlation_id))
+
+        if self.__prochaine_expiration is None or correlation.expiration < self.__prochaine_expiration:
+            self.__armer_timer_expiration()
+
+    def __armer_timer_expiration(self):
+        if self.__timer_expiration is not None:
+            self.__timer_expiration.cancel()
+            self.__timer_expiration = None
+            self.__prochaine_expiration = None
+
+        if len(self.__expirations) > 0:
+            expiration = self.__expirations[0][0]
+            delai = max(expiration - time.monotonic(), 0)
+            self.__prochaine_expiration = expiration
+            self.__timer_expiration = asyncio.get_event_loop().call_later(delai, self.__expirer_correlations)
+
+    def __expirer_correlations(self):
+        self.__timer_expiration = None
+        self.__prochaine_expiration = None
+
+        maintenant = time.monotonic()
+        while len(self.__expirations) > 0 and self.__expirations[0][0] <= maintenant:
+            expiration, _sequence, correlation_id = heapq.heappop(self.__expirations)
+            correlation = self._correlation_reponse.get(correlation_id)
+            if correlation is None or correlation.expiration != expiration:
+                continue  # Correlation deja retiree ou replanifiee
+
+            del self._correlation_reponse[correlation_id]
+            self.__semaphore_correlations.release()
+            correlation.annuler(expiree=True)
+
+        self.__armer_timer_expiration()
 
     def recevoir_message(self, message: MessageWrapper):
         self.__logger.debug("recevoir_message")
-        self._messages.append(message)
+        self._messages.ajouter(message)
 
         # call_soon_threadsafe permet d'interagir avec asyncio a partir d'une thread externe
         # Requis pour demarrer le traitement des messages immediatement
@@ -617,8 +824,7 @@ class MessageConsumer:
                 try:
                     corr_reponse = self._correlation_reponse[correlation_id]
                     del self._correlation_reponse[correlation_id]  # Cleanup
-                    if not self._event_correlation_pret.is_set():
-                        self._event_correlation_pret.set()
+                    self.__semaphore_correlations.release()
                     await corr_reponse.recevoir_reponse(message)
                     return  # Termine
                 except KeyError:
@@ -644,26 +850,33 @@ class MessageConsumer:
     def consumer_pret(self) -> Event:
         return self._consumer_pret
 
+    def get_nombre_correlations(self) -> int:
+        if self._correlation_reponse is None:
+            return 0
+        return len(self._correlation_reponse)
+
+    def get_statistiques_file(self) -> dict:
+        return self._messages.get_statistiques()
+
     async def ajouter_attendre_reponse(self, correlation_reponse: CorrelationReponse):
         if self._correlation_reponse is None:
             self._correlation_reponse = dict()
+            self.__semaphore_correlations = asyncio.Semaphore(self._ressources.nb_correlations_max)
 
-        if len(self._correlation_reponse) > self.__NB_ATTENTE_MAX:
-            self._event_correlation_pret.clear()
-            await asyncio.wait_for(self._event_correlation_pret.wait(), 15)
-
-            if len(self._correlation_reponse) > self.__NB_ATTENTE_MAX:
-                raise Exception('Nombre de correlations maximal atteint')
+        try:
+            await asyncio.wait_for(self.__semaphore_correlations.acquire(), ATTENTE_MESSAGE_DUREE)
+        except TimeoutError:
+            raise Exception('Nombre de correlations maximal atteint')
 
         correlation_reponse.consumer = self
         self._correlation_reponse[correlation_reponse.correlation_id] = correlation_reponse
+        self.planifier_expiration(correlation_reponse)
 
     async def retirer_correlation(self, correlation_id: str):
         try:
             correlation = self._correlation_reponse[correlation_id]
             del self._correlation_reponse[correlation_id]
-            if not self._event_correlation_pret.is_set():
-                self._event_correlation_pret.set()
+            self.__semaphore_correlations.release()
             await correlation.annulee()
         except KeyError:
             pass
@@ -676,6 +889,14 @@ class MessageConsumerVerificateur(MessageConsumer):
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
 
     async def _traiter_message(self, message: MessageWrapper):
+        executeur = None
+        if self._ressources.verification_processus is True:
+            executeur = self._module_messages.get_executeur_verification()
+
+        if executeur is not None:
+            await self.__traiter_message_processus(message, executeur)
+            return
+
         parsed = json.loads(message.contenu)
         message.parsed = parsed
 
@@ -691,3 +912,22 @@ class MessageConsumerVerificateur(MessageConsumer):
         except:
             # Message invalide
             self.__logger.exception("Erreur traitement message %s" % message.routing_key)
+
+    async def __traiter_message_processus(self, message: MessageWrapper, executeur: ProcessPoolExecutor):
+        loop = asyncio.get_running_loop()
+        try:
+            # Parse, hachage et signature dans le pool de processus
+            parsed, _fingerprint, digest_signature, signature_verifiee = await loop.run_in_executor(
+                executeur, verifier_message_processus, message.contenu)
+            message.parsed = parsed
+
+            # Validation du certificat (confiance) dans le processus principal
+            enveloppe_certificat = await self._module_messages.get_validateur_messages().\
+                completer_verification_processus(parsed, digest_signature, signature_verifiee)
+            message.certificat = enveloppe_certificat
+            message.est_valide = True
+            # Message OK
+            await super()._traiter_message(message)
+        except:
+            # Message invalide
+            self.__logger.exception("Erreur traitement message %s" % message.routing_key)
@@ -15,6 +15,13 @@ CONST_MQ_PARAMS = [
     Constantes.ENV_MQ_RETRY_DELAY,
     Constantes.ENV_MQ_HEARTBEAT,
     Constantes.ENV_MQ_BLOCKED_CONNECTION_TIMEOUT,
+    Constantes.ENV_MQ_VERIFICATION_WORKERS,
+    Constantes.ENV_MQ_TAILLE_FILE_EMISSION,
+    Constantes.ENV_MQ_POLITIQUE_FILE_EMISSION,
+    Constantes.ENV_MQ_CONFIRMATIONS,
+    Constantes.ENV_MQ_FENETRE_CONFIRMATIONS,
+    Constantes.ENV_CERTIFICATS_CACHE_PATH,
+    Constantes.ENV_CERTIFICATS_CACHE_MAX,
 ]
 
 CONST_REDIS_PARAMS = [
@@ -48,6 +55,13 @@ class ConfigurationPika:
         self.retry_delay = 10
         self.heartbeat = 30
         self.blocked_connection_timeout = 10
+        self.verification_workers: Optional[int] = None  # None : nombre de CPUs
+        self.taille_file_emission: Optional[int] = 1000  # 0 : aucune limite
+        self.politique_file_emission = 'bloquer'  # bloquer ou erreur
+        self.confirmations = False  # Publisher confirms sur le channel du producer
+        self.fenetre_confirmations = 256  # Nombre maximal de messages publies non confirmes
+        self.certificats_cache_path: Optional[str] = None  # Fichier sqlite, None : aucun stockage persistant
+        self.certificats_cache_max = 10000
 
     def get_env(self) -> dict:
         """
@@ -88,6 +102,29 @@ class ConfigurationPika:
         self.blocked_connection_timeout = dict_params.get(
             Constantes.ENV_MQ_BLOCKED_CONNECTION_TIMEOUT) or self.blocked_connection_timeout
 
+        verification_workers = dict_params.get(Constantes.ENV_MQ_VERIFICATION_WORKERS)
+        if verification_workers is not None:
+            self.verification_workers = int(verification_workers)
+
+        taille_file_emission = dict_params.get(Constantes.ENV_MQ_TAILLE_FILE_EMISSION)
+        if taille_file_emission is not None:
+            self.taille_file_emission = int(taille_file_emission) or None
+        self.politique_file_emission = dict_params.get(
+            Constantes.ENV_MQ_POLITIQUE_FILE_EMISSION) or self.politique_file_emission
+
+        confirmations = dict_params.get(Constantes.ENV_MQ_CONFIRMATIONS)
+        if confirmations is not None:
+            self.confirmations = str(confirmations).lower() in ['true', '1']
+        fenetre_confirmations = dict_params.get(Constantes.ENV_MQ_FENETRE_CONFIRMATIONS)
+        if fenetre_confirmations is not None:
+            self.fenetre_confirmations = int(fenetre_confirmations)
+
+        self.certificats_cache_path = dict_params.get(
+            Constantes.ENV_CERTIFICATS_CACHE_PATH) or self.certificats_cache_path
+        certificats_cache_max = dict_params.get(Constantes.ENV_CERTIFICATS_CACHE_MAX)
+        if certificats_cache_max is not None:
+            self.certificats_cache_max = int(certificats_cache_max)
+
     def __str__(self):
         return 'ConfigurationPika %s:%s' % (self.hostname, self.port)
 
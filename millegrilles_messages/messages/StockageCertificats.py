@@ -0,0 +1,120 @@
+"""
+Stockage persistant (sqlite) des chaines de certificats, conserve entre les redemarrages.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from os import makedirs, path
+from typing import Optional
+
+
+TAILLE_MAX_DEFAUT = 10000
+
+
+class StockageCertificats:
+    """
+    Stockage des chaines PEM par fingerprint dans une base sqlite locale.
+
+    Le nombre de certificats est limite a taille_max, les certificats les moins recemment utilises sont retires.
+    La date d'acces est conservee a la seconde pres pour eviter une ecriture a chaque lecture.
+    Les methodes sont bloquantes (disque), elles peuvent etre appelees a partir de threads (asyncio.to_thread).
+    """
+
+    def __init__(self, path_db: str, taille_max: int = TAILLE_MAX_DEFAUT):
+        """
+        :param path_db: Fichier sqlite (cree au besoin).
+        :param taille_max: Nombre maximal de certificats conserves.
+        """
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.__path_db = path_db
+        self.__taille_max = taille_max
+        self.__lock = threading.Lock()
+
+        repertoire = path.dirname(path_db)
+        if repertoire != '':
+            makedirs(repertoire, mode=0o700, exist_ok=True)
+
+        self.__connexion = sqlite3.connect(path_db, isolation_level=None, check_same_thread=False)
+        self.__connexion.execute('PRAGMA journal_mode=WAL')
+        self.__connexion.execute('PRAGMA synchronous=NORMAL')
+        self.__connexion.execute("""
+            CREATE TABLE IF NOT EXISTS certificats (
+                fingerprint TEXT PRIMARY KEY,
+                pems TEXT NOT NULL,
+                date_acces INTEGER NOT NULL
+            )
+        """)
+        self.__connexion.execute('CREATE INDEX IF NOT EXISTS certificats_date_acces ON certificats (date_acces)')
+
+        self.__nombre = self.__connexion.execute('SELECT count(*) FROM certificats').fetchone()[0]
+
+    def fermer(self):
+        with self.__lock:
+            self.__connexion.close()
+
+    def __len__(self):
+        return self.__nombre
+
+    @property
+    def taille_max(self) -> int:
+        return self.__taille_max
+
+    def get(self, fingerprint: str) -> Optional[list]:
+        """
+        :return: Chaine PEM du certificat, None si inconnu.
+        """
+        with self.__lock:
+            ligne = self.__connexion.execute(
+                'SELECT pems, date_acces FROM certificats WHERE fingerprint = ?', (fingerprint,)).fetchone()
+            if ligne is None:
+                return None
+
+            pems, date_acces = ligne
+            maintenant = int(time.time())
+            if date_acces != maintenant:
+                self.__connexion.execute(
+                    'UPDATE certificats SET date_acces = ? WHERE fingerprint = ?', (maintenant, fingerprint))
+
+        return json.loads(pems)
+
+    def put(self, fingerprint: str, pems: list):
+        """
+        Conserve la chaine PEM d'un certificat. Retire les certificats les moins recemment utilises si la taille
+        maximale est depassee.
+        """
+        with self.__lock:
+            curseur = self.__connexion.execute(
+                'INSERT OR IGNORE INTO certificats (fingerprint, pems, date_acces) VALUES (?, ?, ?)',
+                (fingerprint, json.dumps(pems), int(time.time())))
+            self.__nombre += curseur.rowcount
+
+            if self.__nombre > self.__taille_max:
+                self.__retirer_anciens()
+
+    def retirer(self, fingerprint: str):
+        with self.__lock:
+            curseur = self.__connexion.execute('DELETE FROM certificats WHERE fingerprint = ?', (fingerprint,))
+            self.__nombre -= curseur.rowcount
+
+    def get_recents(self, limite: int) -> list:
+        """
+        :return: Liste de (fingerprint, pems) des certificats les plus recemment utilises.
+        """
+        with self.__lock:
+            lignes = self.__connexion.execute(
+                'SELECT fingerprint, pems FROM certificats ORDER BY date_acces DESC LIMIT ?', (limite,)).fetchall()
+        return [(fingerprint, json.loads(pems)) for fingerprint, pems in lignes]
+
+    def __retirer_anciens(self):
+        # Retirer 10% de plus que necessaire pour ne pas nettoyer a chaque ajout
+        nombre = self.__nombre - self.__taille_max + max(1, self.__taille_max // 10)
+        curseur = self.__connexion.execute("""
+            DELETE FROM certificats WHERE fingerprint IN (
+                SELECT fingerprint FROM certificats ORDER BY date_acces LIMIT ?
+            )
+        """, (nombre,))
+        self.__nombre -= curseur.rowcount
+        self.__logger.debug("Retrait de %d certificats du stockage %s" % (curseur.rowcount, self.__path_db))
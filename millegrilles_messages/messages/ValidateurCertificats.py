@@ -1,24 +1,43 @@
 # Module de validation des certificats (X.509) et des messages avec _signature
+import asyncio
 import datetime
 import json
 import logging
+import time
 from asyncio import TimeoutError
 
 import OpenSSL
+import pytz
 
 from asyncio.exceptions import TimeoutError
 from typing import Optional, Union
 
 import redis.asyncio as redis
 
+from cryptography.x509 import load_pem_x509_certificate
+
 from millegrilles_messages.messages import Constantes
-from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat
+from millegrilles_messages.messages.CacheLru import CacheLru
+from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat, calculer_fingerprint
 from millegrilles_messages.messages.ParamsEnvironnement import ConfigurationRedis
+from millegrilles_messages.messages.StockageCertificats import StockageCertificats
 
 
 CACHE_TTL_SECS = 300
-CACHE_MAX_ENTRIES = 100
+CACHE_MAX_ENTRIES = 500
+CACHE_INCONNUS_TTL_SECS = 30
+CACHE_INCONNUS_MAX_ENTRIES = 1000
 REDIS_TTL_SECS = 48 * 60 * 60
+REDIS_PRESENCE_TTL_SECS = 15 * 60
+STOCKAGE_PRESENCE_TTL_SECS = 15 * 60
+REDIS_PREFIXE_CERTIFICAT = 'certificat_v1:'
+INTERMEDIAIRES_MAX = 100
+STORES_DATES_MAX = 64
+STORE_DATE_BUCKET_SECS = 3600
+
+# Code d'erreur OpenSSL (X509_V_ERR_CERT_NOT_YET_VALID, X509_V_ERR_CERT_HAS_EXPIRED)
+X509_V_ERR_CERT_NOT_YET_VALID = 9
+X509_V_ERR_CERT_HAS_EXPIRED = 10
 
 
 class CertificatInconnu(Exception):
@@ -44,6 +63,14 @@ class CertificatInconnu(Exception):
         return 'CertificatInconnu %s : %s' % (self.__fingerprint, super().__str__)
 
 
+class CertificatIndisponible(CertificatInconnu):
+    """
+    Le certificat n'a pas pu etre charge (timeout MQ/CorePki, reponse invalide). Erreur transitoire, contrairement
+    a CertificatInconnu elle n'est pas conservee dans le cache negatif.
+    """
+    pass
+
+
 class IdmgInvalide(Exception):
     pass
 
@@ -58,12 +85,20 @@ class ValidateurCertificat:
         self.__enveloppe_ca = enveloppe_ca
 
         self.__idmg = enveloppe_ca.idmg
-        self.__store = OpenSSL.crypto.X509Store()
 
         certificat_millegrille_pem = enveloppe_ca.certificat_pem
         self.__root_cert_openssl = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM,
                                                                    certificat_millegrille_pem)
-        self.__store.add_cert(self.__root_cert_openssl)
+        self.__root_validite = (enveloppe_ca.not_valid_before, enveloppe_ca.not_valid_after)
+
+        # Certificats intermediaires parses, [pem] = CertificatIntermediaire
+        self.__intermediaires = CacheLru(INTERMEDIAIRES_MAX)
+        # Intermediaires verifies avec le root, ajoutes comme ancres aux stores. [fingerprint] = X509
+        self.__intermediaires_verifies = dict()
+
+        self.__store = self.__creer_store()
+        # Stores pour validation a une date de reference, [debut bucket (secs)] = X509Store
+        self.__stores_dates = CacheLru(STORES_DATES_MAX)
 
         # Producer, permet de faire des requetes pour certificats inconnus
         self.__producer_messages = None
@@ -112,25 +147,40 @@ class ValidateurCertificat:
             raise IdmgInvalide('IDMG invalide')
 
         try:
-            if enveloppe.est_verifie and date_reference is None and (idmg is None or idmg == self.__idmg):
+            if enveloppe.est_verifie and date_reference is None and (idmg is None or idmg == self.__idmg) and \
+                    enveloppe.idmg == self.__idmg:
                 # Raccourci, l'enveloppe a deja ete validee (e.g. cache) et on n'a aucune
-                # validation conditionnelle par date ou idmg
+                # validation conditionnelle par date ou idmg. Les enveloppes sont partagees (from_pem), le
+                # idmg confirme que la validation a ete faite avec le meme certificat de millegrille.
                 return True
         except AttributeError:
             pass  # Ok, le certificat n'est pas connu ou dans le cache
 
-        store = self.__preparer_store(date_reference)
+        if date_reference is not None and date_reference.tzinfo is None:
+            date_reference = pytz.utc.localize(date_reference)
 
         chaine_pem = enveloppe.chaine_pem()
 
-        chaine = [OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, cert) for cert in chaine_pem]
-        cert = chaine.pop(0)
+        cert = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, chaine_pem[0])
+        intermediaires = [self.__charger_intermediaire(pem) for pem in chaine_pem[1:]]
 
-        store_ctx = OpenSSL.crypto.X509StoreContext(store, cert, chaine)
+        # Dates verifiees ici pour toute la chaine : le store d'une date de reference est partage par bucket
+        self.__verifier_dates(cert, enveloppe, intermediaires, date_reference)
+
+        chaine = [i.certificat for i in intermediaires]
+        store = self.__preparer_store(date_reference)
         try:
-            store_ctx.verify_certificate()
+            OpenSSL.crypto.X509StoreContext(store, cert, chaine).verify_certificate()
         except OpenSSL.crypto.X509StoreContextError as ce:
-            raise ce
+            if store is self.__store:
+                raise ce
+            # Le debut du bucket peut preceder l'emission d'un certificat, valider a la date exacte
+            store = self.__creer_store(date_reference)
+            OpenSSL.crypto.X509StoreContext(store, cert, chaine).verify_certificate()
+
+        for intermediaire in intermediaires:
+            if intermediaire.fingerprint not in self.__intermediaires_verifies:
+                self.__verifier_intermediaire(intermediaire)
 
         if date_reference is None and (idmg is None or idmg == self.__idmg):
             # Validation completee, certificat est valide (sinon OpenSSL.crypto.X509StoreContextError est lancee)
@@ -138,15 +188,69 @@ class ValidateurCertificat:
 
         return True
 
+    def __charger_intermediaire(self, pem: str) -> 'CertificatIntermediaire':
+        intermediaire = self.__intermediaires.get(pem)
+        if intermediaire is None:
+            intermediaire = CertificatIntermediaire(pem)
+            self.__intermediaires.put(pem, intermediaire)
+        return intermediaire
+
+    def __verifier_intermediaire(self, intermediaire: 'CertificatIntermediaire'):
+        """
+        Verifie l'intermediaire avec le root seulement. S'il est valide, il est ajoute comme ancre aux stores
+        (la verification des certificats qu'il a signe s'arrete a l'intermediaire).
+        """
+        store = OpenSSL.crypto.X509Store()
+        store.add_cert(self.__root_cert_openssl)
+        try:
+            OpenSSL.crypto.X509StoreContext(store, intermediaire.certificat, []).verify_certificate()
+        except OpenSSL.crypto.X509StoreContextError:
+            self.__logger.debug("Intermediaire %s non valide pour la date courante" % intermediaire.fingerprint)
+            return
+
+        self.__intermediaires_verifies[intermediaire.fingerprint] = intermediaire.certificat
+        self.__store.add_cert(intermediaire.certificat)
+        self.__stores_dates.vider()
+
+    def __verifier_dates(self, cert: OpenSSL.crypto.X509, enveloppe: EnveloppeCertificat,
+                         intermediaires: list, date_reference: Optional[datetime.datetime]):
+        date_validation = date_reference or datetime.datetime.now(tz=pytz.utc)
+
+        validites = [(enveloppe.not_valid_before, enveloppe.not_valid_after)]
+        validites.extend([(i.not_valid_before, i.not_valid_after) for i in intermediaires])
+        validites.append(self.__root_validite)
+
+        for not_valid_before, not_valid_after in validites:
+            if date_validation < not_valid_before:
+                raise OpenSSL.crypto.X509StoreContextError(
+                    'certificate is not yet valid', [X509_V_ERR_CERT_NOT_YET_VALID, 0, 'certificate is not yet valid'],
+                    cert)
+            if date_validation > not_valid_after:
+                raise OpenSSL.crypto.X509StoreContextError(
+                    'certificate has expired', [X509_V_ERR_CERT_HAS_EXPIRED, 0, 'certificate has expired'], cert)
+
+    def __creer_store(self, date_reference: datetime.datetime = None) -> OpenSSL.crypto.X509Store:
+        store = OpenSSL.crypto.X509Store()
+        store.add_cert(self.__root_cert_openssl)
+        for intermediaire in self.__intermediaires_verifies.values():
+            store.add_cert(intermediaire)
+        # Les intermediaires verifies sont des ancres de confiance
+        store.set_flags(OpenSSL.crypto.X509StoreFlags.PARTIAL_CHAIN)
+        if date_reference is not None:
+            store.set_time(date_reference)
+        return store
+
     def __preparer_store(self, date_reference: datetime.datetime = None) -> OpenSSL.crypto.X509Store:
         if date_reference is None:
             return self.__store
-        else:
-            # Creer store avec date de validation differente
-            store = OpenSSL.crypto.X509Store()
-            store.add_cert(self.__root_cert_openssl)
-            store.set_time(date_reference)
-            return store
+
+        # Store memoize par bucket de date. Les dates exactes sont verifiees par __verifier_dates.
+        bucket = int(date_reference.timestamp()) // STORE_DATE_BUCKET_SECS * STORE_DATE_BUCKET_SECS
+        store = self.__stores_dates.get(bucket)
+        if store is None:
+            store = self.__creer_store(datetime.datetime.fromtimestamp(bucket, tz=pytz.utc))
+            self.__stores_dates.put(bucket, store)
+        return store
 
     async def fetch_certificat(self, fingerprint: str):
 
@@ -156,12 +260,14 @@ class ValidateurCertificat:
         await self.__producer_messages.producer_pret().wait()
 
         requete = {'fingerprint': fingerprint}
+        reponse_definitive = False  # Reponse explicite (ok: False ou autre certificat), sinon timeout/erreur
         try:
             reponse_certificat = await self.__producer_messages.executer_requete(
                 requete, 'CorePki', action='infoCertificat', exchange=Constantes.SECURITE_PUBLIC, timeout=3)
             parsed = reponse_certificat.parsed
             if parsed.get('ok') is not False:
                 return parsed['chaine_pem']
+            reponse_definitive = True
         except TimeoutError:
             self.__logger.debug("Timeout requete certificat %s, tentative requete directe" % fingerprint)
         except (KeyError, AttributeError):
@@ -176,26 +282,64 @@ class ValidateurCertificat:
                 if enveloppe.fingerprint == fingerprint:
                     pems = enveloppe.chaine_pem
                     return pems
+            reponse_definitive = True
         except TimeoutError:
             pass
         except (KeyError, AttributeError):
             self.__logger.exception("Erreur traitement reponse certificat directe pour %s" % fingerprint)
 
+        if reponse_definitive is False:
+            raise CertificatIndisponible('CERTIFICAT INDISPONIBLE (TIMEOUT)', fingerprint=fingerprint)
+
         raise CertificatInconnu('INCONNU DU SYSTEME', fingerprint=fingerprint)
 
     def set_producer_messages(self, producer):
         self.__producer_messages = producer
 
 
+class CertificatIntermediaire:
+    """
+    Certificat intermediaire parse une seule fois (OpenSSL et dates de validite).
+    """
+
+    def __init__(self, pem: str):
+        self.certificat = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, pem)
+        certificat = load_pem_x509_certificate(pem.encode('utf-8'))
+        self.not_valid_before = pytz.utc.localize(certificat.not_valid_before)
+        self.not_valid_after = pytz.utc.localize(certificat.not_valid_after)
+        self.fingerprint = calculer_fingerprint(certificat)
+
+
 class ValidateurCertificatCache(ValidateurCertificat):
 
-    def __init__(self, enveloppe_ca: EnveloppeCertificat, cache_ttl_secs=CACHE_TTL_SECS):
+    def __init__(self, enveloppe_ca: EnveloppeCertificat, cache_ttl_secs=CACHE_TTL_SECS,
+                 cache_max_entries=CACHE_MAX_ENTRIES, admission_lfu=False,
+                 cache_inconnus_ttl_secs=CACHE_INCONNUS_TTL_SECS, stockage: Optional[StockageCertificats] = None):
+        """
+        :param cache_ttl_secs: Duree de conservation d'un certificat inutilise.
+        :param cache_max_entries: Nombre maximal de certificats en cache (eviction LRU).
+        :param admission_lfu: Admission TinyLFU, un nouveau certificat remplace l'entree LRU uniquement s'il est
+                              plus frequent.
+        :param cache_inconnus_ttl_secs: Duree pendant laquelle un fingerprint introuvable n'est pas recharge.
+                                        0 ou None desactive le cache negatif.
+        :param stockage: Stockage persistant des certificats, consulte lorsque le certificat n'est pas en memoire.
+        """
         super().__init__(enveloppe_ca)
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
-        self.__cache_ttl_secs = cache_ttl_secs
-        self.__cache_max_entries = CACHE_MAX_ENTRIES
 
-        self.__cache_enveloppes = dict()
+        # [fingerprint] = EnveloppeCache
+        self.__cache_enveloppes = CacheLru(cache_max_entries, cache_ttl_secs, admission_lfu=admission_lfu)
+
+        # Cache negatif, [fingerprint] = True pour les certificats introuvables (TTL fixe, non glissant)
+        self.__cache_inconnus: Optional[CacheLru] = None
+        if cache_inconnus_ttl_secs:
+            self.__cache_inconnus = CacheLru(CACHE_INCONNUS_MAX_ENTRIES, cache_inconnus_ttl_secs, ttl_glissant=False)
+
+        self.__stockage = stockage
+        # Fingerprints connus du stockage persistant, evite de reecrire un certificat a chaque miss memoire
+        self.__presents_stockage: Optional[CacheLru] = None
+        if stockage is not None:
+            self.__presents_stockage = CacheLru(stockage.taille_max, STOCKAGE_PRESENCE_TTL_SECS, ttl_glissant=False)
 
     async def valider(
             self,
@@ -208,15 +352,23 @@ class ValidateurCertificatCache(ValidateurCertificat):
         enveloppe = super().valider(certificat, date_reference, idmg, usages)
 
         fingerprint = enveloppe.fingerprint
-        try:
-            cache_entry = self.__cache_enveloppes[fingerprint]
-        except KeyError:
-            if len(self.__cache_enveloppes) >= CACHE_MAX_ENTRIES:
-                # Cache plein
-                return enveloppe
-            else:
-                cache_entry = EnveloppeCache(enveloppe)
-                self.__cache_enveloppes[fingerprint] = cache_entry
+        if self.__cache_inconnus is not None:
+            # Le certificat est maintenant connu
+            self.__cache_inconnus.retirer(fingerprint)
+
+        cache_entry = self.__cache_enveloppes.peek(fingerprint)
+        if cache_entry is None:
+            cache_entry = EnveloppeCache(enveloppe)
+            # Le certificat ne doit pas rester en cache apres la fin de sa validite. Un certificat deja expire
+            # (validation avec date_reference) est conserve selon le TTL normal.
+            duree_validite = (enveloppe.not_valid_after - datetime.datetime.now(tz=datetime.timezone.utc))
+            expiration_max = None
+            if duree_validite.total_seconds() > 0:
+                expiration_max = time.monotonic() + duree_validite.total_seconds()
+            self.__cache_enveloppes.put(fingerprint, cache_entry, expiration_max=expiration_max)
+            if self.__stockage is not None and self.__presents_stockage.get(fingerprint) is None:
+                await asyncio.to_thread(self.__stockage.put, fingerprint, enveloppe.chaine_pem())
+                self.__presents_stockage.put(fingerprint, True)
 
         if idmg is None and date_reference is None:
             # Valide pour date courante
@@ -233,10 +385,16 @@ class ValidateurCertificatCache(ValidateurCertificat):
         Charge un certificat a partir du cache
         :return:
         """
-        try:
-            cache_entry = self.__cache_enveloppes[fingerprint]
-        except KeyError:
-            raise CertificatInconnu('CACHE MISS', fingerprint=fingerprint)
+        cache_entry = self.__cache_enveloppes.get(fingerprint)
+        if cache_entry is None:
+            pems = None
+            if self.__stockage is not None:
+                pems = await asyncio.to_thread(self.__stockage.get, fingerprint)
+                if pems is not None:
+                    self.__presents_stockage.put(fingerprint, True)
+            if pems is None:
+                raise CertificatInconnu('CACHE MISS', fingerprint=fingerprint)
+            return await self.valider(pems, date_reference, idmg, usages)
 
         if idmg is not None:
             if cache_entry.idmg != idmg:
@@ -251,17 +409,80 @@ class ValidateurCertificatCache(ValidateurCertificat):
         # Valider le certificat
         super()._valider(enveloppe, date_reference, idmg, usages)
 
+        if idmg is None and date_reference is None:
+            cache_entry.touch(presentement_valide=True)
+        else:
+            cache_entry.touch()
+
+        return enveloppe
+
+    async def precharger(self, limite: Optional[int] = None) -> int:
+        """
+        Charge en memoire les certificats les plus recemment utilises du stockage persistant (e.g. au demarrage).
+        Les certificats invalides sont retires du stockage. Les certificats expires sont conserves (validation de
+        messages historiques avec date_reference) mais ne sont pas charges.
+        :param limite: Nombre maximal de certificats a charger, defaut taille du cache memoire.
+        :return: Nombre de certificats charges.
+        """
+        if self.__stockage is None:
+            return 0
+
+        if limite is None:
+            limite = self.__cache_enveloppes.taille_max
+
+        charges = 0
+        for fingerprint, pems in await asyncio.to_thread(self.__stockage.get_recents, limite):
+            self.__presents_stockage.put(fingerprint, True)
+            try:
+                await self.valider(pems)
+                charges += 1
+            except OpenSSL.crypto.X509StoreContextError as e:
+                if e.errors[0] in (X509_V_ERR_CERT_NOT_YET_VALID, X509_V_ERR_CERT_HAS_EXPIRED):
+                    self.__logger.debug("Certificat %s du stockage hors periode de validite, conserve" % fingerprint)
+                else:
+                    self.__logger.debug("Certificat %s du stockage invalide, retire : %s" % (fingerprint, e))
+                    self.__presents_stockage.retirer(fingerprint)
+                    await asyncio.to_thread(self.__stockage.retirer, fingerprint)
+            except Exception as e:
+                self.__logger.debug("Certificat %s du stockage invalide, retire : %s" % (fingerprint, e))
+                self.__presents_stockage.retirer(fingerprint)
+                await asyncio.to_thread(self.__stockage.retirer, fingerprint)
+
+        return charges
+
+    def _est_en_cache(self, fingerprint: str) -> bool:
+        return self.__cache_enveloppes.peek(fingerprint) is not None
+
+    async def prefetch_fingerprints(self, fingerprints: list) -> int:
+        """
+        Charge d'avance les certificats d'un lot de fingerprints. Rien a faire pour le cache memoire.
+        :return: Nombre de certificats charges.
+        """
+        return 0
+
+    def _est_inconnu(self, fingerprint: str) -> bool:
+        """
+        :return: True si le fingerprint a ete recemment introuvable (cache negatif).
+        """
+        if self.__cache_inconnus is None:
+            return False
+        return self.__cache_inconnus.get(fingerprint) is not None
+
+    def _marquer_inconnu(self, fingerprint: str):
+        if self.__cache_inconnus is not None:
+            self.__cache_inconnus.put(fingerprint, True)
+
     async def entretien(self):
-        # Shallow copy pour eviter erreurs concurrence
-        cache_copy = list(self.__cache_enveloppes.values())
-        date_expiree = datetime.datetime.now() - datetime.timedelta(seconds=self.__cache_ttl_secs)
-        for entry in cache_copy:
-            if entry.date_activite < date_expiree:
-                # Retirer entree
-                try:
-                    del self.__cache_enveloppes[entry.fingerprint]
-                except KeyError:
-                    pass
+        # Retirer les certificats expires (TTL ou fin de validite)
+        self.__cache_enveloppes.entretien()
+        if self.__cache_inconnus is not None:
+            self.__cache_inconnus.entretien()
+
+    def get_statistiques_cache(self) -> dict:
+        statistiques = self.__cache_enveloppes.get_statistiques()
+        if self.__cache_inconnus is not None:
+            statistiques['inconnus'] = self.__cache_inconnus.get_statistiques()
+        return statistiques
 
 
 class EnveloppeCache:
@@ -307,13 +528,24 @@ class EnveloppeCache:
 
 class ValidateurCertificatRedis(ValidateurCertificatCache):
 
-    def __init__(self, enveloppe_ca: EnveloppeCertificat, cache_ttl_secs=CACHE_TTL_SECS, configuration: dict = None):
-        super().__init__(enveloppe_ca, cache_ttl_secs)
+    def __init__(self, enveloppe_ca: EnveloppeCertificat, cache_ttl_secs=CACHE_TTL_SECS, configuration: dict = None,
+                 cache_max_entries=CACHE_MAX_ENTRIES, admission_lfu=False,
+                 cache_inconnus_ttl_secs=CACHE_INCONNUS_TTL_SECS, stockage: Optional[StockageCertificats] = None):
+        super().__init__(enveloppe_ca, cache_ttl_secs, cache_max_entries, admission_lfu, cache_inconnus_ttl_secs,
+                         stockage)
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
         self.__configuration_redis = ValidateurCertificatRedis.__charger_configuration_redis(configuration)
         self.__enveloppe_ca = enveloppe_ca
         self.__redis_client: Optional[redis.Redis] = None
 
+        # Chargements en cours (single-flight), [(fingerprint, date_reference, idmg, nofetch)] = asyncio.Task
+        self.__chargements = dict()
+
+        # Fingerprints connus comme presents dans redis, evite de reecrire le certificat
+        self.__presents_redis = CacheLru(cache_max_entries, REDIS_PRESENCE_TTL_SECS, ttl_glissant=False)
+        # Fingerprints dont le TTL redis doit etre rafraichi (en lot, durant entretien)
+        self.__expirations_redis = set()
+
     @staticmethod
     def __charger_configuration_redis(configuration: dict = None):
         config = ConfigurationRedis()
@@ -334,15 +566,48 @@ class ValidateurCertificatRedis(ValidateurCertificatCache):
 
         await self.__redis_client.ping()
 
+    def set_redis_client(self, client):
+        """
+        Utilise un client redis deja configure plutot que de se connecter avec la configuration.
+        """
+        self.__redis_client = client
+
     async def entretien(self):
         await super().entretien()
         await self.__connecter()
+        await self.__flush_expirations()
+
+    async def __flush_expirations(self):
+        """
+        Rafraichit le TTL redis des certificats utilises depuis le dernier entretien, en un seul aller-retour.
+        """
+        if self.__redis_client is None or len(self.__expirations_redis) == 0:
+            return
+
+        fingerprints = list(self.__expirations_redis)
+        self.__expirations_redis.clear()
+
+        try:
+            async with self.__redis_client.pipeline(transaction=False) as pipe:
+                for fingerprint in fingerprints:
+                    pipe.expire(REDIS_PREFIXE_CERTIFICAT + fingerprint, REDIS_TTL_SECS)
+                resultats = await pipe.execute()
+        except Exception as e:
+            # Conserver les fingerprints pour le prochain entretien
+            self.__expirations_redis.update(fingerprints)
+            raise e
+
+        for fingerprint, resultat in zip(fingerprints, resultats):
+            if not resultat:
+                # La cle n'existe plus dans redis, le certificat sera reecrit a la prochaine validation
+                self.__presents_redis.retirer(fingerprint)
 
     async def __get_certficat(self, fingerprint, nofetch=False) -> list:
         if self.__redis_client is not None:
-            cert_data = await self.__redis_client.getex('certificat_v1:%s' % fingerprint, REDIS_TTL_SECS)
+            cert_data = await self.__redis_client.getex(REDIS_PREFIXE_CERTIFICAT + fingerprint, REDIS_TTL_SECS)
 
             if cert_data is not None:
+                self.__presents_redis.put(fingerprint, True)
                 # Parse json, format {"pems": [], "ca": ""}
                 cert_dict = json.loads(cert_data)
                 return cert_dict['pems']
@@ -364,33 +629,100 @@ class ValidateurCertificatRedis(ValidateurCertificatCache):
         except CertificatInconnu as ci:
             pass
 
-        pems = await self.__get_certficat(fingerprint, nofetch)
+        if self._est_inconnu(fingerprint):
+            # Introuvable lors d'une requete recente, eviter de refaire redis/MQ pour chaque message
+            raise CertificatInconnu('INCONNU (CACHE NEGATIF)', fingerprint=fingerprint)
+
+        # Les appels concurrents pour le meme certificat attendent un chargement unique (redis/MQ, parsing,
+        # validation de la chaine et sauvegarde).
+        cle = (fingerprint, date_reference, idmg, nofetch)
+        chargement = self.__chargements.get(cle)
+        if chargement is None:
+            chargement = asyncio.create_task(
+                self.__charger_fingerprint(fingerprint, date_reference, idmg, usages, nofetch))
+            self.__chargements[cle] = chargement
+            chargement.add_done_callback(lambda tache: self.__retirer_chargement(cle, tache))
+
+        # Shield : l'annulation d'un appelant n'interrompt pas le chargement pour les autres
+        return await asyncio.shield(chargement)
+
+    def get_nombre_chargements(self) -> int:
+        return len(self.__chargements)
+
+    def __retirer_chargement(self, cle, tache: asyncio.Task):
+        self.__chargements.pop(cle, None)
+        if not tache.cancelled():
+            tache.exception()  # Evite l'avertissement si tous les appelants ont ete annules
+
+    async def __charger_fingerprint(self, fingerprint: str, date_reference: Optional[datetime.datetime],
+                                    idmg: Optional[str], usages: set, nofetch: bool) -> EnveloppeCertificat:
+        try:
+            pems = await self.__get_certficat(fingerprint, nofetch)
+        except CertificatIndisponible as ci:
+            raise ci  # Erreur transitoire, pas de cache negatif (prochain message fait une nouvelle requete)
+        except CertificatInconnu as ci:
+            if nofetch is False:
+                self._marquer_inconnu(fingerprint)
+            raise ci
+
         return await self.valider(pems, date_reference, idmg, usages)
 
+    async def prefetch_fingerprints(self, fingerprints: list) -> int:
+        """
+        Charge en un seul aller-retour redis (mget) les certificats absents du cache local. Les certificats
+        sont valides pour la date courante, ceux qui ne le sont pas sont ignores (charges au besoin plus tard).
+        :return: Nombre de certificats charges.
+        """
+        if self.__redis_client is None:
+            return 0
+
+        manquants = [f for f in set(fingerprints) if not self._est_en_cache(f) and not self._est_inconnu(f)]
+        if len(manquants) == 0:
+            return 0
+
+        valeurs = await self.__redis_client.mget([REDIS_PREFIXE_CERTIFICAT + f for f in manquants])
+
+        charges = 0
+        for fingerprint, cert_data in zip(manquants, valeurs):
+            if cert_data is None:
+                continue
+            self.__presents_redis.put(fingerprint, True)
+            try:
+                await self.valider(json.loads(cert_data)['pems'])
+                charges += 1
+            except Exception:
+                self.__logger.debug("Prefetch : certificat %s non valide pour la date courante" % fingerprint)
+
+        return charges
+
     async def valider(self, certificat: Union[bytes, str, list], date_reference: datetime.datetime = None,
                       idmg: str = None, usages: set = {'digital_signature'}) -> EnveloppeCertificat:
 
         enveloppe = await super().valider(certificat, date_reference, idmg, usages)
-        fingerprint = enveloppe.fingerprint
-
-        self.__logger.debug("Verifier si on conserve certificat %s dans redis" % fingerprint)
 
-        # Verifier si on a deja le certificat dans redis (just touch, maj TTL)
         if self.__redis_client is not None:
-            cle_redis = 'certificat_v1:%s' % fingerprint
+            await self.__sauvegarder_redis(enveloppe)
 
-            cle_existe = await self.__redis_client.exists(cle_redis)
-            self.__logger.debug("Cle existant de redis : %s" % cle_existe)
+        return enveloppe
 
-            if cle_existe == 1:
-                self.__logger.debug("Cle %s existe deja : %s" % (cle_redis, cle_existe))
-                await self.__redis_client.expire(cle_redis, REDIS_TTL_SECS)
-            else:
-                self.__logger.debug("Sauvegarder %s dans redis" % cle_redis)
-                pems = enveloppe.chaine_pem()
-                entree_redis = {'pems': pems, 'ca': None}
-                entree_redis_bytes = json.dumps(entree_redis).encode('utf-8')
-                await self.__redis_client.setex(cle_redis, REDIS_TTL_SECS, entree_redis_bytes)
+    async def __sauvegarder_redis(self, enveloppe: EnveloppeCertificat):
+        fingerprint = enveloppe.fingerprint
 
-        return enveloppe
+        if self.__presents_redis.get(fingerprint) is not None:
+            # Deja dans redis, le TTL est rafraichi en lot durant entretien()
+            self.__expirations_redis.add(fingerprint)
+            return
+
+        self.__logger.debug("Sauvegarder %s dans redis" % fingerprint)
+        cle_redis = REDIS_PREFIXE_CERTIFICAT + fingerprint
+        entree_redis = {'pems': enveloppe.chaine_pem(), 'ca': None}
+        entree_redis_bytes = json.dumps(entree_redis).encode('utf-8')
+
+        # Ecriture (si absent) et maj du TTL (si present) en un seul aller-retour
+        async with self.__redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(cle_redis, entree_redis_bytes, ex=REDIS_TTL_SECS, nx=True)
+            pipe.expire(cle_redis, REDIS_TTL_SECS)
+            await pipe.execute()
 
+        self.__presents_redis.put(fingerprint, True)
+        self.__expirations_redis.discard(fingerprint)
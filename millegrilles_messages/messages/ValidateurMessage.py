@@ -4,15 +4,16 @@ import datetime
 import json
 import logging
 import pytz
-import multibase
 
 from cryptography.hazmat.primitives import hashes
-from typing import Union
+from cryptography.x509 import load_pem_x509_certificate
+from typing import Optional, Union
 
 from millegrilles_messages.messages import Constantes
-from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat
-from millegrilles_messages.messages.FormatteurMessages import DateFormatEncoder, parse_float
-from millegrilles_messages.messages.Hachage import verifier_hachage
+from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat, calculer_fingerprint
+from millegrilles_messages.messages.Encoders import encoder_json_canonique, encoder_json_canonique_sans_cle, \
+    normaliser_valeur
+from millegrilles_messages.messages.Hachage import verifier_hachage, decoder_multibase
 from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificatCache, CertificatInconnu
 
 
@@ -31,24 +32,17 @@ class ValidateurMessage:
         :raise certvalidator.errors.PathValidationError: Certificat est invalide.
         :raise cryptography.exceptions.InvalidSignature: Signature du message est invalide.
         """
-        if isinstance(message, bytes):
-            dict_message = json.loads(message.decode('utf-8'))
-        elif isinstance(message, str):
-            dict_message = json.loads(message)
-        elif isinstance(message, dict):
-            dict_message = message.copy()
-        else:
-            raise TypeError("La transaction doit etre en format bytes, str ou dict")
+        dict_message = charger_message(message)
 
-        # Preparer le message pour verification du hachage et de la signature
-        message_nettoye = preparer_message(dict_message)
+        # Preparer le message pour verification du hachage et de la signature (serialisation unique)
+        contexte = ContexteVerification(dict_message)
 
         # Verifier le hachage du contenu - si invalide, pas de raison de verifier la signature
-        fut_hachage = self.verifier_hachage(message_nettoye)
+        fut_hachage = self.verifier_hachage(contexte)
 
         # Valider presence de la signature en premier, certificat apres
         signature = dict_message[Constantes.MESSAGE_SIGNATURE]
-        fut_enveloppe_certificat = self.__valider_certificat_message(message, utiliser_date_message,
+        fut_enveloppe_certificat = self.__valider_certificat_message(dict_message, utiliser_date_message,
                                                                      utiliser_idmg_message)
 
         # Attendre hachage et enveloppe certificat
@@ -56,32 +50,132 @@ class ValidateurMessage:
         enveloppe_certificat = resultat[1]
 
         # Certificat est valide. On verifie la signature.
-        await verifier_signature(message_nettoye, signature, enveloppe_certificat)
+        await verifier_signature(contexte, signature, enveloppe_certificat)
 
         return enveloppe_certificat
 
-    async def verifier_hachage(self, message: dict) -> str:
+    async def verifier_batch(self, messages: list, utiliser_date_message=False,
+                             utiliser_idmg_message=False) -> list:
+        """
+        Verifie un lot de messages. Les messages sont regroupes par certificat (fingerprint_certificat) : chaque
+        certificat est charge et valide une seule fois pour son groupe et sa cle publique est reutilisee pour
+        toutes les signatures du groupe.
+
+        Une erreur sur un message n'affecte pas les autres messages du lot.
+
+        :param messages: Liste de messages (bytes, str ou dict)
+        :return: Liste de ResultatVerification, dans le meme ordre que messages
+        """
+        resultats = [ResultatVerification(m) for m in messages]
+
+        # Preparer les messages et verifier les hachages. Regrouper par certificat.
+        groupes = dict()
+        for resultat in resultats:
+            try:
+                dict_message = charger_message(resultat.message)
+                resultat.parsed = dict_message
+                contexte = ContexteVerification(dict_message)
+                await self.verifier_hachage(contexte)
+                entete = contexte.entete
+                cle_groupe = (
+                    entete[Constantes.MESSAGE_FINGERPRINT_CERTIFICAT],
+                    entete[Constantes.MESSAGE_ESTAMPILLE] if utiliser_date_message else None,
+                    entete[Constantes.MESSAGE_IDMG] if utiliser_idmg_message else None,
+                )
+            except Exception as e:
+                resultat.erreur = e
+                continue
+
+            try:
+                groupes[cle_groupe].append((resultat, contexte))
+            except KeyError:
+                groupes[cle_groupe] = [(resultat, contexte)]
+
+        # Charger d'avance les certificats du lot (e.g. un seul aller-retour redis)
+        fingerprints = [cle_groupe[0] for cle_groupe in groupes.keys()]
+        try:
+            await self.__validateur_certificats.prefetch_fingerprints(fingerprints)
+        except Exception:
+            self.__logger.exception("Erreur prefetch certificats du lot")
+
+        for groupe in groupes.values():
+            await self.__verifier_groupe(groupe, utiliser_date_message, utiliser_idmg_message)
+
+        return resultats
+
+    async def __verifier_groupe(self, groupe: list, utiliser_date_message: bool, utiliser_idmg_message: bool):
+        # Charger le certificat une seule fois. Le premier message avec un certificat utilisable est conserve.
+        enveloppe_certificat = None
+        erreur_certificat = None
+        for resultat, _contexte in groupe:
+            try:
+                enveloppe_certificat = await self.__valider_certificat_message(
+                    resultat.parsed, utiliser_date_message, utiliser_idmg_message)
+                break
+            except Exception as e:
+                erreur_certificat = e
+
+        if enveloppe_certificat is None:
+            for resultat, _contexte in groupe:
+                resultat.erreur = erreur_certificat
+            return
+
+        # Verifier les signatures du groupe avec la meme cle publique
+        cle_publique = enveloppe_certificat.certificat.public_key()
+        for resultat, contexte in groupe:
+            try:
+                signature = resultat.parsed[Constantes.MESSAGE_SIGNATURE]
+                verifier_signature_digest(cle_publique, signature, contexte.digest_signature)
+                resultat.certificat = enveloppe_certificat
+            except Exception as e:
+                resultat.erreur = e
+
+        # Laisser la main aux autres taches entre les groupes
+        await asyncio.sleep(0)
+
+    async def completer_verification_processus(self, parsed: dict, digest_signature: bytes,
+                                               signature_verifiee: bool, utiliser_date_message=False,
+                                               utiliser_idmg_message=False) -> EnveloppeCertificat:
+        """
+        Complete la verification d'un message pre-verifie par verifier_message_processus() (e.g. dans un
+        ProcessPoolExecutor). La decision de confiance (validation du certificat) est faite ici, dans le processus
+        principal.
+
+        :param parsed: Message parse retourne par verifier_message_processus()
+        :param digest_signature: Digest BLAKE2b-512 du message
+        :param signature_verifiee: True si la signature a deja ete verifiee avec le certificat du fingerprint
+        :return: Enveloppe du certificat valide
         """
-        :param message:
+        enveloppe_certificat = await self.__valider_certificat_message(
+            parsed, utiliser_date_message, utiliser_idmg_message)
+
+        if signature_verifiee is not True:
+            verifier_signature_digest(
+                enveloppe_certificat.certificat.public_key(), parsed[Constantes.MESSAGE_SIGNATURE], digest_signature)
+
+        return enveloppe_certificat
+
+    async def verifier_hachage(self, message: Union[dict, 'ContexteVerification']) -> str:
+        """
+        :param message: Message nettoye (preparer_message) ou contexte de verification
         :return: Hachage du message
         :raises ErreurHachage: Si le digest calcule ne correspond pas au hachage fourni
         """
-        entete = message[Constantes.MESSAGE_ENTETE]
-        hachage = entete[Constantes.MESSAGE_HACHAGE]
+        if isinstance(message, ContexteVerification):
+            hachage = message.hachage
+            message_bytes = message.bytes_contenu
+        else:
+            entete = message[Constantes.MESSAGE_ENTETE]
+            hachage = entete[Constantes.MESSAGE_HACHAGE]
 
-        message_sans_entete = message.copy()
-        try:
-            del message_sans_entete[Constantes.MESSAGE_ENTETE]
-        except KeyError:
-            pass  # Ce n'est pas un message avec entete
-
-        # message_bytes = json.dumps(message_sans_entete).encode('utf-8')
-        message_bytes = json.dumps(
-            message_sans_entete,
-            ensure_ascii=False,  # S'assurer de supporter tous le range UTF-8
-            sort_keys=True,
-            separators=(',', ':')
-        ).encode('utf-8')
+            message_sans_entete = message.copy()
+            try:
+                del message_sans_entete[Constantes.MESSAGE_ENTETE]
+            except KeyError:
+                pass  # Ce n'est pas un message avec entete
+
+            # Le message est deja normalise par preparer_message()
+            message_bytes = encoder_json_canonique(message_sans_entete, normaliser=False)
 
         # Fonction de verification de hachage - lance une exception en cas de mismatch
         verifier_hachage(hachage, message_bytes)
@@ -147,50 +241,161 @@ class ValidateurMessage:
         return self.__validateur_certificats
 
 
+def charger_message(message: Union[bytes, str, dict]) -> dict:
+    if isinstance(message, bytes):
+        return json.loads(message.decode('utf-8'))
+    elif isinstance(message, str):
+        return json.loads(message)
+    elif isinstance(message, dict):
+        return message.copy()
+    else:
+        raise TypeError("La transaction doit etre en format bytes, str ou dict")
+
+
 def preparer_message(message: dict) -> dict:
     message_nettoye = dict()
     for key, value in message.items():
         if not key.startswith('_'):
             message_nettoye[key] = value
 
-    # Premiere passe, converti les dates. Les nombre floats sont incorrects.
-    message_str = json.dumps(
-        message_nettoye,
-        ensure_ascii=False,   # S'assurer de supporter tous le range UTF-8
-        cls=DateFormatEncoder
-    )
-
-    # HACK - Fix pour le decodage des float qui ne doivent pas finir par .0 (e.g. 100.0 doit etre 100)
-    message_nettoye = json.loads(message_str, parse_float=parse_float)
+    # Une seule passe : converti les dates et corrige les floats (e.g. 100.0 doit etre 100)
+    message_nettoye = normaliser_valeur(message_nettoye)
 
     return message_nettoye
 
 
-async def verifier_signature(message: dict, signature: str, enveloppe: EnveloppeCertificat):
-    # Le certificat est valide. Valider la signature du message.
-    signature_enveloppe = multibase.decode(signature.encode('utf-8'))
-    version_signature = signature_enveloppe[0]
-    signature_bytes = signature_enveloppe[1:]
+class ContexteVerification:
+    """
+    Representation canonique d'un message a verifier. Le message est normalise et serialise une seule fois,
+    les bytes sont partages entre la verification du hachage du contenu et de la signature.
+    """
 
-    if isinstance(signature_bytes, str):
-        signature_bytes = signature_bytes.encode('utf-8')
+    def __init__(self, message: dict):
+        """
+        :param message: Message recu (dict), incluant l'en-tete et la signature
+        """
+        self.__message_nettoye = preparer_message(message)
+        self.__bytes_contenu, self.__bytes_message = encoder_json_canonique_sans_cle(
+            self.__message_nettoye, Constantes.MESSAGE_ENTETE, normaliser=False)
+        self.__digest_signature: Optional[bytes] = None
 
-    message_bytes = json.dumps(
-        message,
-        ensure_ascii=False,   # S'assurer de supporter tous le range UTF-8
-        sort_keys=True,
-        separators=(',', ':')
-    ).encode('utf-8')
+    @property
+    def message_nettoye(self) -> dict:
+        return self.__message_nettoye
 
-    certificat = enveloppe.certificat
-    cle_publique = certificat.public_key()
+    @property
+    def entete(self) -> dict:
+        return self.__message_nettoye[Constantes.MESSAGE_ENTETE]
 
-    if version_signature == 2:
+    @property
+    def hachage(self) -> str:
+        return self.entete[Constantes.MESSAGE_HACHAGE]
+
+    @property
+    def bytes_contenu(self) -> bytes:
+        """ Bytes canoniques du message sans en-tete, utilises pour le hachage du contenu. """
+        return self.__bytes_contenu
+
+    @property
+    def bytes_message(self) -> bytes:
+        """ Bytes canoniques du message complet (avec en-tete), utilises pour la signature. """
+        return self.__bytes_message
+
+    @property
+    def digest_signature(self) -> bytes:
+        """ Digest BLAKE2b-512 du message complet, c'est la valeur signee avec Ed25519. """
+        if self.__digest_signature is None:
+            hash_fct = hashes.Hash(hashes.BLAKE2b(64))
+            hash_fct.update(self.__bytes_message)
+            self.__digest_signature = hash_fct.finalize()
+        return self.__digest_signature
+
+
+def verifier_message_processus(contenu: Union[bytes, str]) -> (dict, str, bytes, bool):
+    """
+    Partie CPU de la verification d'un message : parse json, serialisation canonique, hachage du contenu et
+    signature. Peut etre executee dans un ProcessPoolExecutor.
+
+    La signature est verifiee avec le certificat inline du message s'il correspond au fingerprint de l'en-tete.
+    La chaine de certificats n'est pas validee ici, il faut completer avec
+    ValidateurMessage.completer_verification_processus() dans le processus principal.
+
+    :param contenu: Message recu (json)
+    :return: (message parse, fingerprint du certificat, digest de signature, signature verifiee)
+    :raises ErreurHachage: Si le hachage du contenu est invalide
+    :raise cryptography.exceptions.InvalidSignature: Signature du message est invalide.
+    """
+    parsed = json.loads(contenu)
+    contexte = ContexteVerification(parsed)
+    verifier_hachage(contexte.hachage, contexte.bytes_contenu)
+
+    fingerprint = contexte.entete[Constantes.MESSAGE_FINGERPRINT_CERTIFICAT]
+    signature = parsed[Constantes.MESSAGE_SIGNATURE]
+
+    signature_verifiee = False
+    certificats_inline = parsed.get('_certificats') or parsed.get('_certificat')
+    if certificats_inline is not None:
+        if isinstance(certificats_inline, list):
+            pem_certificat = certificats_inline[0]
+        else:
+            pem_certificat = certificats_inline.replace(';', '\n')
+        certificat = load_pem_x509_certificate(pem_certificat.encode('utf-8'))
+        if calculer_fingerprint(certificat) == fingerprint:
+            verifier_signature_digest(certificat.public_key(), signature, contexte.digest_signature)
+            signature_verifiee = True
+
+    return parsed, fingerprint, contexte.digest_signature, signature_verifiee
+
+
+class ResultatVerification:
+    """
+    Resultat de verification d'un message d'un lot (verifier_batch).
+    """
+
+    def __init__(self, message: Union[bytes, str, dict]):
+        self.message = message
+        self.parsed: Optional[dict] = None
+        self.certificat: Optional[EnveloppeCertificat] = None
+        self.erreur: Optional[Exception] = None
+
+    @property
+    def est_valide(self) -> bool:
+        return self.erreur is None and self.certificat is not None
+
+    def __str__(self):
+        if self.est_valide:
+            return 'ResultatVerification valide (%s)' % self.certificat.fingerprint
+        return 'ResultatVerification invalide (%s)' % self.erreur
+
+
+async def verifier_signature(message: Union[dict, ContexteVerification], signature: str,
+                             enveloppe: EnveloppeCertificat):
+    # Le certificat est valide. Valider la signature du message.
+    if isinstance(message, ContexteVerification):
+        hash_value = message.digest_signature
+    else:
+        # Le message est deja normalise par preparer_message()
+        message_bytes = encoder_json_canonique(message, normaliser=False)
         hash = hashes.Hash(hashes.BLAKE2b(64))
         hash.update(message_bytes)
         hash_value = hash.finalize()
-        cle_publique.verify(signature_bytes, hash_value)
-    else:
-        raise ValueError("Version de signature non supportee : %s" % version_signature)
+
+    verifier_signature_digest(enveloppe.certificat.public_key(), signature, hash_value)
 
     # Signature OK, aucune exception n'a ete lancee
+
+
+def verifier_signature_digest(cle_publique, signature: str, digest: bytes):
+    """
+    Verifie la signature (multibase) d'un digest BLAKE2b-512 de message.
+
+    :raise cryptography.exceptions.InvalidSignature: Signature du message est invalide.
+    """
+    signature_enveloppe = decoder_multibase(signature)
+    version_signature = signature_enveloppe[0]
+    signature_bytes = signature_enveloppe[1:]
+
+    if version_signature == 2:
+        cle_publique.verify(signature_bytes, digest)
+    else:
+        raise ValueError("Version de signature non supportee : %s" % version_signature)
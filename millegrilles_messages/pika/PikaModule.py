@@ -1,8 +1,11 @@
 # Plug-in module pour pika 1.2 dans millegrilles messages
+import asyncio
 import logging
 import pika
 import ssl
 
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional, Union
 
 from pika.adapters.asyncio_connection import AsyncioConnection
@@ -15,8 +18,9 @@ from millegrilles_messages.messages.CleCertificat import CleCertificat
 from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat
 from millegrilles_messages.messages.MessagesModule \
     import MessagesModule, MessageConsumerVerificateur, MessageProducerFormatteur, RessourcesConsommation, \
-    MessageWrapper, MessagePending
+    MessageWrapper, MessagePending, MessageNonConfirme
 from millegrilles_messages.messages.ParamsEnvironnement import ConfigurationPika
+from millegrilles_messages.messages.StockageCertificats import StockageCertificats
 from millegrilles_messages.messages.ValidateurMessage import ValidateurMessage
 from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificatRedis, ValidateurCertificatCache
 
@@ -48,14 +52,25 @@ class PikaModule(MessagesModule):
 
         enveloppe_ca = EnveloppeCertificat.from_file(self.__pika_configuration.ca_pem_path)
 
+        stockage_certificats = None
+        if self.__pika_configuration.certificats_cache_path is not None:
+            stockage_certificats = StockageCertificats(self.__pika_configuration.certificats_cache_path,
+                                                       self.__pika_configuration.certificats_cache_max)
+
         try:
-            validateur_certificats = ValidateurCertificatRedis(enveloppe_ca, configuration=env_configuration)
+            validateur_certificats = ValidateurCertificatRedis(enveloppe_ca, configuration=env_configuration,
+                                                               stockage=stockage_certificats)
             await validateur_certificats.entretien()  # Connecter redis
         except (FileNotFoundError, ConnectionError, KeyError) as e:
             self.__logger.warning("Erreur configuraiton ou connexion a redis - fallback sur validateur avec cache memoire")
             if self.__logger.isEnabledFor(logging.INFO):
                 self.__logger.exception("Erreur configuration redis")
-            validateur_certificats = ValidateurCertificatCache(enveloppe_ca)
+            validateur_certificats = ValidateurCertificatCache(enveloppe_ca, stockage=stockage_certificats)
+
+        if stockage_certificats is not None:
+            nombre_certificats = await validateur_certificats.precharger()
+            self.__logger.info("%d certificats charges du stockage %s" % (
+                nombre_certificats, self.__pika_configuration.certificats_cache_path))
 
         validateur_messages = ValidateurMessage(validateur_certificats)
 
@@ -81,6 +96,13 @@ class PikaModule(MessagesModule):
                 consumer = PikaModuleConsumer(self, consumer_res)
                 self.ajouter_consumer(consumer)
 
+        # Creer le pool de verification si au moins un consumer l'utilise
+        ressources = [c.get_ressources() for c in self._consumers]
+        if any([r.verification_processus is True for r in ressources]):
+            nb_workers = self.__pika_configuration.verification_workers
+            self.__logger.info("Verification des messages dans un pool de processus (workers : %s)" % nb_workers)
+            self._executeur_verification = ProcessPoolExecutor(max_workers=nb_workers)
+
     async def entretien(self):
         await super().entretien()
 
@@ -356,14 +378,23 @@ class PikaModuleProducer(MessageProducerFormatteur):
         configuration = pika_module.configuration
         clecert = CleCertificat.from_files(configuration.key_pem_path, configuration.cert_pem_path)
 
-        super().__init__(pika_module, clecert)
+        super().__init__(pika_module, clecert,
+                         configuration.taille_file_emission, configuration.politique_file_emission)
 
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
         self.__channel: Optional[Channel] = None
 
+        self.__confirmations: Optional[SuiviConfirmations] = None
+        if configuration.confirmations is True:
+            self.__confirmations = SuiviConfirmations(configuration.fenetre_confirmations)
+
     def set_channel(self, channel: Channel):
         self.__channel = channel
         channel.add_on_close_callback(self.clear_channel)
+        if self.__confirmations is not None:
+            # Nouveau channel, les delivery tags recommencent a 1
+            self.__confirmations.reset('Nouveau channel')
+            channel.confirm_delivery(self.__confirmations.recevoir_confirmation)
         event_loop = self._module_messages.get_event_loop()
         event_loop.call_soon_threadsafe(self._producer_pret.set)
 
@@ -371,6 +402,8 @@ class PikaModuleProducer(MessageProducerFormatteur):
         self.__logger.debug("Fermeture channel producer : %s", reason)
         self.__channel = None
         self._producer_pret.clear()
+        if self.__confirmations is not None:
+            self.__confirmations.reset('Channel ferme : %s' % reason)
 
     async def send(self, message: MessagePending):
         if self.__channel is None:
@@ -392,21 +425,124 @@ class PikaModuleProducer(MessageProducerFormatteur):
         if headers:
             properties.headers = headers
 
-        if exchanges is not None:
-            for exchange in exchanges:
-                self.__channel.basic_publish(
-                    exchange=exchange,
-                    routing_key=routing_key,
-                    body=message.content,
-                    properties=properties,
-                    mandatory=True
-                )
-        else:
+        if exchanges is None:
+            exchanges = ['']
+
+        if self.__confirmations is not None:
+            # Attendre de la place dans la fenetre de messages non confirmes
+            await self.__confirmations.attendre_fenetre()
+            if self.__channel is None:
+                raise Exception("Channel n'est pas pret")
+
+        for exchange in exchanges:
             self.__channel.basic_publish(
-                exchange='',
+                exchange=exchange,
                 routing_key=routing_key,
                 body=message.content,
                 properties=properties,
                 mandatory=True
             )
+            if self.__confirmations is not None:
+                self.__confirmations.ajouter(message)
+
+        if self.__confirmations is None:
+            # Aucun suivi des confirmations, le message est considere emis
+            message.confirmer()
+
+    def get_nombre_non_confirmes(self) -> int:
+        if self.__confirmations is None:
+            return 0
+        return len(self.__confirmations)
+
+
+class SuiviConfirmations:
+    """
+    Suivi des confirmations de publication (publisher confirms) d'un channel.
+    Chaque basic_publish recoit le delivery tag suivant du channel. Un message publie sur plusieurs
+    exchanges est confirme lorsque tous ses delivery tags sont confirmes.
+    """
+
+    def __init__(self, fenetre: int):
+        """
+        :param fenetre: Nombre maximal de publications non confirmees.
+        """
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.__fenetre = max(fenetre, 1)
+        self.__delivery_tag = 0
+        self.__pending = OrderedDict()  # [delivery_tag] = MessagePending, en ordre de delivery_tag
+        self.__nb_tags_message = dict()  # [id(MessagePending)] = nombre de tags non confirmes
+        self.__event_fenetre: Optional[asyncio.Event] = None
+
+    def __len__(self):
+        return len(self.__pending)
+
+    async def attendre_fenetre(self):
+        if self.__event_fenetre is None:
+            self.__event_fenetre = asyncio.Event()
+        while len(self.__pending) >= self.__fenetre:
+            self.__event_fenetre.clear()
+            await self.__event_fenetre.wait()
+
+    def ajouter(self, message: MessagePending):
+        self.__delivery_tag += 1
+        self.__pending[self.__delivery_tag] = message
+        cle = id(message)
+        self.__nb_tags_message[cle] = self.__nb_tags_message.get(cle, 0) + 1
+
+    def recevoir_confirmation(self, method_frame):
+        """
+        Callback pika pour Basic.Ack et Basic.Nack.
+        """
+        method = method_frame.method
+        ack = isinstance(method, pika.spec.Basic.Ack)
+        delivery_tag = method.delivery_tag
+
+        if method.multiple is True:
+            tags = list()
+            for tag in self.__pending:
+                if tag > delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [delivery_tag]
+
+        for tag in tags:
+            try:
+                message = self.__pending.pop(tag)
+            except KeyError:
+                continue
+            self.__traiter(message, ack)
+
+        if self.__event_fenetre is not None:
+            self.__event_fenetre.set()
+
+    def reset(self, raison: str):
+        """
+        Rejette les messages en attente de confirmation et recommence les delivery tags a 1.
+        """
+        if len(self.__pending) > 0:
+            self.__logger.warning("%d publications non confirmees rejetees (%s)" % (len(self.__pending), raison))
+        for message in self.__pending.values():
+            message.rejeter(MessageNonConfirme(raison))
+        self.__pending.clear()
+        self.__nb_tags_message.clear()
+        self.__delivery_tag = 0
+        if self.__event_fenetre is not None:
+            self.__event_fenetre.set()
+
+    def __traiter(self, message: MessagePending, ack: bool):
+        cle = id(message)
+        if ack is False:
+            self.__nb_tags_message.pop(cle, None)
+            message.rejeter(MessageNonConfirme('Message rejete (nack) par MQ'))
+            return
+
+        restant = self.__nb_tags_message.get(cle)
+        if restant is None:
+            return  # Deja rejete
+        elif restant > 1:
+            self.__nb_tags_message[cle] = restant - 1
+        else:
+            del self.__nb_tags_message[cle]
+            message.confirmer()
 
@@ -0,0 +1,140 @@
+import asyncio
+import datetime
+import logging
+import time
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.certificats.CertificatsMillegrille import generer_csr_leaf
+from millegrilles_messages.certificats.CertificatsConfiguration import signer_configuration
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.CacheLru import CacheLru
+from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificatCache, CertificatInconnu
+
+logger = logging.getLogger(__name__)
+
+
+def test_lru():
+    cache = CacheLru(3)
+    for i in range(0, 3):
+        cache.put(i, 'valeur %d' % i)
+
+    assert cache.get(0) == 'valeur 0'  # 0 devient le plus recent
+    cache.put(3, 'valeur 3')           # Evince 1 (LRU)
+
+    assert 1 not in cache
+    assert [cache.get(i) for i in [0, 2, 3]] == ['valeur 0', 'valeur 2', 'valeur 3']
+    assert cache.get(1) is None
+
+    stats = cache.get_statistiques()
+    assert stats['hits'] == 4 and stats['misses'] == 1 and stats['evictions'] == 1, stats
+    logger.info("test_lru OK %s" % stats)
+
+
+def test_ttl():
+    cache = CacheLru(10, ttl_secs=0.05)
+    cache.put('a', 1)
+    cache.put('b', 2, ttl_secs=10)
+    cache.put('c', 3, ttl_secs=10, expiration_max=time.monotonic() + 0.05)
+
+    time.sleep(0.03)
+    assert cache.get('a') == 1  # TTL glissant, renouvele
+    time.sleep(0.03)
+    assert cache.get('a') == 1
+    assert cache.get('c') is None  # Expiration max atteinte malgre le TTL
+    time.sleep(0.06)
+    assert cache.peek('a') is None
+
+    cache.entretien()
+    assert len(cache) == 1 and cache.get('b') == 2
+    logger.info("test_ttl OK %s" % cache.get_statistiques())
+
+
+def test_admission_lfu():
+    cache = CacheLru(100, admission_lfu=True)
+
+    # Ensemble de travail frequent
+    for _ in range(0, 5):
+        for i in range(0, 100):
+            if cache.get(i) is None:
+                cache.put(i, i)
+
+    # Balayage de cles utilisees une seule fois, entremele avec l'ensemble de travail. Ne doit pas vider le cache.
+    for lot in range(0, 20):
+        for i in range(1000 + lot * 100, 1100 + lot * 100):
+            if cache.get(i) is None:
+                cache.put(i, i)
+        for i in range(0, 100):
+            if cache.get(i) is None:
+                cache.put(i, i)
+
+    conserves = len([i for i in range(0, 100) if i in cache])
+    stats = cache.get_statistiques()
+    assert conserves > 90, conserves
+    assert stats['rejets'] > 1900, stats
+    logger.info("test_admission_lfu OK (%d/100 conserves) %s" % (conserves, stats))
+
+
+async def test_validateur():
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    idmg = root.enveloppe.idmg
+    validateur = ValidateurCertificatCache(root.enveloppe, cache_max_entries=3)
+
+    enveloppes = list()
+    for i in range(0, 5):
+        csr = generer_csr_leaf(idmg, 'cache-%d' % i)
+        enveloppe = signer_configuration(root, csr.get_pem_csr(), {'roles': ['test']})
+        enveloppes.append(await validateur.valider(enveloppe.chaine_pem()))
+
+    # Seuls les 3 derniers certificats sont en cache
+    for enveloppe in enveloppes[:2]:
+        try:
+            await validateur.valider_fingerprint(enveloppe.fingerprint)
+            raise AssertionError('CertificatInconnu attendu')
+        except CertificatInconnu:
+            pass
+    for enveloppe in enveloppes[2:]:
+        resultat = await validateur.valider_fingerprint(enveloppe.fingerprint)
+        assert resultat.fingerprint == enveloppe.fingerprint
+
+    # Validation avec date de reference, retourne l'enveloppe du cache
+    resultat = await validateur.valider_fingerprint(enveloppes[4].fingerprint,
+                                                    date_reference=datetime.datetime.utcnow())
+    assert resultat is not None and resultat.fingerprint == enveloppes[4].fingerprint
+
+    stats = validateur.get_statistiques_cache()
+    assert stats['taille'] == 3 and stats['evictions'] == 2, stats
+    logger.info("test_validateur OK %s" % stats)
+
+
+async def test_certificat_expire():
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    validateur = ValidateurCertificatCache(root.enveloppe)
+
+    csr = generer_csr_leaf(root.enveloppe.idmg, 'cache-expire')
+    expire = signer_configuration(root, csr.get_pem_csr(), {'roles': ['test'], 'duree': 1})
+    date_reference = datetime.datetime.now(tz=datetime.timezone.utc)
+    await asyncio.sleep(2)
+
+    # Certificat deja expire (e.g. message historique) : conserve en cache selon le TTL normal
+    await validateur.valider(expire.chaine_pem(), date_reference=date_reference)
+    for _ in range(0, 3):
+        resultat = await validateur.valider_fingerprint(expire.fingerprint, date_reference=date_reference)
+        assert resultat.fingerprint == expire.fingerprint
+
+    stats = validateur.get_statistiques_cache()
+    assert stats['taille'] == 1 and stats['hits'] == 3 and stats['expirations'] == 0, stats
+    logger.info("test_certificat_expire OK")
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    test_lru()
+    test_ttl()
+    test_admission_lfu()
+    asyncio.run(test_validateur())
+    asyncio.run(test_certificat_expire())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.certificats.CertificatsMillegrille import generer_csr_leaf
+from millegrilles_messages.certificats.CertificatsConfiguration import signer_configuration
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificatRedis, CertificatInconnu, \
+    CertificatIndisponible
+
+logger = logging.getLogger(__name__)
+
+CONFIGURATION_REDIS = {
+    Constantes.ENV_REDIS_PASSWORD: 'test',
+    Constantes.ENV_CERT_PEM: '/tmp/cert.pem',
+    Constantes.ENV_KEY_PEM: '/tmp/key.pem',
+}
+
+
+class ReponseInconnu:
+    parsed = {'ok': False}
+
+
+class ProducerInconnu:
+    """
+    Simule un producer dont les requetes de certificat recoivent une reponse ok: False (inconnu du systeme).
+    """
+
+    def __init__(self, delai=0.05):
+        self.delai = delai
+        self.nombre_requetes = 0
+        self.__pret = asyncio.Event()
+        self.__pret.set()
+
+    def producer_pret(self):
+        return self.__pret
+
+    async def executer_requete(self, requete, domaine, action=None, exchange=None, timeout=None):
+        self.nombre_requetes += 1
+        await asyncio.sleep(self.delai)
+        return ReponseInconnu()
+
+
+class ProducerInjoignable(ProducerInconnu):
+    """
+    Simule un producer dont les requetes de certificat expirent (broker ou CorePki indisponible).
+    """
+
+    async def executer_requete(self, requete, domaine, action=None, exchange=None, timeout=None):
+        self.nombre_requetes += 1
+        await asyncio.sleep(self.delai)
+        raise asyncio.TimeoutError()
+
+
+async def valider_inconnu(validateur, fingerprint):
+    try:
+        await validateur.valider_fingerprint(fingerprint)
+        raise AssertionError('CertificatInconnu attendu')
+    except CertificatInconnu:
+        pass
+
+
+async def test_cache_negatif():
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    validateur = ValidateurCertificatRedis(root.enveloppe, configuration=CONFIGURATION_REDIS,
+                                           cache_inconnus_ttl_secs=0.3)
+    producer = ProducerInconnu()
+    validateur.set_producer_messages(producer)
+
+    fingerprint = 'z2i3XjxFakeFingerprint'
+
+    debut = time.perf_counter()
+    await valider_inconnu(validateur, fingerprint)
+    duree_initiale = time.perf_counter() - debut
+    assert producer.nombre_requetes == 2
+
+    # Rafale de messages signes par le meme certificat inconnu : aucune requete MQ
+    debut = time.perf_counter()
+    for _ in range(0, 1000):
+        await valider_inconnu(validateur, fingerprint)
+    duree_rafale = time.perf_counter() - debut
+    assert producer.nombre_requetes == 2
+    logger.info("Requete initiale %.3f s, 1000 messages en cache negatif %.3f s" % (duree_initiale, duree_rafale))
+
+    # Apres le TTL, le certificat est recharge
+    await asyncio.sleep(0.35)
+    await valider_inconnu(validateur, fingerprint)
+    assert producer.nombre_requetes == 4
+
+    # Un certificat recu (e.g. chaine dans un message) retire le fingerprint du cache negatif
+    csr = generer_csr_leaf(root.enveloppe.idmg, 'negatif')
+    enveloppe = signer_configuration(root, csr.get_pem_csr(), {'roles': ['test']})
+    await valider_inconnu(validateur, enveloppe.fingerprint)
+    await validateur.valider(enveloppe.chaine_pem())
+    resultat = await validateur.valider_fingerprint(enveloppe.fingerprint)
+    assert resultat.fingerprint == enveloppe.fingerprint
+
+    statistiques = validateur.get_statistiques_cache()
+    assert statistiques['inconnus']['hits'] == 1000, statistiques
+    logger.info("test_cache_negatif OK %s" % statistiques)
+
+
+async def test_cache_negatif_desactive():
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    validateur = ValidateurCertificatRedis(root.enveloppe, configuration=CONFIGURATION_REDIS,
+                                           cache_inconnus_ttl_secs=0)
+    producer = ProducerInconnu(delai=0)
+    validateur.set_producer_messages(producer)
+
+    for _ in range(0, 3):
+        await valider_inconnu(validateur, 'z2i3XjxFakeFingerprint')
+    assert producer.nombre_requetes == 6
+    assert 'inconnus' not in validateur.get_statistiques_cache()
+    logger.info("test_cache_negatif_desactive OK")
+
+
+async def test_timeout_non_conserve():
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    validateur = ValidateurCertificatRedis(root.enveloppe, configuration=CONFIGURATION_REDIS,
+                                           cache_inconnus_ttl_secs=30)
+    producer = ProducerInjoignable(delai=0)
+    validateur.set_producer_messages(producer)
+
+    # Timeouts : erreur transitoire, chaque message refait la requete
+    for i in range(0, 3):
+        try:
+            await validateur.valider_fingerprint('z2i3XjxFakeFingerprint')
+            raise AssertionError('CertificatIndisponible attendu')
+        except CertificatIndisponible:
+            pass
+        assert producer.nombre_requetes == 2 * (i + 1)
+    assert validateur.get_statistiques_cache()['inconnus']['taille'] == 0
+    logger.info("test_timeout_non_conserve OK")
+
+
+async def run_tests():
+    await test_cache_negatif()
+    await test_cache_negatif_desactive()
+    await test_timeout_non_conserve()
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    asyncio.run(run_tests())
+
+
+if __name__ == '__main__':
+    main()
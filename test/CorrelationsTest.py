@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import random
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.messages.MessagesModule import MessageConsumer, MessagesModule, MessageWrapper, \
+    MessagePending, MessageProducerFormatteur, RessourcesConsommation, CorrelationReponse
+
+logger = logging.getLogger(__name__)
+
+LOGGING_FORMAT = '%(asctime)s %(threadName)s %(levelname)s: %(message)s'
+
+
+class ReplyConsumerTest(MessageConsumer):
+
+    def __init__(self, module_messages: MessagesModule, ressources: RessourcesConsommation):
+        super().__init__(module_messages, ressources)
+        self.max_correlations = 0
+
+    def ack_message(self, message: MessageWrapper):
+        pass
+
+    async def ajouter_attendre_reponse(self, correlation_reponse):
+        await super().ajouter_attendre_reponse(correlation_reponse)
+        self.max_correlations = max(self.max_correlations, self.get_nombre_correlations())
+
+
+class ProducerEcho(MessageProducerFormatteur):
+    """
+    Producer sans MQ, repond a chaque requete avec son contenu apres un delai aleatoire.
+    Les requetes avec le champ silence ne recoivent pas de reponse.
+    """
+
+    async def send(self, message: MessagePending):
+        asyncio.create_task(self.__repondre(message))
+
+    async def __repondre(self, message: MessagePending):
+        await asyncio.sleep(random.random() / 50)
+        reponse = MessageWrapper(message.content, message.reply_to, 'reply', '', None, message.correlation_id, 1)
+        reponse.parsed = json.loads(message.content)
+        if reponse.parsed.get('silence') is True:
+            return
+        self._module_messages.get_reply_consumer().recevoir_message(reponse)
+
+
+async def preparer(nb_correlations_max: int) -> (MessagesModule, ProducerEcho, asyncio.Task):
+    module_messages = MessagesModule()
+
+    ressources = RessourcesConsommation(None, 'reply', nb_correlations_max=nb_correlations_max)
+    consumer = ReplyConsumerTest(module_messages, ressources)
+    module_messages.ajouter_consumer(consumer, reply=True)
+    tache_consumer = asyncio.create_task(consumer.run_async())
+    await asyncio.sleep(0)
+    consumer._event_channel.set()
+    consumer._event_consumer.set()
+
+    clecert = generer_self_signed_ed25519('correlations').clecertificat
+    producer = ProducerEcho(module_messages, clecert)
+    tache_producer = asyncio.create_task(producer.run_async())
+    producer.producer_pret().set()
+    await asyncio.sleep(0)
+
+    return consumer, producer, [tache_consumer, tache_producer]
+
+
+async def test_admission():
+    consumer, producer, taches = await preparer(5)
+
+    requetes = [
+        {'requete': {'compteur': i}, 'domaine': 'Test', 'action': 'echo', 'exchange': '1.public'}
+        for i in range(0, 200)
+    ]
+    reponses = await producer.executer_requetes_concurrentes(requetes, max_inflight=50)
+
+    # Reponses dans l'ordre des requetes
+    assert [r.parsed['compteur'] for r in reponses] == list(range(0, 200))
+    assert consumer.max_correlations == 5, consumer.max_correlations
+    assert consumer.get_nombre_correlations() == 0
+
+    for t in taches:
+        t.cancel()
+    logger.info("test_admission OK")
+
+
+async def test_max_inflight():
+    consumer, producer, taches = await preparer(1000)
+
+    requetes = [
+        {'requete': {'compteur': i}, 'domaine': 'Test', 'action': 'echo', 'exchange': '1.public'}
+        for i in range(0, 500)
+    ]
+    reponses = await producer.executer_requetes_concurrentes(requetes, max_inflight=64)
+
+    assert [r.parsed['compteur'] for r in reponses] == list(range(0, 500))
+    assert 1 < consumer.max_correlations <= 64, consumer.max_correlations
+
+    for t in taches:
+        t.cancel()
+    logger.info("test_max_inflight OK (max correlations %d)" % consumer.max_correlations)
+
+
+async def test_expiration():
+    consumer, producer, taches = await preparer(2)
+    loop = asyncio.get_running_loop()
+
+    # Correlations sans reponse, chacune expire a son propre timeout
+    debut = loop.time()
+    requetes = [
+        producer.executer_requete({'silence': True}, 'Test', 'echo', '1.public', timeout=0.05 * (i + 1))
+        for i in range(0, 4)
+    ]
+    resultats = await asyncio.gather(*requetes, return_exceptions=True)
+    duree = loop.time() - debut
+    assert all([isinstance(r, asyncio.TimeoutError) for r in resultats]), resultats
+    assert duree < 0.5, duree
+    assert consumer.get_nombre_correlations() == 0
+
+    # Les places sont liberees
+    reponse = await producer.executer_requete({'compteur': 1}, 'Test', 'echo', '1.public', timeout=1)
+    assert reponse.parsed['compteur'] == 1
+
+    # Correlation sans attente de reponse, retiree par le timer d'expiration
+    correlation = CorrelationReponse('sans-attente', 0.05)
+    await consumer.ajouter_attendre_reponse(correlation)
+    assert consumer.get_nombre_correlations() == 1
+    await asyncio.sleep(0.1)
+    assert consumer.get_nombre_correlations() == 0
+
+    for t in taches:
+        t.cancel()
+    logger.info("test_expiration OK (%.3f secondes)" % duree)
+
+
+async def test_erreur_emission():
+    consumer, producer, taches = await preparer(2)
+
+    async def emettre_erreur(*args, **kwargs):
+        raise Exception('Queue d\'emission pleine')
+
+    emettre = producer.emettre
+    producer.emettre = emettre_erreur
+    for _ in range(0, 5):
+        try:
+            await producer.executer_requete({'compteur': 1}, 'Test', 'echo', '1.public', timeout=10)
+            raise AssertionError('Exception attendue')
+        except AssertionError as e:
+            raise e
+        except Exception:
+            pass
+    assert consumer.get_nombre_correlations() == 0
+
+    # Les places sont liberees sans attendre l'expiration
+    producer.emettre = emettre
+    reponse = await producer.executer_requete({'compteur': 2}, 'Test', 'echo', '1.public', timeout=1)
+    assert reponse.parsed['compteur'] == 2
+
+    for t in taches:
+        t.cancel()
+    logger.info("test_erreur_emission OK")
+
+
+async def run_tests():
+    await test_admission()
+    await test_max_inflight()
+    await test_expiration()
+    await test_erreur_emission()
+
+
+def main():
+    logging.basicConfig(format=LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    asyncio.run(run_tests())
+
+
+if __name__ == '__main__':
+    main()
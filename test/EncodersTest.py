@@ -0,0 +1,82 @@
+import datetime
+import decimal
+import json
+import logging
+
+import pytz
+
+from millegrilles_messages.messages.Encoders import DateFormatEncoder, encoder_json_canonique, \
+    encoder_json_canonique_sans_cle
+from millegrilles_messages.messages.FormatteurMessages import preparer_message_bytes, parse_float
+
+logger = logging.getLogger(__name__)
+
+
+def preparer_message_bytes_reference(message: dict) -> bytes:
+    """ Ancienne methode (dumps/loads/dumps), sert de reference pour la compatibilite. """
+    transaction_temp = dict()
+    for key, value in message.items():
+        if not key.startswith('_'):
+            transaction_temp[key] = value
+
+    message_json = json.dumps(transaction_temp, ensure_ascii=False, cls=DateFormatEncoder)
+    message_json = json.loads(message_json, parse_float=parse_float)
+    message_json = json.dumps(message_json, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+    return bytes(message_json, 'utf-8')
+
+
+MESSAGES = [
+    {},
+    {'valeur': 1, 'texte': 'Du texte.'},
+    {'float_entier': 100.0, 'float': 100.5, 'negatif': -0.0, 'grand': 1e20, 'petit': 1.5e-7, 'exp': 1e300},
+    {'nan': float('nan'), 'inf': float('inf'), 'ninf': float('-inf')},
+    {'bool': True, 'faux': False, 'none': None, 'liste': [1, 2.0, 'trois', [4.0, {'cinq': 5.0}]]},
+    {'date': datetime.datetime(2022, 6, 1, 12, 30, tzinfo=pytz.UTC), 'jour': datetime.date(2022, 6, 1)},
+    {'decimal': decimal.Decimal('1.10'), 'bytes': b'abc', 'set': {1}, 'tuple': (1, 2.0)},
+    {'utf8': 'éàç ☃ \U0001F600', 'echappe': '"\\\n\t\x00', 'cle_é': 1},
+    {'zeta': 1, 'alpha': {'z': 1, 'a': 2, 'M': 3}, '_interne': 'retire', 'en-tete': {'hachage': 'x'}},
+    {'cles': {1: 'int', 2.5: 'float', True: 'true', None: 'null', '3': 'str'}},
+    {'collision': {1: 'int', '1': 'str'}},
+]
+
+
+def test_compatibilite():
+    for message in MESSAGES:
+        reference = preparer_message_bytes_reference(message)
+        resultat = preparer_message_bytes(message)
+        if reference != resultat:
+            raise ValueError("Mismatch\n%s\n%s" % (reference, resultat))
+        logger.debug("OK : %s" % resultat.decode('utf-8'))
+
+
+def test_normalisation_optionnelle():
+    message = {'b': [1.0, 2.5], 'a': 'texte'}
+    resultat = encoder_json_canonique(message)
+    if resultat != b'{"a":"texte","b":[1,2.5]}':
+        raise ValueError("Mauvais encodage : %s" % resultat)
+
+
+def test_sans_cle():
+    for message in MESSAGES:
+        message = {k: v for k, v in message.items() if not k.startswith('_')}
+        message_sans_entete = {k: v for k, v in message.items() if k != 'en-tete'}
+        bytes_sans_entete, bytes_complets = encoder_json_canonique_sans_cle(message, 'en-tete')
+        if bytes_complets != encoder_json_canonique(message):
+            raise ValueError("Mismatch message complet : %s" % bytes_complets)
+        if bytes_sans_entete != encoder_json_canonique(message_sans_entete):
+            raise ValueError("Mismatch message sans en-tete : %s" % bytes_sans_entete)
+
+
+def main():
+    logging.basicConfig()
+    logging.getLogger(__name__).setLevel(logging.DEBUG)
+    logging.getLogger('millegrilles').setLevel(logging.DEBUG)
+
+    test_compatibilite()
+    test_normalisation_optionnelle()
+    test_sans_cle()
+
+
+if __name__ == '__main__':
+    main()
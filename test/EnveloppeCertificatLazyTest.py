@@ -0,0 +1,103 @@
+import logging
+import sys
+import time
+
+from cryptography.x509 import NameOID
+from cryptography.x509.extensions import ExtensionNotFound
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.certificats.CertificatsMillegrille import generer_csr_leaf
+from millegrilles_messages.certificats.CertificatsConfiguration import signer_configuration
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat, MQ_ROLES_OID, \
+    MQ_EXCHANGES_OID, MQ_DOMAINES_OID
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_ACCES = 10000
+
+
+def lire_extension(enveloppe: EnveloppeCertificat, oid):
+    """ Lecture directe (sans cache) pour comparaison. """
+    return enveloppe.certificat.extensions.get_extension_for_oid(oid).value.value.decode('utf-8')
+
+
+def preparer():
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    csr = generer_csr_leaf(root.enveloppe.idmg, 'lazy')
+    configuration = {
+        'roles': ['role1', 'role2'],
+        'exchanges': ['2.prive', '1.public'],
+        'domaines': ['DomaineA', 'DomaineB'],
+    }
+    enveloppe = signer_configuration(root, csr.get_pem_csr(), configuration)
+    return root, EnveloppeCertificat.from_pem(''.join(enveloppe.chaine_pem()))
+
+
+def test_valeurs():
+    root, enveloppe = preparer()
+
+    for _ in range(0, 2):  # Premier acces (calcul) et acces en cache
+        assert enveloppe.get_roles == lire_extension(enveloppe, MQ_ROLES_OID).split(',') == ['role1', 'role2']
+        assert enveloppe.get_exchanges == lire_extension(enveloppe, MQ_EXCHANGES_OID).split(',')
+        assert enveloppe.get_domaines == lire_extension(enveloppe, MQ_DOMAINES_OID).split(',')
+        assert enveloppe.subject_common_name == 'lazy'
+        assert enveloppe.subject_organization_name == root.enveloppe.idmg
+        assert enveloppe.subject_organizational_unit_name == \
+            enveloppe.certificat.subject.get_attributes_for_oid(NameOID.ORGANIZATIONAL_UNIT_NAME)[0].value
+        assert enveloppe.not_valid_after.tzinfo is not None
+        assert enveloppe.is_ca is False
+        assert root.enveloppe.is_ca is True
+
+    # Les listes retournees peuvent etre modifiees sans affecter l'enveloppe
+    enveloppe.get_roles.append('modifie')
+    assert enveloppe.get_roles == ['role1', 'role2']
+
+    # Extensions absentes : meme exception qu'avant
+    try:
+        root.enveloppe.get_roles
+        raise AssertionError('ExtensionNotFound attendue')
+    except ExtensionNotFound:
+        pass
+    try:
+        enveloppe.get_user_id
+        raise AssertionError('ExtensionNotFound attendue')
+    except ExtensionNotFound:
+        pass
+
+    # __slots__ : pas de __dict__
+    assert not hasattr(enveloppe, '__dict__')
+    logger.info("test_valeurs OK")
+
+
+def benchmark():
+    _root, enveloppe = preparer()
+
+    debut = time.perf_counter()
+    for _ in range(0, NOMBRE_ACCES):
+        lire_extension(enveloppe, MQ_ROLES_OID).split(',')
+        lire_extension(enveloppe, MQ_EXCHANGES_OID).split(',')
+        enveloppe.certificat.subject.get_attributes_for_oid(NameOID.ORGANIZATION_NAME)[0].value
+    duree_reference = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    for _ in range(0, NOMBRE_ACCES):
+        enveloppe.get_roles
+        enveloppe.get_exchanges
+        enveloppe.subject_organization_name
+    duree = time.perf_counter() - debut
+
+    logger.info("Lecture extensions a chaque acces : %8.0f acces/s" % (NOMBRE_ACCES / duree_reference))
+    logger.info("Accesseurs memoizes              : %8.0f acces/s" % (NOMBRE_ACCES / duree))
+    logger.info("Taille instance EnveloppeCertificat : %d octets" % sys.getsizeof(enveloppe))
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    test_valeurs()
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+
+from millegrilles_messages.messages.FileAttente import FileAttente, FileAttentePleine, POLITIQUE_ERREUR
+
+logger = logging.getLogger(__name__)
+
+LOGGING_FORMAT = '%(asctime)s %(threadName)s %(levelname)s: %(message)s'
+
+
+def test_fifo():
+    file_attente = FileAttente()
+    for i in range(0, 100):
+        file_attente.ajouter(i)
+
+    resultat = [file_attente.retirer() for _ in range(0, len(file_attente))]
+    assert resultat == list(range(0, 100))
+    assert file_attente.high_water == 100
+
+    try:
+        file_attente.retirer()
+        raise AssertionError('IndexError attendu')
+    except IndexError:
+        pass
+
+    logger.info("test_fifo OK")
+
+
+async def test_politique_erreur():
+    file_attente = FileAttente(2, POLITIQUE_ERREUR)
+    await file_attente.ajouter_attendre('a')
+    await file_attente.ajouter_attendre('b')
+    try:
+        await file_attente.ajouter_attendre('c')
+        raise AssertionError('FileAttentePleine attendu')
+    except FileAttentePleine:
+        pass
+
+    stats = file_attente.get_statistiques()
+    assert stats['profondeur'] == 2
+    assert stats['refus'] == 1
+    logger.info("test_politique_erreur OK %s" % stats)
+
+
+async def test_politique_bloquer():
+    file_attente = FileAttente(2)
+    await file_attente.ajouter_attendre(1)
+    await file_attente.ajouter_attendre(2)
+
+    tache = asyncio.create_task(file_attente.ajouter_attendre(3))
+    await asyncio.sleep(0.01)
+    assert tache.done() is False  # Bloque, file pleine
+
+    assert file_attente.retirer() == 1
+    await asyncio.wait_for(tache, 1)
+    assert [file_attente.retirer(), file_attente.retirer()] == [2, 3]
+
+    # Timeout si aucune place n'est liberee
+    await file_attente.ajouter_attendre(4)
+    await file_attente.ajouter_attendre(5)
+    try:
+        await file_attente.ajouter_attendre(6, timeout=0.05)
+        raise AssertionError('TimeoutError attendu')
+    except asyncio.TimeoutError:
+        pass
+
+    stats = file_attente.get_statistiques()
+    assert stats['high_water'] == 2
+    assert stats['attentes'] == 2
+    logger.info("test_politique_bloquer OK %s" % stats)
+
+
+async def run_tests():
+    test_fifo()
+    await test_politique_erreur()
+    await test_politique_bloquer()
+
+
+def main():
+    logging.basicConfig(format=LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    asyncio.run(run_tests())
+
+
+if __name__ == '__main__':
+    main()
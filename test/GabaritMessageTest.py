@@ -0,0 +1,87 @@
+import asyncio
+import json
+import logging
+import time
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.Encoders import encoder_json_canonique
+from millegrilles_messages.messages.FormatteurMessages import SignateurTransactionSimple, \
+    FormatteurMessageMilleGrilles
+from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificatCache
+from millegrilles_messages.messages.ValidateurMessage import ValidateurMessage
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_MESSAGES = 2000
+
+
+def preparer_formatteur():
+    clecert = generer_self_signed_ed25519('gabarit').clecertificat
+    formatteur = FormatteurMessageMilleGrilles(clecert.enveloppe.idmg, SignateurTransactionSimple(clecert))
+    return clecert, formatteur
+
+
+async def test_equivalence():
+    clecert, formatteur = preparer_formatteur()
+    validateur = ValidateurMessage(ValidateurCertificatCache(clecert.enveloppe))
+
+    contenu = {'valeur': 100.0, 'texte': 'Du texte accentue : éàç', 'liste': [1, 2.5, {'b': 1, 'a': None}],
+               '_ignore': 'retire', 'en-tete': {'ancien': True}}
+    gabarit = formatteur.get_gabarit('evenement', 'Domaine', 'action', 'partition', 2, '2.prive')
+    assert gabarit.routing_key == 'evenement.Domaine.partition.action'
+    assert gabarit.exchanges == ['2.prive']
+    assert formatteur.get_gabarit('evenement', 'Domaine', 'action', 'partition', 2, ['2.prive']) is gabarit
+
+    message, uuid_transaction, message_bytes = formatteur.signer_message_gabarit(contenu, gabarit)
+
+    # Les bytes emis correspondent au message retourne
+    assert json.loads(message_bytes) == message
+    assert message_bytes == encoder_json_canonique(message)
+
+    # Meme en-tete que signer_message
+    message_reference, _uuid = formatteur.signer_message(contenu, 'Domaine', 2, action='action', partition='partition')
+    entete = message[Constantes.MESSAGE_ENTETE]
+    entete_reference = message_reference[Constantes.MESSAGE_ENTETE]
+    assert entete['uuid_transaction'] == str(uuid_transaction)
+    assert sorted(entete.keys()) == sorted(entete_reference.keys())
+    assert entete['hachage_contenu'] == entete_reference['hachage_contenu']
+
+    # Le message est valide (hachage, signature)
+    await validateur.verifier(json.loads(message_bytes))
+    await validateur.verifier(message_reference)
+    logger.info("test_equivalence OK")
+
+
+def benchmark():
+    _clecert, formatteur = preparer_formatteur()
+    contenu = {'compteur': 0, 'texte': 'evenement ' * 20, 'valeurs': list(range(0, 50))}
+
+    debut = time.perf_counter()
+    for i in range(0, NOMBRE_MESSAGES):
+        contenu['compteur'] = i
+        message, _uuid = formatteur.signer_message(contenu, 'Domaine', 1, action='action')
+        rk = '.'.join(['evenement', 'Domaine', 'action'])
+        json.dumps(message)
+    duree_reference = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    for i in range(0, NOMBRE_MESSAGES):
+        contenu['compteur'] = i
+        gabarit = formatteur.get_gabarit('evenement', 'Domaine', 'action', exchanges='2.prive')
+        formatteur.signer_message_gabarit(contenu, gabarit)
+    duree_gabarit = time.perf_counter() - debut
+
+    logger.info("signer_message + json.dumps : %8.0f messages/s" % (NOMBRE_MESSAGES / duree_reference))
+    logger.info("signer_message_gabarit      : %8.0f messages/s" % (NOMBRE_MESSAGES / duree_gabarit))
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    asyncio.run(test_equivalence())
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import secrets
+import time
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+from millegrilles_messages.chiffrage.Mgs4 import CipherMgs4
+from millegrilles_messages.chiffrage.Mgs4p import CipherMgs4p
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.Hachage import Hacheur, HacheurMultiple, VerificateurHachage, ErreurHachage, \
+    HASHLIB_PAR_CODE, creer_contexte_hachage, hacher, verifier_hachage
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+TAILLE_DATA = 64 * MB
+TAILLE_BLOC = 64 * 1024
+NOMBRE_PETITES_VALEURS = 20000
+CODES = ['sha2-256', 'sha2-512', 'blake2b-512', 'blake2s-256']
+
+
+def test_equivalence():
+    data = secrets.token_bytes(3 * MB + 5)
+    vue = memoryview(data)
+    for code in CODES:
+        natif = creer_contexte_hachage(code)
+        reference = creer_contexte_hachage(code, natif=False)
+        for i in range(0, len(data), TAILLE_BLOC):
+            natif.update(vue[i:i + TAILLE_BLOC])
+            reference.update(data[i:i + TAILLE_BLOC])
+        assert natif.digest() == reference.digest(), code
+
+    # Plusieurs hachages en une passe
+    hacheur = HacheurMultiple(['blake2b-512', 'sha2-256'])
+    for i in range(0, len(data), TAILLE_BLOC):
+        hacheur.update(vue[i:i + TAILLE_BLOC])
+    hachages = hacheur.get_hachages()
+    # Meme encoding par defaut que Hacheur (base64)
+    assert hacheur.finalize() == hachages['blake2b-512'] == hacher(data, 'blake2b-512', 'base64')
+    assert hachages['sha2-256'] == hacher(data, 'sha2-256', 'base64')
+    assert hacheur.get_digests()['sha2-256'] == hashlib.sha256(data).digest()
+
+    verificateur = VerificateurHachage([hachages['blake2b-512'], hachages['sha2-256']])
+    verificateur.update(vue)
+    assert verificateur.verify() is True
+
+    verificateur = VerificateurHachage([hachages['blake2b-512'], hacher(b'autre', 'sha2-256')])
+    verificateur.update(data)
+    try:
+        verificateur.verify()
+        raise AssertionError('ErreurHachage attendue')
+    except ErreurHachage:
+        pass
+
+    # Hachage du contenu chiffre pendant le chiffrage
+    for classe_cipher in [CipherMgs4, CipherMgs4p]:
+        hacheur = HacheurMultiple(['blake2b-512', 'sha2-256'], 'base58btc')  # Encoding de hachage_bytes
+        cipher = classe_cipher(X25519PrivateKey.generate().public_key(), hacheur=hacheur)
+        data_chiffre = cipher.update(vue)
+        data_final = cipher.finalize()
+        # mgs4 : le chunk final n'est pas inclus dans hachage_bytes (format existant)
+        if classe_cipher is CipherMgs4p:
+            data_chiffre += data_final
+        info = cipher.get_info_dechiffrage()
+        assert verifier_hachage(info['hachage_bytes'], data_chiffre)
+        assert verifier_hachage(hacheur.get_hachages()['sha2-256'], data_chiffre)
+
+    logger.info("test_equivalence OK")
+
+
+def mesurer_flux(code: str, natif: bool, vue: memoryview) -> float:
+    debut = time.perf_counter()
+    context = creer_contexte_hachage(code, natif=natif)
+    for i in range(0, len(vue), TAILLE_BLOC):
+        context.update(vue[i:i + TAILLE_BLOC])
+    context.digest()
+    return len(vue) / MB / (time.perf_counter() - debut)
+
+
+def mesurer_petites_valeurs(code: str, natif: bool) -> float:
+    valeur = secrets.token_bytes(32)
+    debut = time.perf_counter()
+    for _ in range(0, NOMBRE_PETITES_VALEURS):
+        context = creer_contexte_hachage(code, natif=natif)
+        context.update(valeur)
+        context.digest()
+    return NOMBRE_PETITES_VALEURS / (time.perf_counter() - debut)
+
+
+def benchmark():
+    data = secrets.token_bytes(TAILLE_DATA)
+    vue = memoryview(data)
+
+    logger.info("Code          | hashlib MB/s | cryptography MB/s | hashlib 32 octets/s | cryptography 32 octets/s")
+    for code in CODES:
+        logger.info("%-13s | %12.1f | %17.1f | %19.0f | %24.0f" % (
+            code, mesurer_flux(code, True, vue), mesurer_flux(code, False, vue),
+            mesurer_petites_valeurs(code, True), mesurer_petites_valeurs(code, False)))
+
+    # blake2b-512 + sha2-256 : une passe avec HacheurMultiple vs deux passes
+    debut = time.perf_counter()
+    for code in ['blake2b-512', 'sha2-256']:
+        hacheur = Hacheur(code)
+        for i in range(0, len(vue), TAILLE_BLOC):
+            hacheur.update(vue[i:i + TAILLE_BLOC])
+        hacheur.finalize()
+    duree_passes = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    hacheur = HacheurMultiple(['blake2b-512', 'sha2-256'])
+    for i in range(0, len(vue), TAILLE_BLOC):
+        hacheur.update(vue[i:i + TAILLE_BLOC])
+    hacheur.get_hachages()
+    duree_multiple = time.perf_counter() - debut
+
+    logger.info("blake2b-512 + sha2-256, deux passes   : %7.1f MB/s" % (TAILLE_DATA / MB / duree_passes))
+    logger.info("blake2b-512 + sha2-256, HacheurMultiple : %7.1f MB/s" % (TAILLE_DATA / MB / duree_multiple))
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    assert sorted(HASHLIB_PAR_CODE.keys()) == [0x12, 0x13, 0xb240, 0xb260]
+    test_equivalence()
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
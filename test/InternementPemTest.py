@@ -0,0 +1,99 @@
+import datetime
+import logging
+import time
+
+from cryptography import x509
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.certificats.CertificatsMillegrille import generer_csr_leaf
+from millegrilles_messages.certificats.CertificatsConfiguration import signer_configuration
+from millegrilles_messages.certificats.Generes import CleCertificatGenere
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat, _internement
+from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificat
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_CHARGEMENTS = 5000
+
+
+def preparer():
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    csr = generer_csr_leaf(root.enveloppe.idmg, 'internement')
+    enveloppe = signer_configuration(root, csr.get_pem_csr(), {'roles': ['test']})
+    return root, ''.join(enveloppe.chaine_pem())
+
+
+def test_internement():
+    root, pem = preparer()
+
+    enveloppe = EnveloppeCertificat.from_pem(pem)
+    assert EnveloppeCertificat.from_pem(pem) is enveloppe
+    assert EnveloppeCertificat.from_pem(''.join([pem])) is enveloppe  # Nouvel objet str, meme contenu
+    assert EnveloppeCertificat.from_pem(pem.encode('utf-8')) is enveloppe
+    assert EnveloppeCertificat.from_pem(bytearray(pem.encode('utf-8'))) is enveloppe
+    assert EnveloppeCertificat.from_pem(memoryview(pem.encode('utf-8'))) is enveloppe
+
+    # Un certificat deja expire est conserve (validation avec date_reference)
+    name = x509.Name([x509.NameAttribute(x509.name.NameOID.COMMON_NAME, 'expire')])
+    builder = x509.CertificateBuilder().subject_name(name).issuer_name(name)
+    maintenant = datetime.datetime.utcnow()
+    expire = CleCertificatGenere.generer_certificat(
+        builder, not_valid_before=maintenant - datetime.timedelta(days=2),
+        not_valid_after=maintenant - datetime.timedelta(days=1))
+    pem_expire = ''.join(expire.get_pem_certificat())
+    assert EnveloppeCertificat.from_pem(pem_expire) is EnveloppeCertificat.from_pem(pem_expire)
+
+    logger.info("test_internement OK")
+
+
+def test_validateurs_distincts():
+    """
+    Une enveloppe partagee validee par une millegrille ne doit pas etre acceptee par une autre.
+    """
+    root, pem = preparer()
+    autre_root, _autre_pem = preparer()
+
+    validateur = ValidateurCertificat(root.enveloppe)
+    enveloppe = validateur.valider(pem)
+    assert enveloppe.est_verifie is True
+
+    autre_validateur = ValidateurCertificat(autre_root.enveloppe)
+    try:
+        autre_validateur.valider(pem)
+        raise AssertionError('Erreur de validation attendue')
+    except Exception as e:
+        assert not isinstance(e, AssertionError)
+
+    logger.info("test_validateurs_distincts OK")
+
+
+def benchmark():
+    _root, pem = preparer()
+
+    _internement.vider()
+    debut = time.perf_counter()
+    for _ in range(0, NOMBRE_CHARGEMENTS):
+        _internement.vider()
+        EnveloppeCertificat.from_pem(pem)
+    duree_reference = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    for _ in range(0, NOMBRE_CHARGEMENTS):
+        EnveloppeCertificat.from_pem(''.join([pem]))
+    duree = time.perf_counter() - debut
+
+    logger.info("from_pem, parsing complet : %8.0f chargements/s" % (NOMBRE_CHARGEMENTS / duree_reference))
+    logger.info("from_pem, chaine connue   : %8.0f chargements/s" % (NOMBRE_CHARGEMENTS / duree))
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    test_internement()
+    test_validateurs_distincts()
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
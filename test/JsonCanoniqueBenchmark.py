@@ -0,0 +1,84 @@
+import datetime
+import json
+import logging
+import time
+
+import pytz
+
+from millegrilles_messages.messages.Encoders import DateFormatEncoder
+from millegrilles_messages.messages.FormatteurMessages import preparer_message_bytes, parse_float
+
+logger = logging.getLogger(__name__)
+
+TAILLES = [1024, 16 * 1024, 256 * 1024, 1024 * 1024, 5 * 1024 * 1024]
+
+
+def preparer_message_bytes_reference(message: dict) -> bytes:
+    """ Ancienne methode (dumps/loads/dumps) """
+    transaction_temp = dict()
+    for key, value in message.items():
+        if not key.startswith('_'):
+            transaction_temp[key] = value
+
+    message_json = json.dumps(transaction_temp, ensure_ascii=False, cls=DateFormatEncoder)
+    message_json = json.loads(message_json, parse_float=parse_float)
+    message_json = json.dumps(message_json, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+    return bytes(message_json, 'utf-8')
+
+
+def generer_message(taille: int) -> dict:
+    """ Genere un message avec un melange de types representatif (dicts, str, int, float, dates). """
+    date_reference = datetime.datetime(2022, 6, 1, tzinfo=pytz.UTC)
+    items = list()
+    message = {'domaine': 'Benchmark', 'items': items, 'date': date_reference}
+    taille_courante = 0
+    compteur = 0
+    while taille_courante < taille:
+        item = {
+            'uuid': 'item-%08d' % compteur,
+            'nom': 'Fichier numero %d.txt' % compteur,
+            'taille': compteur * 1024,
+            'ratio': compteur / 7,
+            'entier_float': float(compteur),
+            'tags': ['a', 'b', 'é'],
+            'date': date_reference,
+        }
+        items.append(item)
+        taille_courante += 180
+        compteur += 1
+
+    return message
+
+
+def mesurer(fonction, message: dict, repetitions: int) -> float:
+    debut = time.perf_counter()
+    for _ in range(0, repetitions):
+        fonction(message)
+    return (time.perf_counter() - debut) / repetitions
+
+
+def benchmark():
+    for taille in TAILLES:
+        message = generer_message(taille)
+        taille_reelle = len(preparer_message_bytes(message))
+        if preparer_message_bytes_reference(message) != preparer_message_bytes(message):
+            raise ValueError("Mismatch pour taille %d" % taille)
+
+        repetitions = max(3, int(2 * 1024 * 1024 / taille))
+        duree_reference = mesurer(preparer_message_bytes_reference, message, repetitions)
+        duree_canonique = mesurer(preparer_message_bytes, message, repetitions)
+
+        logger.info("Taille %8d bytes : reference %8.3f ms, canonique %8.3f ms (x%.2f)" % (
+            taille_reelle, duree_reference * 1000, duree_canonique * 1000, duree_reference / duree_canonique))
+
+
+def main():
+    logging.basicConfig()
+    logging.getLogger(__name__).setLevel(logging.INFO)
+
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import io
+import logging
+import random
+import secrets
+import time
+
+from millegrilles_messages.chiffrage.Mgs4p import LecteurMgs4p, DecipherMgs4p, CONST_TAILLE_BUFFER, \
+    CONST_TAILLE_DATA
+from millegrilles_messages.messages import Constantes
+
+from Mgs4pChiffrageTest import chiffrer
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+TAILLE_BENCHMARK = 256 * MB
+
+
+class FichierCompteur(io.BytesIO):
+    """ Fichier en memoire qui compte les octets lus. """
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.octets_lus = 0
+
+    def readinto(self, buffer) -> int:
+        taille = super().readinto(buffer)
+        self.octets_lus += taille
+        return taille
+
+
+def test_plages():
+    data = secrets.token_bytes(10 * CONST_TAILLE_DATA + 1234)
+    cle_secrete, info, data_chiffre = chiffrer(data, [])
+    lecteur = LecteurMgs4p(io.BytesIO(data_chiffre), cle_secrete, info['header'], nombre_threads=4)
+    assert lecteur.taille == len(data)
+
+    plages = [
+        (0, 0), (0, 1), (0, len(data)), (CONST_TAILLE_DATA - 1, 2), (CONST_TAILLE_DATA, CONST_TAILLE_DATA),
+        (3 * CONST_TAILLE_DATA + 5, 5 * CONST_TAILLE_DATA), (len(data) - 1, 10), (len(data), 10), (len(data) + 5, 1),
+        (10 * CONST_TAILLE_DATA, 1234), (9 * CONST_TAILLE_DATA + 7, 2000),
+    ]
+    aleatoire = random.Random(1)
+    for _ in range(0, 200):
+        offset = aleatoire.randrange(0, len(data))
+        plages.append((offset, aleatoire.randrange(0, 3 * CONST_TAILLE_DATA)))
+
+    for offset, length in plages:
+        assert lecteur.read(offset, length) == data[offset:offset + length], (offset, length)
+
+    # Contenu vide
+    cle_secrete, info, data_chiffre = chiffrer(b'', [])
+    lecteur = LecteurMgs4p(io.BytesIO(data_chiffre), cle_secrete, info['header'])
+    assert lecteur.taille == 0 and lecteur.read(0, 100) == b''
+
+    logger.info("test_plages OK")
+
+
+def test_chunks_lus():
+    data = secrets.token_bytes(50 * CONST_TAILLE_DATA + 10)
+    cle_secrete, info, data_chiffre = chiffrer(data, [])
+    fichier = FichierCompteur(data_chiffre)
+    lecteur = LecteurMgs4p(fichier, cle_secrete, info['header'])
+
+    # Seul le chunk final est lu a l'ouverture
+    assert fichier.octets_lus == len(data_chiffre) % CONST_TAILLE_BUFFER
+
+    fichier.octets_lus = 0
+    assert lecteur.read(20 * CONST_TAILLE_DATA + 100, 200) == data[20 * CONST_TAILLE_DATA + 100:20 * CONST_TAILLE_DATA + 300]
+    assert fichier.octets_lus == CONST_TAILLE_BUFFER
+
+    fichier.octets_lus = 0
+    offset = 20 * CONST_TAILLE_DATA - 10
+    assert lecteur.read(offset, 20) == data[offset:offset + 20]
+    assert fichier.octets_lus == 2 * CONST_TAILLE_BUFFER
+
+    logger.info("test_chunks_lus OK")
+
+
+def test_alterations():
+    data = secrets.token_bytes(6 * CONST_TAILLE_DATA + 500)
+    cle_secrete, info, data_chiffre = chiffrer(data, [])
+
+    # Fichier tronque detecte a l'ouverture
+    for tronque in [data_chiffre[:-1], data_chiffre[:6 * CONST_TAILLE_BUFFER], data_chiffre[:3 * CONST_TAILLE_BUFFER + 5]]:
+        try:
+            LecteurMgs4p(io.BytesIO(tronque), cle_secrete, info['header'])
+            raise AssertionError('Troncature non detectee')
+        except AssertionError as e:
+            raise e
+        except Exception:
+            pass
+
+    # Chunk altere : seules les lectures qui le couvrent echouent
+    altere = bytearray(data_chiffre)
+    altere[2 * CONST_TAILLE_BUFFER + 100] ^= 0x01
+    lecteur = LecteurMgs4p(io.BytesIO(bytes(altere)), cle_secrete, info['header'])
+    assert lecteur.read(0, 2 * CONST_TAILLE_DATA) == data[:2 * CONST_TAILLE_DATA]
+    assert lecteur.read(3 * CONST_TAILLE_DATA, 100) == data[3 * CONST_TAILLE_DATA:3 * CONST_TAILLE_DATA + 100]
+    try:
+        lecteur.read(2 * CONST_TAILLE_DATA + 10, 1)
+        raise AssertionError('Alteration non detectee')
+    except AssertionError as e:
+        raise e
+    except Exception:
+        pass
+
+    logger.info("test_alterations OK")
+
+
+def benchmark():
+    data = secrets.token_bytes(TAILLE_BENCHMARK)
+    cle_secrete, info, data_chiffre = chiffrer(data, [])
+    del data
+
+    debut = time.perf_counter()
+    decipher = DecipherMgs4p(cle_secrete, info['header'])
+    decipher.update(data_chiffre)
+    decipher.finalize()
+    duree_complet = time.perf_counter() - debut
+
+    lecteur = LecteurMgs4p(io.BytesIO(data_chiffre), cle_secrete, info['header'])
+    aleatoire = random.Random(2)
+    nombre_lectures = 1000
+    debut = time.perf_counter()
+    for _ in range(0, nombre_lectures):
+        lecteur.read(aleatoire.randrange(0, lecteur.taille), 64 * 1024)
+    duree_lecture = (time.perf_counter() - debut) / nombre_lectures
+
+    logger.info("Dechiffrage complet (%d MB) : %8.1f ms" % (TAILLE_BENCHMARK // MB, duree_complet * 1000))
+    logger.info("Lecture aleatoire de 64 KB  : %8.3f ms" % (duree_lecture * 1000))
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    test_plages()
+    test_chunks_lus()
+    test_alterations()
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
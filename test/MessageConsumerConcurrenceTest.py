@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import random
+
+from millegrilles_messages.messages.MessagesModule import MessageConsumer, MessagesModule, MessageWrapper, \
+    RessourcesConsommation, ordonnancement_routing_key
+
+logger = logging.getLogger(__name__)
+
+LOGGING_FORMAT = '%(asctime)s %(threadName)s %(levelname)s: %(message)s'
+
+
+class ConsumerTest(MessageConsumer):
+    """
+    Consumer sans connexion MQ, les ACK sont conserves en memoire.
+    """
+
+    def __init__(self, ressources: RessourcesConsommation):
+        super().__init__(MessagesModule(), ressources)
+        self.acks = list()
+
+    def ack_message(self, message: MessageWrapper):
+        self.acks.append(message.delivery_tag)
+
+
+class Compteur:
+
+    def __init__(self):
+        self.actifs = 0
+        self.max_actifs = 0
+        self.traites = list()
+
+    async def callback(self, message: MessageWrapper, _module):
+        self.actifs += 1
+        self.max_actifs = max(self.max_actifs, self.actifs)
+        try:
+            await asyncio.sleep(random.random() / 100)
+            if message.contenu == b'erreur':
+                raise Exception('erreur test')
+            self.traites.append((message.routing_key, message.delivery_tag))
+        finally:
+            self.actifs -= 1
+
+
+async def executer(ressources: RessourcesConsommation, messages: list):
+    consumer = ressources.consumer
+    tache = asyncio.create_task(consumer.run_async())
+    await asyncio.sleep(0)
+    consumer._event_channel.set()
+    consumer._event_consumer.set()
+    await asyncio.sleep(0)
+
+    for message in messages:
+        consumer.recevoir_message(message)
+
+    for _ in range(500):
+        if len(consumer.acks) == len(messages):
+            break
+        await asyncio.sleep(0.01)
+
+    await consumer.fermer()
+    await tache
+
+
+def preparer(compteur: Compteur, concurrence: int, cle_ordonnancement=None) -> RessourcesConsommation:
+    ressources = RessourcesConsommation(compteur.callback, 'Q', prefetch_count=20,
+                                        concurrence=concurrence, cle_ordonnancement=cle_ordonnancement)
+    ressources.consumer = ConsumerTest(ressources)
+    return ressources
+
+
+def generer_messages(nb: int, nb_cles: int, erreurs=True):
+    messages = list()
+    for i in range(0, nb):
+        contenu = b'erreur' if erreurs and i % 17 == 0 else b'{}'
+        messages.append(MessageWrapper(contenu, 'rk.%d' % (i % nb_cles), 'Q', 'ex', None, None, i + 1))
+    return messages
+
+
+async def test_sequentiel():
+    compteur = Compteur()
+    ressources = preparer(compteur, 1)
+    messages = generer_messages(20, 3, erreurs=False)
+    await executer(ressources, messages)
+
+    assert compteur.max_actifs == 1
+    assert ressources.consumer.acks == [m.delivery_tag for m in messages]
+    logger.info("test_sequentiel OK")
+
+
+async def test_concurrent():
+    compteur = Compteur()
+    ressources = preparer(compteur, 8)
+    messages = generer_messages(100, 5)
+    await executer(ressources, messages)
+
+    assert 1 < compteur.max_actifs <= 8, compteur.max_actifs
+    assert sorted(ressources.consumer.acks) == [m.delivery_tag for m in messages]
+    logger.info("test_concurrent OK (max actifs %d)" % compteur.max_actifs)
+
+
+async def test_ordonnancement():
+    compteur = Compteur()
+    ressources = preparer(compteur, 4, ordonnancement_routing_key)
+    messages = generer_messages(100, 3)
+    await executer(ressources, messages)
+
+    assert 1 < compteur.max_actifs <= 3, compteur.max_actifs
+    assert sorted(ressources.consumer.acks) == [m.delivery_tag for m in messages]
+
+    # L'ordre de traitement est preserve pour chaque routing key
+    for cle in set(m.routing_key for m in messages):
+        tags = [t for rk, t in compteur.traites if rk == cle]
+        assert tags == sorted(tags), cle
+    logger.info("test_ordonnancement OK (max actifs %d)" % compteur.max_actifs)
+
+
+async def run_tests():
+    await test_sequentiel()
+    await test_concurrent()
+    await test_ordonnancement()
+
+
+def main():
+    logging.basicConfig(format=LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    logging.getLogger('millegrilles_messages.messages.MessagesModule').setLevel(logging.CRITICAL)
+    asyncio.run(run_tests())
+
+
+if __name__ == '__main__':
+    main()
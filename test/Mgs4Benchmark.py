@@ -0,0 +1,176 @@
+import logging
+import secrets
+import sys
+import time
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from nacl.bindings.crypto_secretstream import (
+    crypto_secretstream_xchacha20poly1305_TAG_FINAL,
+    crypto_secretstream_xchacha20poly1305_init_pull,
+    crypto_secretstream_xchacha20poly1305_pull,
+    crypto_secretstream_xchacha20poly1305_state,
+)
+
+from millegrilles_messages.chiffrage.Mgs4 import CipherMgs4, DecipherMgs4, CONST_TAILLE_BUFFER, CONST_TAILLE_DATA
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.Hachage import hacher_to_digest, decoder_multibase
+
+logger = logging.getLogger(__name__)
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+TAILLES = [KB, 64 * KB, MB, 16 * MB, 256 * MB]
+TAILLES_COMPLET = TAILLES + [GB]    # Argument --complet
+TAILLE_MAX_REFERENCE = 16 * MB      # Implementation precedente quadratique
+
+
+class DecipherReference:
+    """ Dechiffrage avec concatenation de bytes (implementation precedente). """
+
+    def __init__(self, cle_secrete: bytes, header: bytes):
+        self.__state = crypto_secretstream_xchacha20poly1305_state()
+        crypto_secretstream_xchacha20poly1305_init_pull(self.__state, header, cle_secrete)
+        self.__buffer = bytes()
+
+    def update(self, data: bytes) -> bytes:
+        data_out = bytes()
+        while len(data) > 0:
+            taille_chunk = min(CONST_TAILLE_BUFFER - len(self.__buffer), len(data))
+            self.__buffer = self.__buffer + data[:taille_chunk]
+            data = data[taille_chunk:]
+            if len(self.__buffer) == CONST_TAILLE_BUFFER:
+                data_dechiffre, _tag = crypto_secretstream_xchacha20poly1305_pull(self.__state, self.__buffer)
+                data_out = data_out + data_dechiffre
+                self.__buffer = bytes()
+        return data_out
+
+    def finalize(self) -> bytes:
+        data_out, tag = crypto_secretstream_xchacha20poly1305_pull(self.__state, self.__buffer)
+        assert tag == crypto_secretstream_xchacha20poly1305_TAG_FINAL
+        return data_out
+
+
+def preparer_cipher():
+    cle_privee = X25519PrivateKey.generate()
+    cipher = CipherMgs4(cle_privee.public_key())
+    return cle_privee, cipher
+
+
+def cle_secrete(cle_privee: X25519PrivateKey, cipher: CipherMgs4) -> bytes:
+    info = cipher.get_info_dechiffrage()
+    peer = X25519PublicKey.from_public_bytes(decoder_multibase(info['cle']))
+    return hacher_to_digest(cle_privee.exchange(peer), 'blake2s-256')
+
+
+def chiffrer(data: bytes, tailles_update: list) -> tuple:
+    cle_privee, cipher = preparer_cipher()
+    morceaux = list()
+    position = 0
+    for taille in tailles_update:
+        morceaux.append(cipher.update(memoryview(data)[position:position + taille]))
+        position += taille
+    morceaux.append(cipher.update(data[position:]))
+    morceaux.append(cipher.finalize())
+    return cle_secrete(cle_privee, cipher), cipher.header, b''.join(morceaux)
+
+
+def test_equivalence():
+    for taille in [0, 1, CONST_TAILLE_DATA - 1, CONST_TAILLE_DATA, CONST_TAILLE_DATA + 1, 3 * CONST_TAILLE_DATA + 17]:
+        data = secrets.token_bytes(taille)
+        cle, header, data_chiffre = chiffrer(data, [1, 7, CONST_TAILLE_DATA, 3])
+
+        # Meme format : dechiffre par l'implementation precedente
+        reference = DecipherReference(cle, header)
+        assert reference.update(data_chiffre) + reference.finalize() == data
+
+        # Dechiffrage en morceaux de tailles variees avec update et update_into
+        decipher = DecipherMgs4(cle, header)
+        sortie = bytearray(decipher.get_taille_sortie(len(data_chiffre)))
+        position_sortie = 0
+        position = 0
+        for taille_morceau in [5, CONST_TAILLE_BUFFER + 3, 1, len(data_chiffre)]:
+            morceau = memoryview(data_chiffre)[position:position + taille_morceau]
+            position_sortie += decipher.update_into(morceau, memoryview(sortie)[position_sortie:])
+            position += len(morceau)
+        assert bytes(sortie[:position_sortie]) + decipher.finalize() == data
+
+        decipher = DecipherMgs4(cle, header)
+        assert decipher.update(bytearray(data_chiffre)) + decipher.finalize() == data
+
+    # Buffer de sortie trop petit
+    _cle_privee, cipher = preparer_cipher()
+    try:
+        cipher.update_into(bytes(CONST_TAILLE_DATA), bytearray(CONST_TAILLE_BUFFER - 1))
+        raise AssertionError('ValueError attendu')
+    except ValueError:
+        pass
+
+    # Chunk altere
+    data = secrets.token_bytes(2 * CONST_TAILLE_DATA)
+    cle, header, data_chiffre = chiffrer(data, [])
+    data_chiffre = bytearray(data_chiffre)
+    data_chiffre[CONST_TAILLE_BUFFER + 10] ^= 1
+    try:
+        DecipherMgs4(cle, header).update(data_chiffre)
+        raise AssertionError('Exception attendue')
+    except AssertionError as e:
+        raise e
+    except Exception:
+        pass
+
+    logger.info("test_equivalence OK")
+
+
+def mesurer(fonction, taille: int) -> float:
+    debut = time.perf_counter()
+    fonction()
+    duree = time.perf_counter() - debut
+    return taille / MB / duree
+
+
+def benchmark(tailles: list):
+    logger.info("Taille      | chiffrer update | update_into | dechiffrer update | update_into | precedent (MB/s)")
+    for taille in tailles:
+        data = secrets.token_bytes(taille)
+
+        cle_privee, cipher = preparer_cipher()
+        mbs_chiffrer = mesurer(lambda: cipher.update(data), taille)
+
+        cle_privee, cipher = preparer_cipher()
+        data_chiffre = bytearray(cipher.get_taille_sortie(taille))
+        mbs_chiffrer_into = mesurer(lambda: cipher.update_into(data, data_chiffre), taille)
+        cle, header = cle_secrete(cle_privee, cipher), cipher.header
+        del data
+
+        decipher = DecipherMgs4(cle, header)
+        mbs_dechiffrer = mesurer(lambda: decipher.update(data_chiffre), taille)
+
+        decipher = DecipherMgs4(cle, header)
+        sortie = bytearray(decipher.get_taille_sortie(len(data_chiffre)))
+        mbs_dechiffrer_into = mesurer(lambda: decipher.update_into(data_chiffre, sortie), taille)
+        del sortie
+
+        reference = '%9s' % 'n/a'
+        if taille <= TAILLE_MAX_REFERENCE:
+            decipher = DecipherReference(cle, header)
+            data_chiffre = bytes(data_chiffre)
+            reference = '%9.1f' % mesurer(lambda: decipher.update(data_chiffre), taille)
+
+        logger.info("%8d KB | %15.1f | %11.1f | %17.1f | %11.1f | %s" % (
+            taille // KB, mbs_chiffrer, mbs_chiffrer_into, mbs_dechiffrer, mbs_dechiffrer_into, reference))
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    test_equivalence()
+    if '--complet' in sys.argv:
+        benchmark(TAILLES_COMPLET)
+    else:
+        benchmark(TAILLES)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import logging
+import secrets
+import time
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+
+from millegrilles_messages.chiffrage.Mgs4p import CipherMgs4p, DecipherMgs4p, CONST_TAILLE_BUFFER, \
+    CONST_TAILLE_DATA, FORMAT_MGS4P
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.Hachage import hacher_to_digest, decoder_multibase, verifier_hachage
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+TAILLE_BENCHMARK = 128 * MB
+
+
+def chiffrer(data: bytes, tailles_update: list, nombre_threads=None) -> tuple:
+    cle_privee = X25519PrivateKey.generate()
+    cipher = CipherMgs4p(cle_privee.public_key(), nombre_threads=nombre_threads)
+
+    morceaux = list()
+    position = 0
+    for taille in tailles_update:
+        morceaux.append(cipher.update(memoryview(data)[position:position + taille]))
+        position += taille
+    morceaux.append(cipher.update(data[position:]))
+    morceaux.append(cipher.finalize())
+
+    info = cipher.get_info_dechiffrage()
+    peer = X25519PublicKey.from_public_bytes(decoder_multibase(info['cle']))
+    cle_secrete = hacher_to_digest(cle_privee.exchange(peer), 'blake2s-256')
+
+    return cle_secrete, info, b''.join(morceaux)
+
+
+def dechiffrer(cle_secrete: bytes, info: dict, data_chiffre: bytes, taille_update=None, nombre_threads=None) -> bytes:
+    decipher = DecipherMgs4p(cle_secrete, info['header'], nombre_threads=nombre_threads)
+    if taille_update is None:
+        taille_update = max(1, len(data_chiffre))
+    morceaux = [decipher.update(data_chiffre[i:i + taille_update])
+                for i in range(0, len(data_chiffre), taille_update)]
+    morceaux.append(decipher.finalize())
+    return b''.join(morceaux)
+
+
+def assert_invalide(cle_secrete: bytes, info: dict, data_chiffre: bytes, description: str):
+    try:
+        dechiffrer(cle_secrete, info, data_chiffre)
+    except Exception:
+        return
+    raise AssertionError("%s non detecte" % description)
+
+
+def test_aller_retour():
+    tailles = [0, 1, CONST_TAILLE_DATA - 1, CONST_TAILLE_DATA, CONST_TAILLE_DATA + 1, 20 * CONST_TAILLE_DATA + 5]
+    for taille in tailles:
+        data = secrets.token_bytes(taille)
+        cle_secrete, info, data_chiffre = chiffrer(data, [3, CONST_TAILLE_DATA - 2, 1])
+
+        assert info['format'] == FORMAT_MGS4P
+        assert verifier_hachage(info['hachage_bytes'], data_chiffre)
+
+        # Chunks de taille fixe, le dernier est plus court
+        assert len(data_chiffre) == len(data) // CONST_TAILLE_DATA * CONST_TAILLE_BUFFER + \
+               len(data) % CONST_TAILLE_DATA + (CONST_TAILLE_BUFFER - CONST_TAILLE_DATA)
+
+        for taille_update in [None, 7, CONST_TAILLE_BUFFER + 1]:
+            for nombre_threads in [1, 4]:
+                assert dechiffrer(cle_secrete, info, data_chiffre, taille_update, nombre_threads) == data
+
+    # Chiffrage parallele et sequentiel produisent le meme format
+    data = secrets.token_bytes(40 * CONST_TAILLE_DATA + 100)
+    cle_secrete, info, data_chiffre = chiffrer(data, [], nombre_threads=8)
+    assert dechiffrer(cle_secrete, info, data_chiffre, CONST_TAILLE_BUFFER, nombre_threads=1) == data
+
+    logger.info("test_aller_retour OK")
+
+
+def test_alterations():
+    data = secrets.token_bytes(5 * CONST_TAILLE_DATA + 1000)
+    cle_secrete, info, data_chiffre = chiffrer(data, [])
+    chunks = [data_chiffre[i:i + CONST_TAILLE_BUFFER] for i in range(0, len(data_chiffre), CONST_TAILLE_BUFFER)]
+    assert len(chunks) == 6
+
+    altere = bytearray(data_chiffre)
+    altere[2 * CONST_TAILLE_BUFFER + 50] ^= 0x01
+    assert_invalide(cle_secrete, info, bytes(altere), 'Alteration')
+
+    reordonne = chunks[0] + chunks[2] + chunks[1] + b''.join(chunks[3:])
+    assert_invalide(cle_secrete, info, reordonne, 'Reordonnancement')
+
+    assert_invalide(cle_secrete, info, b''.join(chunks[:-1]), 'Troncature (frontiere de chunk)')
+    assert_invalide(cle_secrete, info, data_chiffre[:-10], 'Troncature (dernier chunk)')
+    assert_invalide(cle_secrete, info, b''.join(chunks[:3]) + chunks[-1], 'Retrait de chunks')
+    assert_invalide(cle_secrete, info, data_chiffre + chunks[1], 'Ajout de chunk')
+    assert_invalide(cle_secrete, info, b'', 'Fichier vide')
+
+    autre_cle = secrets.token_bytes(32)
+    assert_invalide(autre_cle, info, data_chiffre, 'Mauvaise cle')
+
+    logger.info("test_alterations OK")
+
+
+def benchmark():
+    data = secrets.token_bytes(TAILLE_BENCHMARK)
+    cle_privee = X25519PrivateKey.generate()
+
+    for nombre_threads in [1, None]:
+        cipher = CipherMgs4p(cle_privee.public_key(), nombre_threads=nombre_threads)
+        sortie = bytearray(cipher.get_taille_sortie(len(data)))
+        debut = time.perf_counter()
+        cipher.update_into(data, sortie)
+        cipher.finalize()
+        duree = time.perf_counter() - debut
+        logger.info("Chiffrage mgs4p (threads : %s) : %7.1f MB/s" % (nombre_threads or 'cpus', TAILLE_BENCHMARK / MB / duree))
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    test_aller_retour()
+    test_alterations()
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
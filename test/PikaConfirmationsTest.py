@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import pika
+import tempfile
+
+from os import path
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.messages.MessagesModule import MessageNonConfirme
+from millegrilles_messages.messages.ParamsEnvironnement import ConfigurationPika
+from millegrilles_messages.pika.PikaModule import PikaModuleProducer
+
+logger = logging.getLogger(__name__)
+
+LOGGING_FORMAT = '%(asctime)s %(threadName)s %(levelname)s: %(message)s'
+
+
+class ChannelFake:
+    """
+    Channel pika en memoire. Les confirmations sont declenchees manuellement par le test.
+    """
+
+    def __init__(self):
+        self.publications = list()
+        self.__callback_confirmation = None
+        self.__callbacks_fermeture = list()
+
+    def add_on_close_callback(self, callback):
+        self.__callbacks_fermeture.append(callback)
+
+    def confirm_delivery(self, ack_nack_callback, callback=None):
+        self.__callback_confirmation = ack_nack_callback
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.publications.append((exchange, routing_key, body))
+
+    def confirmer(self, delivery_tag: int, multiple=False, ack=True):
+        if ack is True:
+            method = pika.spec.Basic.Ack(delivery_tag=delivery_tag, multiple=multiple)
+        else:
+            method = pika.spec.Basic.Nack(delivery_tag=delivery_tag, multiple=multiple)
+        self.__callback_confirmation(pika.frame.Method(1, method))
+
+    def fermer(self, raison: str):
+        for callback in self.__callbacks_fermeture:
+            callback(self, raison)
+
+
+class ModuleFake:
+
+    def __init__(self, configuration: ConfigurationPika):
+        self.configuration = configuration
+        self.__loop = asyncio.get_running_loop()
+
+    def get_event_loop(self):
+        return self.__loop
+
+
+async def preparer_producer(repertoire: str, fenetre: int) -> (PikaModuleProducer, ChannelFake, asyncio.Task):
+    clecert = generer_self_signed_ed25519('producer')
+    path_cle = path.join(repertoire, 'cle.pem')
+    path_cert = path.join(repertoire, 'cert.pem')
+    with open(path_cle, 'w') as fichier:
+        fichier.write(clecert.get_pem_cle())
+    with open(path_cert, 'w') as fichier:
+        fichier.write(''.join(clecert.get_pem_certificat()))
+
+    configuration = ConfigurationPika()
+    configuration.key_pem_path = path_cle
+    configuration.cert_pem_path = path_cert
+    configuration.confirmations = True
+    configuration.fenetre_confirmations = fenetre
+
+    producer = PikaModuleProducer(ModuleFake(configuration))
+    channel = ChannelFake()
+    tache = asyncio.create_task(producer.run_async())
+    producer.set_channel(channel)
+    await asyncio.wait_for(producer.producer_pret().wait(), 1)
+    await asyncio.sleep(0)
+
+    return producer, channel, tache
+
+
+async def test_ack(repertoire: str):
+    producer, channel, tache = await preparer_producer(repertoire, 10)
+
+    emission = asyncio.create_task(producer.emettre('{}', 'rk', ['a', 'b'], attendre_confirmation=True))
+    await asyncio.sleep(0.01)
+    assert len(channel.publications) == 2
+    assert producer.get_nombre_non_confirmes() == 2
+
+    channel.confirmer(1)
+    await asyncio.sleep(0.01)
+    assert emission.done() is False  # Exchange b pas encore confirme
+
+    channel.confirmer(2)
+    await asyncio.wait_for(emission, 1)
+    assert producer.get_nombre_non_confirmes() == 0
+
+    tache.cancel()
+    logger.info("test_ack OK")
+
+
+async def test_nack(repertoire: str):
+    producer, channel, tache = await preparer_producer(repertoire, 10)
+
+    emissions = [
+        asyncio.create_task(producer.emettre('{}', 'rk.%d' % i, 'a', attendre_confirmation=True))
+        for i in range(0, 3)
+    ]
+    await asyncio.sleep(0.01)
+
+    channel.confirmer(1)
+    channel.confirmer(2, ack=False)
+    channel.confirmer(3)
+    resultats = await asyncio.gather(*emissions, return_exceptions=True)
+    assert resultats[0] is None
+    assert isinstance(resultats[1], MessageNonConfirme)
+    assert resultats[2] is None
+
+    tache.cancel()
+    logger.info("test_nack OK")
+
+
+async def test_fenetre(repertoire: str):
+    producer, channel, tache = await preparer_producer(repertoire, 4)
+
+    for i in range(0, 10):
+        await producer.emettre('{}', 'rk.%d' % i, 'a')
+    await asyncio.sleep(0.01)
+    assert len(channel.publications) == 4
+    assert producer.get_nombre_non_confirmes() == 4
+
+    channel.confirmer(3, multiple=True)
+    await asyncio.sleep(0.01)
+    assert len(channel.publications) == 7
+
+    channel.confirmer(7, multiple=True)
+    await asyncio.sleep(0.01)
+    assert len(channel.publications) == 10
+    assert [p[1] for p in channel.publications] == ['rk.%d' % i for i in range(0, 10)]
+
+    tache.cancel()
+    logger.info("test_fenetre OK")
+
+
+async def test_fermeture_channel(repertoire: str):
+    producer, channel, tache = await preparer_producer(repertoire, 10)
+
+    emission = asyncio.create_task(producer.emettre('{}', 'rk', 'a', attendre_confirmation=True))
+    await asyncio.sleep(0.01)
+
+    channel.fermer('test')
+    try:
+        await asyncio.wait_for(emission, 1)
+        raise AssertionError('MessageNonConfirme attendu')
+    except MessageNonConfirme:
+        pass
+    assert producer.get_nombre_non_confirmes() == 0
+
+    tache.cancel()
+    logger.info("test_fermeture_channel OK")
+
+
+async def run_tests():
+    with tempfile.TemporaryDirectory() as repertoire:
+        await test_ack(repertoire)
+        await test_nack(repertoire)
+        await test_fenetre(repertoire)
+        await test_fermeture_channel(repertoire)
+
+
+def main():
+    logging.basicConfig(format=LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    logging.getLogger('millegrilles_messages').setLevel(logging.ERROR)
+    asyncio.run(run_tests())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import asyncio
+import io
+import logging
+import secrets
+import tempfile
+import time
+
+from os import path
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+
+from millegrilles_messages.chiffrage.Mgs4 import CipherMgs4, DecipherMgs4
+from millegrilles_messages.chiffrage.Mgs4p import CipherMgs4p, DecipherMgs4p
+from millegrilles_messages.chiffrage.PipelineChiffrage import PipelineChiffrage
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.Hachage import hacher_to_digest, decoder_multibase
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+TAILLE_BENCHMARK = 128 * MB
+FORMATS = [(CipherMgs4, DecipherMgs4), (CipherMgs4p, DecipherMgs4p)]
+
+
+def preparer_cipher(classe_cipher):
+    cle_privee = X25519PrivateKey.generate()
+    return cle_privee, classe_cipher(cle_privee.public_key())
+
+
+def cle_secrete(cle_privee: X25519PrivateKey, cipher) -> bytes:
+    info = cipher.get_info_dechiffrage()
+    peer = X25519PublicKey.from_public_bytes(decoder_multibase(info['cle']))
+    return hacher_to_digest(cle_privee.exchange(peer), 'blake2s-256')
+
+
+class SourceLente:
+    """ Source async qui retourne de petits morceaux de taille irreguliere. """
+
+    def __init__(self, data: bytes):
+        self.__data = data
+        self.__position = 0
+        self.__compteur = 0
+
+    async def readinto(self, buffer: memoryview) -> int:
+        self.__compteur += 1
+        taille = min(len(buffer), 1000 + self.__compteur * 37 % 5000, len(self.__data) - self.__position)
+        buffer[:taille] = self.__data[self.__position:self.__position + taille]
+        self.__position += taille
+        await asyncio.sleep(0)
+        return taille
+
+
+async def test_fichiers():
+    for classe_cipher, classe_decipher in FORMATS:
+        for taille in [0, 10, 65536 * 3, 5 * MB + 7]:
+            data = secrets.token_bytes(taille)
+            cle_privee, cipher = preparer_cipher(classe_cipher)
+            reference = cipher.update(data) + cipher.finalize()
+
+            # Chiffrage avec le pipeline, source async irreguliere vers fichier en memoire
+            cle_privee, cipher = preparer_cipher(classe_cipher)
+            destination = io.BytesIO()
+            taille_ecrite = await PipelineChiffrage(cipher, chunks_par_bloc=3).run(SourceLente(data), destination)
+            data_chiffre = destination.getvalue()
+            assert taille_ecrite == len(data_chiffre) == len(reference)
+
+            # Dechiffrage fichier a fichier
+            with tempfile.TemporaryDirectory() as repertoire:
+                path_chiffre = path.join(repertoire, 'data.chiffre')
+                path_dechiffre = path.join(repertoire, 'data')
+                with open(path_chiffre, 'wb') as fichier:
+                    fichier.write(data_chiffre)
+
+                decipher = classe_decipher(cle_secrete(cle_privee, cipher), cipher.header)
+                with open(path_chiffre, 'rb') as fichier, open(path_dechiffre, 'wb') as fichier_output:
+                    await PipelineChiffrage(decipher).run(fichier, fichier_output)
+
+                with open(path_dechiffre, 'rb') as fichier:
+                    assert fichier.read() == data, (classe_cipher, taille)
+
+    logger.info("test_fichiers OK")
+
+
+async def test_subprocess():
+    """ Chiffrage vers le stdin d'un subprocess (cat), dechiffrage a partir de son stdout. """
+    data = secrets.token_bytes(3 * MB + 11)
+    cle_privee, cipher = preparer_cipher(CipherMgs4p)
+
+    process = await asyncio.create_subprocess_exec(
+        'cat', stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+
+    async def chiffrer():
+        await PipelineChiffrage(cipher).run(io.BytesIO(data), process.stdin)
+        process.stdin.close()
+        await process.stdin.wait_closed()
+
+    destination = io.BytesIO()
+
+    async def dechiffrer():
+        # Le header est disponible des la creation du cipher
+        decipher = DecipherMgs4p(cle_secrete(cle_privee, cipher), cipher.header)
+        await PipelineChiffrage(decipher).run(process.stdout, destination)
+
+    await asyncio.gather(chiffrer(), dechiffrer())
+    await process.wait()
+
+    assert destination.getvalue() == data
+    logger.info("test_subprocess OK")
+
+
+async def test_erreur():
+    data = secrets.token_bytes(2 * MB)
+    cle_privee, cipher = preparer_cipher(CipherMgs4)
+    data_chiffre = bytearray(cipher.update(data) + cipher.finalize())
+    data_chiffre[MB] ^= 0x01
+
+    decipher = DecipherMgs4(cle_secrete(cle_privee, cipher), cipher.header)
+    try:
+        await PipelineChiffrage(decipher, chunks_par_bloc=2, profondeur=1).run(io.BytesIO(data_chiffre), io.BytesIO())
+        raise AssertionError('Exception attendue')
+    except AssertionError as e:
+        raise e
+    except Exception:
+        pass
+
+    logger.info("test_erreur OK")
+
+
+async def benchmark():
+    data = secrets.token_bytes(TAILLE_BENCHMARK)
+    with tempfile.TemporaryDirectory() as repertoire:
+        path_source = path.join(repertoire, 'source')
+        path_dest = path.join(repertoire, 'dest')
+        with open(path_source, 'wb') as fichier:
+            fichier.write(data)
+        del data
+
+        # Boucle synchrone read -> update -> write (buffers de 32 KB)
+        _cle, cipher = preparer_cipher(CipherMgs4)
+        debut = time.perf_counter()
+        with open(path_source, 'rb') as fp_src, open(path_dest, 'wb') as fp_dest:
+            buffer = fp_src.read(32 * 1024)
+            while len(buffer) > 0:
+                fp_dest.write(cipher.update(buffer))
+                buffer = fp_src.read(32 * 1024)
+            fp_dest.write(cipher.finalize())
+        duree_reference = time.perf_counter() - debut
+        logger.info("Boucle synchrone mgs4 : %7.1f MB/s" % (TAILLE_BENCHMARK / MB / duree_reference))
+
+        for classe_cipher in [CipherMgs4, CipherMgs4p]:
+            _cle, cipher = preparer_cipher(classe_cipher)
+            debut = time.perf_counter()
+            with open(path_source, 'rb') as fp_src, open(path_dest, 'wb') as fp_dest:
+                await PipelineChiffrage(cipher).run(fp_src, fp_dest)
+            duree = time.perf_counter() - debut
+            logger.info("Pipeline %-11s : %7.1f MB/s" % (classe_cipher.__name__, TAILLE_BENCHMARK / MB / duree))
+
+
+async def run_tests():
+    await test_fichiers()
+    await test_subprocess()
+    await test_erreur()
+    await benchmark()
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    asyncio.run(run_tests())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import logging
+import secrets
+import time
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat, PrivateFormat, NoEncryption
+from nacl.signing import SigningKey, VerifyKey
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.certificats.CertificatsMillegrille import generer_csr_leaf
+from millegrilles_messages.certificats.CertificatsConfiguration import signer_configuration
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.CleCertificat import CleCertificat
+from millegrilles_messages.messages.Ed25519Utils import chiffrer_cle_ed25519, dechiffrer_cle_ed25519
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_CLES = 2000
+NOMBRE_MAITREDESCLES = 3
+
+
+class EnveloppeSansCache:
+    """ Conversion Ed25519 -> X25519 a chaque appel (comportement precedent). """
+
+    def __init__(self, enveloppe):
+        self.__enveloppe = enveloppe
+
+    def get_public_x25519(self) -> X25519PublicKey:
+        public_key = self.__enveloppe.certificat.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+        return X25519PublicKey.from_public_bytes(VerifyKey(public_key).to_curve25519_public_key().encode())
+
+
+class CleSansCache:
+
+    def __init__(self, clecert: CleCertificat):
+        self.__clecert = clecert
+
+    def get_private_x25519(self) -> X25519PrivateKey:
+        cle_private_bytes = self.__clecert.private_key.private_bytes(Encoding.Raw, PrivateFormat.Raw, NoEncryption())
+        cle = SigningKey(cle_private_bytes).to_curve25519_private_key()
+        return X25519PrivateKey.from_private_bytes(cle.encode())
+
+
+def preparer():
+    ca = generer_self_signed_ed25519('MilleGrille').clecertificat
+    maitredescles = list()
+    for i in range(0, NOMBRE_MAITREDESCLES):
+        csr = generer_csr_leaf(ca.enveloppe.idmg, 'maitredescles-%d' % i)
+        enveloppe = signer_configuration(ca, csr.get_pem_csr(), {'roles': ['maitredescles']})
+        maitredescles.append(CleCertificat(csr.cle_privee, enveloppe))
+
+    cles = [chiffrer_cle_ed25519(ca.enveloppe, secrets.token_bytes(32)) for _ in range(0, NOMBRE_CLES)]
+
+    return ca, maitredescles, cles
+
+
+def rechiffrer(cle_ca, enveloppes: list, cles: list):
+    for cle in cles:
+        cle_dechiffree = dechiffrer_cle_ed25519(cle_ca, cle)
+        for enveloppe in enveloppes:
+            chiffrer_cle_ed25519(enveloppe, cle_dechiffree)
+
+
+def verifier(ca, maitredescles: list, cles: list):
+    cle_dechiffree = ca.dechiffrage_asymmetrique(cles[0])
+    for clecert in maitredescles:
+        cle_rechiffree, fingerprint = clecert.enveloppe.chiffrage_asymmetrique(cle_dechiffree)
+        assert fingerprint == clecert.fingerprint
+        assert clecert.dechiffrage_asymmetrique(cle_rechiffree) == cle_dechiffree
+    assert ca.get_private_x25519() is ca.get_private_x25519()
+    assert ca.enveloppe.get_public_x25519() is ca.enveloppe.get_public_x25519()
+    logger.info("verifier OK")
+
+
+def benchmark(ca, maitredescles: list, cles: list):
+    enveloppes = [c.enveloppe for c in maitredescles]
+
+    debut = time.perf_counter()
+    rechiffrer(CleSansCache(ca), [EnveloppeSansCache(e) for e in enveloppes], cles)
+    duree_reference = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    rechiffrer(ca, enveloppes, cles)
+    duree = time.perf_counter() - debut
+
+    logger.info("Rechiffrage, conversion X25519 a chaque appel : %8.0f cles/s" % (NOMBRE_CLES / duree_reference))
+    logger.info("Rechiffrage, cles X25519 conservees           : %8.0f cles/s" % (NOMBRE_CLES / duree))
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    ca, maitredescles, cles = preparer()
+    verifier(ca, maitredescles, cles)
+    benchmark(ca, maitredescles, cles)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.certificats.CertificatsMillegrille import generer_csr_leaf
+from millegrilles_messages.certificats.CertificatsConfiguration import signer_configuration
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificatRedis, CertificatInconnu
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_MESSAGES = 500
+
+CONFIGURATION_REDIS = {
+    Constantes.ENV_REDIS_PASSWORD: 'test',
+    Constantes.ENV_CERT_PEM: '/tmp/cert.pem',
+    Constantes.ENV_KEY_PEM: '/tmp/key.pem',
+}
+
+
+class ReponseCertificat:
+
+    def __init__(self, parsed: dict):
+        self.parsed = parsed
+
+
+class ProducerCertificats:
+    """
+    Repond aux requetes CorePki/infoCertificat avec les certificats connus, apres un delai.
+    """
+
+    def __init__(self, certificats: dict, delai=0.05):
+        self.certificats = certificats
+        self.delai = delai
+        self.nombre_requetes = 0
+        self.__pret = asyncio.Event()
+        self.__pret.set()
+
+    def producer_pret(self):
+        return self.__pret
+
+    async def executer_requete(self, requete, domaine, action=None, exchange=None, timeout=None):
+        self.nombre_requetes += 1
+        await asyncio.sleep(self.delai)
+        try:
+            return ReponseCertificat({'chaine_pem': self.certificats[requete['fingerprint']]})
+        except KeyError:
+            return ReponseCertificat({'ok': False})
+
+
+class ValidateurCompteur(ValidateurCertificatRedis):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.nombre_validations = 0
+
+    async def valider(self, certificat, date_reference=None, idmg=None, usages={'digital_signature'}):
+        self.nombre_validations += 1
+        return await super().valider(certificat, date_reference, idmg, usages)
+
+
+def preparer():
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    csr = generer_csr_leaf(root.enveloppe.idmg, 'singleflight')
+    enveloppe = signer_configuration(root, csr.get_pem_csr(), {'roles': ['test']})
+
+    validateur = ValidateurCompteur(root.enveloppe, configuration=CONFIGURATION_REDIS)
+    producer = ProducerCertificats({enveloppe.fingerprint: enveloppe.chaine_pem()})
+    validateur.set_producer_messages(producer)
+
+    return validateur, producer, enveloppe
+
+
+async def test_chargement_unique():
+    validateur, producer, enveloppe = preparer()
+
+    debut = time.perf_counter()
+    resultats = await asyncio.gather(
+        *[validateur.valider_fingerprint(enveloppe.fingerprint) for _ in range(0, NOMBRE_MESSAGES)])
+    duree = time.perf_counter() - debut
+
+    assert producer.nombre_requetes == 1
+    assert validateur.nombre_validations == 1
+    assert all([r is resultats[0] for r in resultats])
+    assert resultats[0].fingerprint == enveloppe.fingerprint
+    assert validateur.get_nombre_chargements() == 0
+
+    # Les appels suivants utilisent le cache
+    await validateur.valider_fingerprint(enveloppe.fingerprint)
+    assert producer.nombre_requetes == 1
+
+    logger.info("test_chargement_unique OK, %d appels concurrents en %.3f s" % (NOMBRE_MESSAGES, duree))
+
+
+async def test_erreur_partagee():
+    validateur, producer, _enveloppe = preparer()
+
+    resultats = await asyncio.gather(
+        *[validateur.valider_fingerprint('z2i3XjxInconnu') for _ in range(0, 50)], return_exceptions=True)
+
+    assert all([isinstance(r, CertificatInconnu) for r in resultats])
+    assert producer.nombre_requetes == 2  # CorePki puis requete directe, une seule fois
+    assert validateur.get_nombre_chargements() == 0
+    logger.info("test_erreur_partagee OK")
+
+
+async def test_annulation():
+    validateur, producer, enveloppe = preparer()
+
+    premier = asyncio.create_task(validateur.valider_fingerprint(enveloppe.fingerprint))
+    second = asyncio.create_task(validateur.valider_fingerprint(enveloppe.fingerprint))
+    await asyncio.sleep(0.01)
+
+    # L'annulation du premier appelant n'interrompt pas le chargement du second
+    premier.cancel()
+    resultat = await second
+    assert resultat.fingerprint == enveloppe.fingerprint
+    assert producer.nombre_requetes == 1
+    logger.info("test_annulation OK")
+
+
+async def run_tests():
+    await test_chargement_unique()
+    await test_erreur_partagee()
+    await test_annulation()
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    asyncio.run(run_tests())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import asyncio
+import datetime
+import logging
+import tempfile
+
+from os import path
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.certificats.CertificatsMillegrille import generer_csr_leaf
+from millegrilles_messages.certificats.CertificatsConfiguration import signer_configuration
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.StockageCertificats import StockageCertificats
+from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificatCache, CertificatInconnu
+
+logger = logging.getLogger(__name__)
+
+
+def generer_certificats(root, nombre: int) -> list:
+    enveloppes = list()
+    for i in range(0, nombre):
+        csr = generer_csr_leaf(root.enveloppe.idmg, 'stockage-%d' % i)
+        enveloppes.append(signer_configuration(root, csr.get_pem_csr(), {'roles': ['test']}))
+    return enveloppes
+
+
+class StockageCompteur(StockageCertificats):
+    """ Compte les ecritures. """
+
+    def __init__(self, path_db: str):
+        super().__init__(path_db)
+        self.nombre_put = 0
+
+    def put(self, fingerprint: str, pems: list):
+        self.nombre_put += 1
+        super().put(fingerprint, pems)
+
+
+def test_stockage(repertoire: str):
+    path_db = path.join(repertoire, 'stockage', 'certificats.sqlite')
+    stockage = StockageCertificats(path_db, taille_max=10)
+
+    for i in range(0, 10):
+        stockage.put('fp%d' % i, ['pem %d' % i])
+    stockage.put('fp0', ['pem 0'])  # Deja present
+    assert len(stockage) == 10
+    assert stockage.get('fp3') == ['pem 3']
+    assert stockage.get('inconnu') is None
+
+    # Depassement de la taille max : retire les moins recemment utilises
+    stockage.put('fp10', ['pem 10'])
+    assert len(stockage) <= 10
+    assert stockage.get('fp10') == ['pem 10']
+    stockage.fermer()
+
+    # Reouverture, le contenu est conserve
+    stockage = StockageCertificats(path_db, taille_max=10)
+    assert stockage.get('fp10') == ['pem 10']
+    assert len(stockage.get_recents(5)) == 5
+    stockage.fermer()
+    logger.info("test_stockage OK")
+
+
+async def test_validateur(repertoire: str):
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    enveloppes = generer_certificats(root, 5)
+    path_db = path.join(repertoire, 'certificats.sqlite')
+
+    # Premier processus, les certificats sont recus (e.g. inline dans les messages)
+    stockage = StockageCertificats(path_db)
+    validateur = ValidateurCertificatCache(root.enveloppe, stockage=stockage)
+    for enveloppe in enveloppes:
+        await validateur.valider(enveloppe.chaine_pem())
+
+    # Certificat de courte duree (expire au prechargement) et certificat d'une autre millegrille
+    csr = generer_csr_leaf(root.enveloppe.idmg, 'stockage-expire')
+    expire = signer_configuration(root, csr.get_pem_csr(), {'roles': ['test'], 'duree': 1})
+    await validateur.valider(expire.chaine_pem())
+    date_valide = datetime.datetime.now(tz=datetime.timezone.utc)
+    autre = generer_certificats(generer_self_signed_ed25519('Autre').clecertificat, 1)[0]
+    await asyncio.to_thread(stockage.put, autre.fingerprint, autre.chaine_pem())
+    stockage.fermer()
+    await asyncio.sleep(2)
+
+    # Redemarrage, lecture a la demande (miss memoire -> stockage)
+    stockage = StockageCertificats(path_db)
+    validateur = ValidateurCertificatCache(root.enveloppe, stockage=stockage)
+    resultat = await validateur.valider_fingerprint(enveloppes[0].fingerprint)
+    assert resultat.fingerprint == enveloppes[0].fingerprint
+    try:
+        await validateur.valider_fingerprint('z2i3XjxInconnu')
+        raise AssertionError('CertificatInconnu attendu')
+    except CertificatInconnu:
+        pass
+    stockage.fermer()
+
+    # Redemarrage avec prechargement
+    stockage = StockageCertificats(path_db)
+    validateur = ValidateurCertificatCache(root.enveloppe, stockage=stockage)
+    assert await validateur.precharger() == 5
+    assert validateur.get_statistiques_cache()['taille'] == 5
+    # Le certificat expire est conserve pour les validations avec date_reference, l'autre est retire
+    assert stockage.get(autre.fingerprint) is None
+    resultat = await validateur.valider_fingerprint(expire.fingerprint, date_reference=date_valide)
+    assert resultat.fingerprint == expire.fingerprint
+    stockage.fermer()
+    for enveloppe in enveloppes:
+        resultat = await validateur.valider_fingerprint(enveloppe.fingerprint)
+        assert resultat.fingerprint == enveloppe.fingerprint
+
+    # Sans stockage, comportement inchange
+    validateur = ValidateurCertificatCache(root.enveloppe)
+    assert await validateur.precharger() == 0
+    logger.info("test_validateur OK")
+
+
+async def test_ecritures(repertoire: str):
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    enveloppes = generer_certificats(root, 3)
+    path_db = path.join(repertoire, 'ecritures.sqlite')
+
+    # Validations repetees (e.g. date_reference) : une seule ecriture par certificat
+    stockage = StockageCompteur(path_db)
+    validateur = ValidateurCertificatCache(root.enveloppe, cache_max_entries=1, stockage=stockage)
+    date_reference = datetime.datetime.now(tz=datetime.timezone.utc)
+    for _ in range(0, 5):
+        for enveloppe in enveloppes:
+            await validateur.valider(enveloppe.chaine_pem(), date_reference=date_reference)
+    assert stockage.nombre_put == 3, stockage.nombre_put
+
+    # Certificats relus du stockage apres eviction memoire, pas reecrits
+    for _ in range(0, 3):
+        for enveloppe in enveloppes:
+            await validateur.valider_fingerprint(enveloppe.fingerprint)
+    assert stockage.nombre_put == 3, stockage.nombre_put
+    stockage.fermer()
+
+    # Redemarrage : ni le prechargement ni les lectures ne reecrivent
+    stockage = StockageCompteur(path_db)
+    validateur = ValidateurCertificatCache(root.enveloppe, cache_max_entries=1, stockage=stockage)
+    assert await validateur.precharger(limite=3) == 3
+    for enveloppe in enveloppes:
+        await validateur.valider_fingerprint(enveloppe.fingerprint)
+    assert stockage.nombre_put == 0, stockage.nombre_put
+    stockage.fermer()
+    logger.info("test_ecritures OK")
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    with tempfile.TemporaryDirectory() as repertoire:
+        test_stockage(repertoire)
+        asyncio.run(test_validateur(repertoire))
+        asyncio.run(test_ecritures(repertoire))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import datetime
+import logging
+import time
+
+import OpenSSL
+import pytz
+
+from cryptography import x509
+
+from millegrilles_messages.certificats.CertificatsMillegrille import generer_csr_intermediaire, \
+    signer_csr_intermediaire, generer_csr_leaf, signer_csr_leaf
+from millegrilles_messages.certificats.Generes import CleCertificat, CleCertificatGenere
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificat
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_VALIDATIONS = 1000
+
+
+def generer_root() -> CleCertificat:
+    name = x509.Name([x509.NameAttribute(x509.name.NameOID.COMMON_NAME, 'MilleGrille')])
+    builder = x509.CertificateBuilder().subject_name(name).issuer_name(name)
+    builder = builder.add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+    maintenant = datetime.datetime.utcnow()
+    clecert_genere = CleCertificatGenere.generer_certificat(
+        builder, not_valid_before=maintenant - datetime.timedelta(days=2),
+        not_valid_after=maintenant + datetime.timedelta(days=730))
+    return clecert_genere.clecertificat
+
+
+def preparer(nombre_leafs: int):
+    root = generer_root()
+    idmg = root.enveloppe.idmg
+
+    csr_intermediaire = generer_csr_intermediaire('instance', idmg)
+    enveloppe_intermediaire = signer_csr_intermediaire(csr_intermediaire.get_pem_csr(), root)
+    intermediaire = CleCertificat(csr_intermediaire.cle_privee, enveloppe_intermediaire)
+
+    chaines = list()
+    for i in range(0, nombre_leafs):
+        csr_leaf = generer_csr_leaf(idmg, 'leaf-%d' % i)
+        enveloppe_leaf = signer_csr_leaf(csr_leaf.get_pem_csr(), intermediaire, 'test')
+        chaines.append(enveloppe_leaf.chaine_pem())
+
+    return root, enveloppe_intermediaire, chaines
+
+
+def valider_erreur(validateur, chaine, date_reference):
+    try:
+        validateur.valider(chaine, date_reference=date_reference)
+        raise AssertionError('X509StoreContextError attendue')
+    except OpenSSL.crypto.X509StoreContextError:
+        pass
+
+
+def test_validation_dates():
+    root, intermediaire, chaines = preparer(2)
+    assert len(chaines[0]) == 2  # leaf + intermediaire
+    validateur = ValidateurCertificat(root.enveloppe)
+
+    enveloppe = validateur.valider(chaines[0])
+    assert enveloppe.est_verifie is True
+
+    # Date de reference dans la periode de validite (le debut du bucket peut preceder l'emission)
+    maintenant = datetime.datetime.now(tz=pytz.utc)
+    enveloppe = validateur.valider(chaines[1], date_reference=maintenant)
+    assert enveloppe.est_verifie is False
+    validateur.valider(chaines[1], date_reference=maintenant.replace(tzinfo=None))
+
+    # Hors de la periode de validite, meme bucket que des dates valides
+    valider_erreur(validateur, chaines[0], enveloppe.not_valid_before - datetime.timedelta(seconds=10))
+    valider_erreur(validateur, chaines[0], enveloppe.not_valid_after + datetime.timedelta(seconds=1))
+    valider_erreur(validateur, chaines[0], intermediaire.not_valid_after + datetime.timedelta(days=1))
+
+    # Chaine signee par une autre millegrille, meme apres la mise en cache de l'intermediaire local
+    _autre_root, _autre_intermediaire, autres_chaines = preparer(1)
+    valider_erreur(validateur, autres_chaines[0], None)
+    valider_erreur(validateur, autres_chaines[0], maintenant)
+
+    # Leaf sans son intermediaire : accepte, l'intermediaire a deja ete verifie avec le root
+    validateur.valider(chaines[0][0:1])
+
+    logger.info("test_validation_dates OK")
+
+
+def benchmark():
+    root, _intermediaire, chaines = preparer(20)
+    validateur = ValidateurCertificat(root.enveloppe)
+    maintenant = datetime.datetime.now(tz=pytz.utc)
+
+    # Reference : store reconstruit et chaine parsee a chaque validation (comportement precedent)
+    debut = time.perf_counter()
+    for i in range(0, NOMBRE_VALIDATIONS):
+        chaine = chaines[i % len(chaines)]
+        store = OpenSSL.crypto.X509Store()
+        store.add_cert(OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, root.enveloppe.certificat_pem))
+        store.set_time(maintenant)
+        certs = [OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, c) for c in chaine]
+        OpenSSL.crypto.X509StoreContext(store, certs.pop(0), certs).verify_certificate()
+    duree_reference = time.perf_counter() - debut
+
+    enveloppes = [validateur._charger_certificat(c) for c in chaines]
+    debut = time.perf_counter()
+    for i in range(0, NOMBRE_VALIDATIONS):
+        validateur._valider(enveloppes[i % len(enveloppes)], date_reference=maintenant)
+    duree = time.perf_counter() - debut
+
+    logger.info("Store et chaine reconstruits : %8.0f validations/s" % (NOMBRE_VALIDATIONS / duree_reference))
+    logger.info("_valider avec caches         : %8.0f validations/s" % (NOMBRE_VALIDATIONS / duree))
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    test_validation_dates()
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
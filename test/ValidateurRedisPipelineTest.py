@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.certificats.CertificatsMillegrille import generer_csr_leaf
+from millegrilles_messages.certificats.CertificatsConfiguration import signer_configuration
+from millegrilles_messages.messages import Constantes
+from millegrilles_messages.messages.CleCertificat import CleCertificat
+from millegrilles_messages.messages.EnveloppeCertificat import EnveloppeCertificat
+from millegrilles_messages.messages.FormatteurMessages import SignateurTransactionSimple, FormatteurMessageMilleGrilles
+from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificatRedis, REDIS_TTL_SECS, \
+    REDIS_PREFIXE_CERTIFICAT
+from millegrilles_messages.messages.ValidateurMessage import ValidateurMessage
+
+logger = logging.getLogger(__name__)
+
+CONFIGURATION_REDIS = {
+    Constantes.ENV_REDIS_PASSWORD: 'test',
+    Constantes.ENV_CERT_PEM: '/tmp/cert.pem',
+    Constantes.ENV_KEY_PEM: '/tmp/key.pem',
+}
+
+
+class RedisFake:
+    """
+    Redis local (dict) qui compte les allers-retours et les commandes.
+    """
+
+    def __init__(self):
+        self.valeurs = dict()
+        self.ttls = dict()
+        self.allers_retours = 0
+        self.commandes = list()
+
+    async def ping(self):
+        self.allers_retours += 1
+        return True
+
+    async def getex(self, cle, ex):
+        self.allers_retours += 1
+        self.commandes.append('getex')
+        if cle in self.valeurs:
+            self.ttls[cle] = ex
+        return self.valeurs.get(cle)
+
+    async def mget(self, cles):
+        self.allers_retours += 1
+        self.commandes.append('mget')
+        return [self.valeurs.get(c) for c in cles]
+
+    def pipeline(self, transaction=True):
+        return PipelineFake(self)
+
+
+class PipelineFake:
+
+    def __init__(self, redis_fake: RedisFake):
+        self.__redis = redis_fake
+        self.__commandes = list()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.__commandes.clear()
+
+    def set(self, cle, valeur, ex=None, nx=False):
+        self.__commandes.append(('set', cle, valeur, ex, nx))
+
+    def expire(self, cle, ttl):
+        self.__commandes.append(('expire', cle, ttl))
+
+    async def execute(self):
+        self.__redis.allers_retours += 1
+        resultats = list()
+        for commande in self.__commandes:
+            self.__redis.commandes.append(commande[0])
+            if commande[0] == 'set':
+                _, cle, valeur, ex, nx = commande
+                if nx and cle in self.__redis.valeurs:
+                    resultats.append(None)
+                else:
+                    self.__redis.valeurs[cle] = valeur
+                    self.__redis.ttls[cle] = ex
+                    resultats.append(True)
+            elif commande[0] == 'expire':
+                _, cle, ttl = commande
+                if cle in self.__redis.valeurs:
+                    self.__redis.ttls[cle] = ttl
+                    resultats.append(True)
+                else:
+                    resultats.append(False)
+        self.__commandes.clear()
+        return resultats
+
+
+def preparer(nombre_certificats=1):
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    redis_fake = RedisFake()
+    validateur = ValidateurCertificatRedis(root.enveloppe, configuration=CONFIGURATION_REDIS)
+    validateur.set_redis_client(redis_fake)
+
+    clecerts = list()
+    for i in range(0, nombre_certificats):
+        csr = generer_csr_leaf(root.enveloppe.idmg, 'redis-%d' % i)
+        enveloppe = signer_configuration(root, csr.get_pem_csr(), {'roles': ['test']})
+        clecerts.append(CleCertificat(csr.cle_privee, enveloppe))
+
+    return root, validateur, redis_fake, clecerts
+
+
+def nouveau_validateur(root, redis_fake):
+    validateur = ValidateurCertificatRedis(root.enveloppe, configuration=CONFIGURATION_REDIS)
+    validateur.set_redis_client(redis_fake)
+    return validateur
+
+
+async def test_ecriture_un_aller_retour():
+    root, validateur, redis_fake, (clecert, ) = preparer()
+    enveloppe = clecert.enveloppe
+
+    await validateur.valider(enveloppe.chaine_pem())
+    assert redis_fake.allers_retours == 1
+    assert redis_fake.commandes == ['set', 'expire']
+    cle = REDIS_PREFIXE_CERTIFICAT + enveloppe.fingerprint
+    pems_redis = json.loads(redis_fake.valeurs[cle])['pems']
+    assert EnveloppeCertificat.from_pem(''.join(pems_redis)).fingerprint == enveloppe.fingerprint
+    assert redis_fake.ttls[cle] == REDIS_TTL_SECS
+
+    # Nouvelle validation (e.g. certificat inline d'un autre message) : aucun acces redis, TTL en attente
+    autre = nouveau_validateur(root, redis_fake)
+    await autre.valider(enveloppe.chaine_pem())
+    assert redis_fake.allers_retours == 2
+    redis_fake.commandes.clear()
+
+    # Rechargement via getex, la cle est connue comme presente
+    troisieme = nouveau_validateur(root, redis_fake)
+    await troisieme.valider_fingerprint(enveloppe.fingerprint, nofetch=True)
+    await troisieme.valider(enveloppe.chaine_pem())
+    assert redis_fake.commandes == ['getex'], redis_fake.commandes
+    logger.info("test_ecriture_un_aller_retour OK")
+
+
+async def test_expire_en_lot():
+    root, validateur, redis_fake, clecerts = preparer(5)
+    enveloppes = [c.enveloppe for c in clecerts]
+
+    for enveloppe in enveloppes:
+        await validateur.valider(enveloppe.chaine_pem())
+
+    # Validations repetees (cache local vide, e.g. nouveau processus qui partage le suivi de presence)
+    for enveloppe in enveloppes:
+        await validateur.valider(enveloppe.chaine_pem())
+
+    allers_retours = redis_fake.allers_retours
+    redis_fake.commandes.clear()
+
+    # Une cle disparait de redis : elle doit etre reecrite a la prochaine validation
+    cle_retiree = REDIS_PREFIXE_CERTIFICAT + enveloppes[0].fingerprint
+    del redis_fake.valeurs[cle_retiree]
+
+    await validateur.entretien()
+    assert redis_fake.allers_retours == allers_retours + 2  # ping + pipeline expire
+    assert redis_fake.commandes == ['expire'] * 5
+
+    redis_fake.commandes.clear()
+    await validateur.entretien()
+    assert redis_fake.commandes == []  # Rien a rafraichir
+
+    await validateur.valider(enveloppes[0].chaine_pem())
+    assert redis_fake.commandes == ['set', 'expire']
+    assert cle_retiree in redis_fake.valeurs
+    logger.info("test_expire_en_lot OK")
+
+
+async def test_prefetch_batch():
+    root, validateur, redis_fake, clecerts = preparer(3)
+    for clecert in clecerts:
+        await validateur.valider(clecert.enveloppe.chaine_pem())
+
+    # Nouveau processus, certificats dans redis uniquement
+    validateur = nouveau_validateur(root, redis_fake)
+    redis_fake.allers_retours = 0
+    redis_fake.commandes.clear()
+
+    # Messages signes par les 3 certificats, sans certificat inline
+    messages = list()
+    for clecert in clecerts:
+        formatteur = FormatteurMessageMilleGrilles(root.enveloppe.idmg, SignateurTransactionSimple(clecert))
+        for j in range(0, 4):
+            message, _uuid = formatteur.signer_message({'valeur': j}, 'Domaine', action='test',
+                                                       ajouter_chaine_certs=False)
+            messages.append(message)
+
+    validateur_messages = ValidateurMessage(validateur)
+    resultats = await validateur_messages.verifier_batch(messages)
+    assert all([r.est_valide for r in resultats]), [str(r) for r in resultats]
+    assert redis_fake.commandes == ['mget'], redis_fake.commandes
+    assert redis_fake.allers_retours == 1
+    logger.info("test_prefetch_batch OK")
+
+
+async def run_tests():
+    await test_ecriture_un_aller_retour()
+    await test_expire_en_lot()
+    await test_prefetch_batch()
+
+
+def main():
+    logging.basicConfig(format=Constantes.LOGGING_FORMAT, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    asyncio.run(run_tests())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+
+from millegrilles_messages.certificats.CertificatsWeb import generer_self_signed_ed25519
+from millegrilles_messages.certificats.CertificatsMillegrille import generer_csr_leaf
+from millegrilles_messages.certificats.CertificatsConfiguration import signer_configuration
+from millegrilles_messages.messages.CleCertificat import CleCertificat
+from millegrilles_messages.messages.FormatteurMessages import SignateurTransactionSimple, FormatteurMessageMilleGrilles
+from millegrilles_messages.messages.ValidateurCertificats import ValidateurCertificatCache
+from millegrilles_messages.messages.ValidateurMessage import ValidateurMessage
+
+logger = logging.getLogger(__name__)
+
+TAILLES_BATCH = [1, 16, 128, 1024]
+NOMBRE_MESSAGES = 4096
+
+
+def preparer_clecert() -> (CleCertificat, CleCertificat):
+    """ Genere un certificat de millegrille et un certificat signe directement par celui-ci. """
+    root = generer_self_signed_ed25519('MilleGrille').clecertificat
+    idmg = root.enveloppe.idmg
+    csr = generer_csr_leaf(idmg, 'benchmark')
+    enveloppe = signer_configuration(root, csr.get_pem_csr(), {'roles': ['benchmark']})
+    return root, CleCertificat(csr.cle_privee, enveloppe)
+
+
+def generer_messages(clecert: CleCertificat, nombre: int) -> list:
+    formatteur = FormatteurMessageMilleGrilles(clecert.enveloppe.idmg, SignateurTransactionSimple(clecert))
+    messages = list()
+    for i in range(0, nombre):
+        message, _uuid = formatteur.signer_message({'compteur': i, 'valeur': 'evenement'}, 'Benchmark', action='test')
+        messages.append(message)
+    return messages
+
+
+async def benchmark():
+    root, clecert = preparer_clecert()
+    validateur_messages = ValidateurMessage(ValidateurCertificatCache(root.enveloppe))
+    messages = generer_messages(clecert, NOMBRE_MESSAGES)
+
+    # Rechauffer le cache de certificats
+    await validateur_messages.verifier(messages[0])
+
+    debut = time.perf_counter()
+    for message in messages:
+        await validateur_messages.verifier(message)
+    duree = time.perf_counter() - debut
+    logger.info("verifier() un a la fois : %8.0f messages/s" % (NOMBRE_MESSAGES / duree))
+
+    for taille in TAILLES_BATCH:
+        debut = time.perf_counter()
+        for i in range(0, NOMBRE_MESSAGES, taille):
+            resultats = await validateur_messages.verifier_batch(messages[i:i+taille])
+            for resultat in resultats:
+                if resultat.est_valide is not True:
+                    raise resultat.erreur
+        duree = time.perf_counter() - debut
+        logger.info("verifier_batch(%4d)      : %8.0f messages/s" % (taille, NOMBRE_MESSAGES / duree))
+
+
+async def verifier_erreurs():
+    root, clecert = preparer_clecert()
+    validateur_messages = ValidateurMessage(ValidateurCertificatCache(root.enveloppe))
+    messages = generer_messages(clecert, 3)
+
+    # Corrompre le 2e message, les autres doivent demeurer valides
+    messages[1] = messages[1].copy()
+    messages[1]['mauvais'] = True
+
+    resultats = await validateur_messages.verifier_batch(messages)
+    etats = [r.est_valide for r in resultats]
+    if etats != [True, False, True]:
+        raise ValueError("Resultats batch incorrects : %s" % etats)
+
+
+async def main():
+    await verifier_erreurs()
+    await benchmark()
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.getLogger(__name__).setLevel(logging.INFO)
+    asyncio.run(main())